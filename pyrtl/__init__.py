@@ -41,6 +41,7 @@ from .helperfuncs import probe
 from .helperfuncs import rtl_assert
 from .helperfuncs import check_rtl_assertions
 from .helperfuncs import find_loop
+from .helperfuncs import find_loops
 from .helperfuncs import find_and_print_loop
 
 from pyrtl.corecircuits import (and_all_bits, or_all_bits, xor_all_bits, rtl_any,
@@ -60,6 +61,10 @@ from .simulation import Simulation
 from .simulation import FastSimulation
 from .simulation import SimulationTrace
 from .compilesim import CompiledSimulation
+from .bitslicesim import BitSliceSimulation
+from .batchsim import BatchSimulation
+from .simpool import SimulationPool
+from .simpool import SimulationResult
 
 # input and output to file format routines
 from .inputoutput import input_from_blif
@@ -81,3 +86,12 @@ from .passes import optimize
 
 
 from .transform import net_transform, wire_transform, replace_wire, copy_block, clone_wire
+
+# hierarchical designs
+from .hierarchy import Module
+from .hierarchy import flatten
+
+# compact snapshots of blocks
+from .frozenblock import FrozenBlock
+from .frozenblock import save_block
+from .frozenblock import load_block
@@ -0,0 +1,171 @@
+"""
+Profiling of elaboration, to find the code responsible for the size of a design.
+
+The ElaborationProfiler attributes the nets, wires, bits and time spent building
+a design to the code that built them: both to the user-level call site and to
+the generator in rtllib (if any) doing the work.  Its results can be printed as
+a sortable report, or written in the "collapsed stack" format read by flame
+graph tools (such as flamegraph.pl and speedscope).
+"""
+
+from __future__ import print_function, unicode_literals
+
+import sys
+import timeit
+
+from .. import core
+from ..pyrtlexceptions import PyrtlError
+
+
+_COUNTS = ('nets', 'bits', 'wires', 'time')
+
+
+class ElaborationProfiler(object):
+    """ Attributes the nets and wires of a design, and the time to build them, to the code.
+
+    Use it as a context around the code building the hardware::
+
+        from pyrtl.analysis import ElaborationProfiler
+        with ElaborationProfiler() as prof:
+            product <<= rtllib.multipliers.tree_multiplier(a, b)
+        prof.print_report()
+        prof.print_report(by='generator', sort_by='time')
+
+    Each net or wire added to a block (by the thread that entered the context)
+    is recorded against its call stack, keeping only the frames outside of the
+    pyrtl package and those in pyrtl.rtllib.  The "bits" of a net are the total
+    bitwidth of its dests, and the time since the previous net or wire was
+    added is charged to the next one (as that is mostly the time spent building
+    it).  Stacks are taken by walking the frames directly, so profiling adds
+    little to the cost of elaboration.  Like the working block, the active
+    profiler is kept for each thread, so only one profiler can be active at a
+    time in each thread.
+    """
+
+    def __init__(self):
+        self.stacks = {}  # map from call stack (outermost frame first)->[nets, bits, wires, time]
+        self._base_frame = None
+        self._last_time = None
+
+    def __enter__(self):
+        state = core._working_block_state
+        if state.elaboration_profiler is not None:
+            raise PyrtlError('error, an elaboration profiler is already active')
+        self._base_frame = sys._getframe(1)
+        self._last_time = timeit.default_timer()
+        state.elaboration_profiler = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        core._working_block_state.elaboration_profiler = None
+        self._base_frame = None
+
+    def _record(self, net=None, wire=None):
+        """ Called by the block as each net or wire is added (in the thread of the profiler). """
+        now = timeit.default_timer()
+        stack = self._current_stack()
+        counts = self.stacks.get(stack)
+        if counts is None:
+            counts = self.stacks[stack] = [0, 0, 0, 0.0]
+        if net is not None:
+            counts[0] += 1
+            counts[1] += sum(dest.bitwidth or 0 for dest in net.dests)
+        else:
+            counts[2] += 1
+        counts[3] += now - self._last_time
+        self._last_time = timeit.default_timer()  # leave out the time spent profiling
+
+    def _current_stack(self):
+        frames = []
+        frame = sys._getframe(3)  # the caller of Block.add_net or Block.add_wirevector
+        while frame is not None:
+            module = frame.f_globals.get('__name__', '')
+            if _is_reported(module):
+                frames.append((module, frame.f_code.co_name, frame.f_lineno))
+            if frame is self._base_frame:
+                break
+            frame = frame.f_back
+        frames.reverse()
+        return tuple(frames)
+
+    def report(self, by='callsite', sort_by='nets'):
+        """ Return the totals for each call site, generator, or call stack.
+
+        :param by: what to total by: 'callsite' (the innermost frame outside of
+          pyrtl), 'generator' (the innermost rtllib function), or 'stack'
+        :param sort_by: the total to sort by, largest first: 'nets', 'bits',
+          'wires', or 'time' (in seconds)
+        :return: a list of tuples (name, nets, bits, wires, time)
+        """
+        if by not in ('callsite', 'generator', 'stack'):
+            raise PyrtlError('error, cannot report by "%s"' % by)
+        if sort_by not in _COUNTS:
+            raise PyrtlError('error, cannot sort by "%s" (expected one of %s)'
+                             % (sort_by, ', '.join(_COUNTS)))
+
+        totals = {}
+        for stack, counts in self.stacks.items():
+            if by == 'stack':
+                name = ';'.join(_frame_name(f) for f in stack)
+            elif by == 'callsite':
+                user_frames = [f for f in stack if not _is_rtllib(f[0])]
+                name = _frame_name(user_frames[-1]) if user_frames else '(unknown)'
+            else:
+                generators = [f for f in stack if _is_rtllib(f[0])]
+                name = '%s.%s' % generators[-1][:2] if generators else '(none)'
+            total = totals.setdefault(name, [0, 0, 0, 0.0])
+            for i, count in enumerate(counts):
+                total[i] += count
+
+        index = _COUNTS.index(sort_by)
+        rows = sorted(totals.items(), key=lambda item: (-item[1][index], item[0]))
+        return [(name,) + tuple(total) for name, total in rows]
+
+    def print_report(self, file=None, by='callsite', sort_by='nets', limit=None):
+        """ Print the totals (as given by report) as a table.
+
+        :param file: where to print the table (defaults to stdout)
+        :param by: what to total by, as for report
+        :param sort_by: the total to sort by, as for report
+        :param limit: the number of rows to print (defaults to all of them)
+        """
+        if file is None:
+            file = sys.stdout
+        rows = self.report(by, sort_by)
+        if limit is not None:
+            rows = rows[:limit]
+        print('%10s %10s %10s %10s  %s' % ('nets', 'bits', 'wires', 'time(ms)', by), file=file)
+        for name, nets, bits, wires, time in rows:
+            print('%10d %10d %10d %10.2f  %s' % (nets, bits, wires, time * 1000, name), file=file)
+
+    def output_collapsed_stacks(self, file, weight='nets'):
+        """ Write the call stacks in the collapsed format read by flame graph tools.
+
+        :param file: an open file to write the stacks to
+        :param weight: the count to write for each stack: 'nets', 'bits',
+          'wires', or 'time' (in microseconds)
+
+        Each line is a call stack, with its frames (as "module:function:line",
+        outermost first) separated by semicolons, followed by a space and the count.
+        """
+        if weight not in _COUNTS:
+            raise PyrtlError('error, cannot weight stacks by "%s" (expected one of %s)'
+                             % (weight, ', '.join(_COUNTS)))
+        index = _COUNTS.index(weight)
+        for stack, counts in sorted(self.stacks.items()):
+            count = int(counts[index] * 1e6) if weight == 'time' else counts[index]
+            if stack and count:
+                print('%s %d' % (';'.join(_frame_name(f) for f in stack), count), file=file)
+
+
+def _is_rtllib(module):
+    return module.startswith('pyrtl.rtllib.')
+
+
+def _is_reported(module):
+    """ True for the modules whose frames are kept in the call stacks. """
+    return not (module == 'pyrtl' or module.startswith('pyrtl.')) or _is_rtllib(module)
+
+
+def _frame_name(frame):
+    return '%s:%s:%d' % frame
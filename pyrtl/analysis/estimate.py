@@ -80,8 +80,8 @@ def area_estimation(tech_in_nm=130, block=None):
             return adder_stdcell_estimate(len(net.args[0]))
         elif net.op == '*':
             return multiplier_stdcell_estimate(len(net.args[0]))
-        elif net.op in 'm@':
-            return 0  # memories handled elsewhere
+        elif net.op in 'm@h':
+            return 0  # memories and instances handled elsewhere
         else:
             raise PyrtlInternalError('Unable to estimate the following net '
                                      'due to unimplemented op :\n%s' % str(net))
@@ -113,6 +113,12 @@ def area_estimation(tech_in_nm=130, block=None):
         bits, ports, is_rom = _bits_ports_and_isrom_from_memory(mem)
         mem_area += mem_area_estimate(tech_in_nm, bits, ports, is_rom)
 
+    # and then add the area of each instance of a module
+    for net in block.logic_subset('h'):
+        inst_logic_area, inst_mem_area = area_estimation(tech_in_nm, net.op_param[1].block)
+        logic_area += inst_logic_area
+        mem_area += inst_mem_area
+
     return logic_area, mem_area
 
 
@@ -159,7 +165,10 @@ class TimingAnalysis(object):
 
         Calculates the timing analysis while allowing for
         different timing delays of different gates of each type.
-        Supports all valid presynthesis blocks.
+        Supports all valid presynthesis blocks.  An instance of a Module is
+        treated as a black box whose outputs depend on all of its inputs, so
+        paths that start and end inside of the instance are not included
+        (flatten the block first to time those too).
         Currently doesn't support memory post synthesis.
         """
 
@@ -198,8 +207,20 @@ class TimingAnalysis(object):
             }
         cleared = self.block.wirevector_subset((Input, Const, Register))
         self.timing_map = {wirevector: 0 for wirevector in cleared}
+        module_timing = {}  # map from Module->TimingAnalysis of its block
         for _gate in self.block:  # ordered iteration
-            if _gate.op == 'm':
+            if _gate.op == 'h':
+                # an instance is a black box: each output settles after the latest
+                # arg, plus the delay to that output in the block of its module
+                module = _gate.op_param[1]
+                if module not in module_timing:
+                    module_timing[module] = TimingAnalysis(module.block, gate_delay_funcs)
+                module_map = module_timing[module].timing_map
+                time = max([self.timing_map[a_wire] for a_wire in _gate.args] or [0])
+                for dest_wire, port in zip(_gate.dests, module.outputs):
+                    self.timing_map[dest_wire] = time + module_map[port]
+                continue
+            elif _gate.op == 'm':
                 gate_delay = gate_delay_funcs['m'](_gate.op_param[1])  # reads require a memid
             else:
                 gate_delay = gate_delay_funcs[_gate.op](len(_gate.args[0]))
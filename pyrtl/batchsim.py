@@ -0,0 +1,396 @@
+"""
+BatchSimulation simulates many independent instances of a block at once, using NumPy.
+
+Each wire holds its value in every instance as one NumPy array (of uint64 for
+wires of 64 bits or fewer, and of python ints, as an object array, for wider
+wires), so that each net is evaluated for all of the instances with a single
+vectorized operation per cycle.  This is meant for running the same design on
+thousands of independent input streams (such as for sweeping the inputs of a
+multiplier), where the cost of each cycle is spread over all of the instances.
+
+NumPy is not otherwise required by PyRTL, and is only needed by BatchSimulation.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import numbers
+
+from .core import working_block, PostSynthBlock
+from .wire import Input, Output, Const, Register
+from .memory import RomBlock
+from .pyrtlexceptions import PyrtlError
+from .simulation import SimulationTrace, _InputPlan, _check_column, _resolve_wire
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+__all__ = ['BatchSimulation']
+
+
+# the widest wire held as a uint64 array (wider wires are held as arrays of python ints)
+_MAX_NATIVE_BITWIDTH = 64
+
+# the most values (for all of the instances) a memory is held as a dense array for; larger
+# memories are held sparsely, as a map from each address written to its values
+_DENSE_MEMORY_LIMIT = 1 << 24
+
+
+class BatchSimulation(object):
+    """ Simulates many independent instances of a block at once, with NumPy arrays.
+
+    Each of the instances is a separate simulation of the block, with its own
+    inputs, registers, and memories.  The value given for each Input to step is
+    either an int (used in every instance) or an array with a value for each
+    instance, and inspect returns an array of the value of a wire in each instance::
+
+        sim = pyrtl.BatchSimulation(instances=10000)
+        sim.step({'a': numpy.random.randint(256, size=10000), 'b': 3})
+        sim.inspect('sum')  # an array of 10000 values
+
+    To run many cycles at once, run takes a 2-D array (cycles by instances) for
+    each Input, and returns a 2-D array for each of the outputs::
+
+        outputs = sim.run({'a': a_values, 'b': b_values}, outputs=['sum'])
+        outputs['sum'][cycle, instance]
+
+    Every primitive op is supported, but not instances of Modules (flatten the
+    block first).  Memories are kept separately for each instance.  The tracer
+    records the values of the first instance, so a testbench that gives every
+    instance the same inputs gets the same trace as from Simulation.  A failing
+    rtl_assert (in any instance) raises its exception at the end of the step.
+    """
+
+    def __init__(
+            self, tracer=True, register_value_map=None, memory_value_map=None,
+            default_value=0, block=None, instances=64):
+        """ Creates a new batch simulator.
+
+        :param instances: the number of independent instances to simulate at once
+
+        Look at Simulation.__init__ for descriptions for the other parameters.
+        The initial value of each register can be an int (the same in every
+        instance) or an array with its value in each instance.  The initial values
+        of the memories are the same in every instance.
+        """
+        if numpy is None:
+            raise PyrtlError('BatchSimulation requires numpy')
+        block = working_block(block)
+        block.sanity_check()  # check that this is a good hw block
+        if instances < 1:
+            raise PyrtlError('error, a batch simulation needs at least one instance')
+        if block.logic_subset('h'):
+            raise PyrtlError('error, BatchSimulation cannot simulate instances of '
+                             'Modules (flatten the block first)')
+
+        self.block = block
+        self.instances = instances
+        self.default_value = default_value
+        if tracer is True:
+            tracer = SimulationTrace(block=block)
+        self.tracer = tracer
+        self._instance_index = numpy.arange(instances)
+        self._compile()
+
+        register_value_map = register_value_map or {}
+        self.regs = [self._column(reg, register_value_map.get(reg, default_value))
+                     for reg in self._registers]
+
+        self.mems = {}  # map from memid->2-D array (instance, address) or {address: array}
+        memory_value_map = memory_value_map or {}
+        if isinstance(block, PostSynthBlock):
+            memory_value_map = {block.mem_map.get(mem, mem): mem_map
+                                for mem, mem_map in memory_value_map.items()}
+        for memid, mem in self._memories.items():
+            initial = memory_value_map.get(mem, {})
+            for addr, value in initial.items():
+                if addr < 0 or addr >= 2**mem.addrwidth:
+                    raise PyrtlError('error, address %s in %s outside of bounds'
+                                     % (str(addr), mem.name))
+                if value < 0 or value >= 2**mem.bitwidth:
+                    raise PyrtlError('error, %s at %s in %s outside of bounds'
+                                     % (str(value), str(addr), mem.name))
+            self.mems[memid] = self._new_memory(memid, initial)
+        self.values = None  # the value of each wire (in the order of self._wires) after a step
+
+    def _dtype(self, bitwidth):
+        return numpy.uint64 if bitwidth <= _MAX_NATIVE_BITWIDTH else object
+
+    def _compile(self):
+        """ Generate and compile the python function simulating a step for all instances. """
+        names = {}  # map from wire->the python expression for its value
+        context = {'U': numpy.uint64, 'where': numpy.where}
+        constants = {}  # map from int->the name of its uint64 constant
+        prog = ['def sim_func(ins, regs, read):']
+        self._inputs = sorted(self.block.wirevector_subset(Input), key=lambda w: w.name)
+        self._registers = sorted(self.block.wirevector_subset(Register), key=lambda w: w.name)
+        self._memories = {}  # map from memid->MemBlock (other than RomBlocks)
+        self._roms = {}  # map from memid->RomBlock
+
+        def wide(wire):
+            return len(wire) > _MAX_NATIVE_BITWIDTH
+
+        def literal(value, as_object):
+            if as_object:
+                return str(value)
+            if value not in constants:
+                constants[value] = 'k%d' % len(constants)
+                context[constants[value]] = numpy.uint64(value)
+            return constants[value]
+
+        def arg(wire, as_object):
+            if as_object and not wide(wire):
+                return '%s.astype(object)' % names[wire]
+            return names[wire]
+
+        for wires, source in ((self._inputs, 'ins'), (self._registers, 'regs')):
+            for i, wire in enumerate(wires):
+                names[wire] = 'v%d' % len(prog)
+                prog.append('    %s = %s[%d]' % (names[wire], source, i))
+        for const in self.block.wirevector_subset(Const):
+            names[const] = 'c%d' % len(names)
+            context[names[const]] = numpy.full(
+                self.instances, const.val, dtype=self._dtype(len(const)))
+
+        reg_next, mem_writes = {}, []
+        for net in self.block:  # in topological order
+            op = net.op
+            if op == 'r':
+                reg_next[net.dests[0]] = net.args[0]
+                continue
+            elif op == '@':
+                self._memories[net.op_param[0]] = net.op_param[1]
+                mem_writes.append((net.op_param[0],) + tuple(net.args))
+                continue
+
+            dest = net.dests[0]
+            # the net is evaluated with object arrays if any of its wires is too wide for uint64
+            as_object = wide(dest) or any(wide(w) for w in net.args)
+            args = [arg(w, as_object) for w in net.args]
+            mask = literal(dest.bitmask, as_object)
+            if op == 'w':
+                expr = args[0]
+            elif op in '&|^':
+                expr = '%s %s %s' % (args[0], op, args[1])
+            elif op == '~':
+                expr = '~%s & %s' % (args[0], mask)
+            elif op == 'n':
+                expr = '~(%s & %s) & %s' % (args[0], args[1], mask)
+            elif op in '+-*':
+                expr = '(%s %s %s) & %s' % (args[0], op, args[1], mask)
+            elif op in '=<>':
+                expr = '(%s %s %s)' % (args[0], '==' if op == '=' else op, args[1])
+            elif op == 'x':
+                expr = 'where(%s, %s, %s)' % (names[net.args[0]], args[2], args[1])
+            elif op == 'c':
+                parts, shift = [], 0
+                for a, w in reversed(list(zip(args, net.args))):
+                    parts.append('(%s << %s)' % (a, literal(shift, as_object)) if shift else a)
+                    shift += len(w)
+                expr = ' | '.join(reversed(parts))
+            elif op == 's':
+                low = net.op_param[0]
+                if net.op_param == tuple(range(low, low + len(net.op_param))):
+                    expr = '(%s >> %s) & %s' % (args[0], literal(low, as_object), mask)
+                else:
+                    one = literal(1, as_object)
+                    expr = ' | '.join(
+                        '(((%s >> %s) & %s) << %s)' % (
+                            args[0], literal(bit, as_object), one, literal(i, as_object))
+                        for i, bit in enumerate(net.op_param))
+            elif op == 'm':
+                memid, mem = net.op_param
+                if isinstance(mem, RomBlock):
+                    self._roms[memid] = mem
+                else:
+                    self._memories[memid] = mem
+                expr = 'read(%d, %s)' % (memid, names[net.args[0]])
+            else:
+                raise PyrtlError('error, BatchSimulation cannot simulate "%s" nets' % op)
+
+            if op in '=<>' or (as_object and not wide(dest) and op not in 'mx'):
+                expr = '(%s).astype(U)' % expr
+            names[dest] = 'v%d' % len(prog)
+            prog.append('    %s = %s' % (names[dest], expr))
+
+        # every wire can be inspected after a step
+        self._wires = sorted(names, key=lambda w: w.name)
+        self._index = {wire: i for i, wire in enumerate(self._wires)}
+        next_regs = [names[reg_next.get(reg, reg)] for reg in self._registers]
+        writes = ''.join('(%d, %s, %s, %s), ' % (memid, names[addr], names[data], names[enable])
+                         for memid, addr, data, enable in mem_writes)
+        prog.append('    return [%s], [%s], [%s]' % (
+            ', '.join(next_regs), ', '.join(names[w] for w in self._wires), writes))
+        self._source = '\n'.join(prog)
+
+        exec(compile(self._source, '<string>', 'exec'), context)
+        self._sim_func = context['sim_func']
+
+    def _new_memory(self, memid, initial):
+        """ The values of a memory in every instance, starting from the map initial. """
+        mem = self._memories[memid]
+        default = self._memory_default(memid)
+        dtype = self._dtype(mem.bitwidth)
+        if self.instances << mem.addrwidth <= _DENSE_MEMORY_LIMIT:
+            values = numpy.full((self.instances, 2**mem.addrwidth), default, dtype=dtype)
+            for addr, value in initial.items():
+                values[:, addr] = value
+            return values
+        return {addr: numpy.full(self.instances, value, dtype=dtype)
+                for addr, value in initial.items()}
+
+    def step(self, provided_inputs):
+        """ Take the simulation (of every instance) forward one cycle.
+
+        :param provided_inputs: a dictionary mapping every Input (or its name) to
+          either its value for this step in every instance, or an array of its
+          values for this step in each of the instances
+        """
+        plan = _InputPlan(self.block, list(provided_inputs))
+        self._step({wire: self._column(wire, value)
+                    for wire, value in zip(plan.wires, provided_inputs.values())})
+
+    def _step(self, inputs):
+        """ Take a step, given a map from every Input to its (already checked) values. """
+        ins = [inputs[wire] for wire in self._inputs]
+        self.regs, self.values, mem_writes = self._sim_func(ins, self.regs, self._read)
+
+        for memid, addr, data, enable in mem_writes:
+            enabled = enable != 0
+            if not enabled.any():
+                continue
+            values = self.mems[memid]
+            if isinstance(values, dict):
+                for a in numpy.unique(addr[enabled]):
+                    selected = enabled & (addr == a)
+                    if int(a) not in values:
+                        values[int(a)] = numpy.full(
+                            self.instances, self._memory_default(memid), dtype=data.dtype)
+                    values[int(a)][selected] = data[selected]
+            else:
+                values[self._instance_index[enabled], addr[enabled]] = data[enabled]
+
+        if self.tracer is not None:
+            self.tracer.add_step_named({
+                name: int(self.values[self._index[self.tracer._wires[name]]][0])
+                for name in self.tracer.trace})
+
+        for wire, exp in self.block.rtl_assert_dict.items():
+            if not self.values[self._index[wire]].all():
+                raise exp
+
+    def run(self, inputs, outputs=None):
+        """ Run the simulation for a number of cycles, with a 2-D array of values per input.
+
+        :param inputs: a dictionary mapping every Input (or its name) to a 2-D array
+          of its values, indexed by cycle and then by instance (all of the arrays
+          must have the same number of cycles)
+        :param outputs: a list of the wires (or their names) to collect the values of
+          (defaults to all of the Outputs of the block)
+        :return: a dictionary mapping the name of each of the outputs to a 2-D array of
+          its values, indexed by cycle and then by instance
+        """
+        plan = _InputPlan(self.block, list(inputs))
+        columns = [self._column(wire, values, ndim=2)
+                   for wire, values in zip(plan.wires, inputs.values())]
+        if len(set(len(column) for column in columns)) > 1:
+            raise PyrtlError('error, the inputs are given different numbers of cycles')
+        if outputs is None:
+            out_wires = sorted(self.block.wirevector_subset(Output), key=lambda w: w.name)
+        else:
+            out_wires = [self._wire(w) for w in outputs]
+        results = [[] for _ in out_wires]
+        for cycle in range(len(columns[0]) if columns else 0):
+            self._step({wire: column[cycle] for wire, column in zip(plan.wires, columns)})
+            for result, wire in zip(results, out_wires):
+                result.append(self.values[self._index[wire]])
+        return {wire.name: numpy.stack(result) if result else
+                numpy.empty((0, self.instances), dtype=self._dtype(len(wire)))
+                for wire, result in zip(out_wires, results)}
+
+    def inspect(self, w):
+        """ Get the values of a wire in each instance in the last simulation cycle.
+
+        :param w: the wire (or its name) to inspect
+        :return: an array of the value of the wire in each instance
+        """
+        if self.values is None:
+            raise PyrtlError('No context available. Please run a simulation step in '
+                             'order to populate values for wires')
+        return self.values[self._index[self._wire(w)]]
+
+    def inspect_mem(self, mem):
+        """ Get the contents of a memory in each instance, as a list of {address: value} maps.
+
+        The maps are copies of the contents of the memory, and addresses holding
+        the default value might not be included.
+        """
+        if isinstance(self.block, PostSynthBlock) and mem in self.block.mem_map:
+            mem = self.block.mem_map[mem]
+        values = self.mems[mem.id]
+        default = self._memory_default(mem.id)
+        if isinstance(values, dict):
+            rows = {addr: row.tolist() for addr, row in values.items()}
+            return [{addr: row[i] for addr, row in rows.items() if row[i] != default}
+                    for i in range(self.instances)]
+        contents = []
+        for row in values:
+            addrs = numpy.nonzero(row != default)[0]
+            contents.append(dict(zip(addrs.tolist(), row[addrs].tolist())))
+        return contents
+
+    def _wire(self, w):
+        """ Find the wire of the block for a wire or name. """
+        wire = _resolve_wire(self.block, w)
+        if wire not in self._index:
+            raise PyrtlError('error, "%s" is not a wire of the simulated block' % str(w))
+        return wire
+
+    def _column(self, wire, values, ndim=1):
+        """ Check the values given for wire, and convert them to an array of its dtype.
+
+        The values are either an int (for every instance) or an array whose last
+        dimension is the instances (with ndim dimensions in all).
+        """
+        dtype = self._dtype(len(wire))
+        if isinstance(values, numbers.Integral) and ndim == 1:
+            _check_column(wire, [values])
+            return numpy.full(self.instances, values, dtype=dtype)
+        array = numpy.asarray(values)
+        if array.ndim != ndim or array.shape[-1] != self.instances:
+            raise PyrtlError('error, the values given for "%s" have shape %s but should have '
+                             '%d dimension(s), the last for the %d instances'
+                             % (wire.name, array.shape, ndim, self.instances))
+        if array.dtype.kind in 'ui':
+            if array.size:
+                _check_column(wire, [int(array.min()), int(array.max())])
+            return array.astype(dtype)
+        values = array.ravel().tolist()
+        _check_column(wire, values)
+        return numpy.array(values, dtype=dtype).reshape(array.shape)
+
+    def _memory_default(self, memid):
+        return self.default_value & ((1 << self._memories[memid].bitwidth) - 1)
+
+    def _read(self, memid, addr):
+        """ Read a memory in each instance, given the array of addresses. """
+        if memid in self._roms:
+            rom = self._roms[memid]
+            addrs, inverse = numpy.unique(addr, return_inverse=True)
+            mask = (1 << rom.bitwidth) - 1
+            data = numpy.array([rom._get_read_data(int(a)) & mask for a in addrs],
+                               dtype=self._dtype(rom.bitwidth))
+            return data[inverse.reshape(-1)]
+        values = self.mems[memid]
+        if isinstance(values, dict):
+            mem = self._memories[memid]
+            data = numpy.full(self.instances, self._memory_default(memid),
+                              dtype=self._dtype(mem.bitwidth))
+            for a in numpy.unique(addr):
+                if int(a) in values:
+                    selected = addr == a
+                    data[selected] = values[int(a)][selected]
+            return data
+        return values[self._instance_index, addr]
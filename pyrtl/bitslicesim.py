@@ -0,0 +1,309 @@
+"""
+BitSliceSimulation simulates many independent test vectors at once, one per bit of a Python int.
+
+After synthesis (with synthesize, nand_synth, or and_inverter_synth) a block is
+made almost entirely of 1-bit gates and registers.  Rather than simulating one
+test vector per step, BitSliceSimulation keeps each bit of each wire as an int
+with one bit per "lane" (an independent test vector), so that every gate
+evaluated (a single Python &, |, or ^ on those ints) advances all of the lanes
+at once.  Wiring nets (w, c, and s) cost nothing at all: they are resolved when
+the simulation is compiled.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import numbers
+
+import six
+
+from .core import working_block, PostSynthBlock
+from .wire import Input, Output, Const, Register, WireVector
+from .memory import RomBlock
+from .pyrtlexceptions import PyrtlError
+from .simulation import SimulationTrace, _check_column
+
+
+__all__ = ['BitSliceSimulation']
+
+
+class BitSliceSimulation(object):
+    """ Simulates a block made of bitwise gates for many independent test vectors at once.
+
+    Each of the lanes (64 by default) is a separate simulation of the block, with
+    its own inputs, registers, and memories.  The value given for each Input to
+    step is either an int (used in every lane) or a sequence with a value for each
+    lane, and inspect returns a list of the value of a wire in each lane::
+
+        pyrtl.synthesize()
+        sim = pyrtl.BitSliceSimulation(lanes=256)
+        sim.step({'a': [random.randrange(256) for _ in range(256)], 'b': 3})
+        sim.inspect('sum')  # a list of 256 values
+
+    The block can contain only the ops &, |, ^, n, ~, x, w, c, s, r, m, and @ (which
+    is everything left after synthesis).  The bitwise ops are evaluated for all of
+    the lanes at once; memories are kept separately for each lane, and are much
+    slower to read and write.  Inputs and Outputs can also be given as the
+    corresponding wires of the block before synthesis (through its io_map).
+
+    The tracer records the values of the first lane, so a testbench that gives
+    every lane the same inputs gets the same trace as from Simulation.  A failing
+    rtl_assert (in any lane) raises its exception at the end of the step.
+    """
+
+    def __init__(
+            self, tracer=True, register_value_map=None, memory_value_map=None,
+            default_value=0, block=None, lanes=64):
+        """ Creates a new bit sliced simulator.
+
+        :param lanes: the number of independent test vectors to simulate at once
+
+        Look at Simulation.__init__ for descriptions for the other parameters.
+        The initial values of the registers and memories are the same in every lane.
+        """
+        block = working_block(block)
+        block.sanity_check()  # check that this is a good hw block
+        if lanes < 1:
+            raise PyrtlError('error, a bit sliced simulation needs at least one lane')
+
+        self.block = block
+        self.lanes = lanes
+        self.default_value = default_value
+        if tracer is True:
+            tracer = SimulationTrace(block=block)
+        self.tracer = tracer
+        self._all_lanes = (1 << lanes) - 1
+        self._compile()
+
+        # each register bit (in the order of self._registers) starts out the same in every lane
+        register_value_map = register_value_map or {}
+        self.regs = []
+        for reg in self._registers:
+            value = register_value_map.get(reg, default_value)
+            self.regs.extend(self._all_lanes * ((value >> i) & 1) for i in range(len(reg)))
+
+        self.mems = {}  # map from memid->[{address: value} for each lane]
+        memory_value_map = memory_value_map or {}
+        if isinstance(block, PostSynthBlock):
+            memory_value_map = {block.mem_map.get(mem, mem): mem_map
+                                for mem, mem_map in memory_value_map.items()}
+        for memid, mem in self._memories.items():
+            initial = memory_value_map.get(mem, {})
+            self.mems[memid] = [dict(initial) for _ in range(lanes)]
+        self.values = None  # map from visible wire->its bits after a step
+
+    def _compile(self):
+        """ Generate and compile the python function simulating a step for all lanes. """
+        bits = {}  # the bits of each wire, least significant first, as python expressions
+        prog = ['def sim_func(ins, regs, read):', '    m = %d' % self._all_lanes]
+        self._inputs = sorted(self.block.wirevector_subset(Input), key=lambda w: w.name)
+        self._registers = sorted(self.block.wirevector_subset(Register), key=lambda w: w.name)
+        self._memories = {}  # map from memid->MemBlock (other than RomBlocks)
+        self._roms = {}  # map from memid->RomBlock
+
+        def new_bit(expr):
+            name = 'v%d' % len(prog)
+            prog.append('    %s = %s' % (name, expr))
+            return name
+
+        for wires, source in ((self._inputs, 'ins'), (self._registers, 'regs')):
+            position = 0
+            for wire in wires:
+                bits[wire] = [new_bit('%s[%d]' % (source, position + i)) for i in range(len(wire))]
+                position += len(wire)
+        for const in self.block.wirevector_subset(Const):
+            bits[const] = ['m' if (const.val >> i) & 1 else '0' for i in range(len(const))]
+
+        reg_next, mem_writes = {}, []
+        for net in self.block:  # in topological order
+            op = net.op
+            if op == 'r':
+                reg_next[net.dests[0]] = net.args[0]
+                continue
+            elif op == '@':
+                self._memories[net.op_param[0]] = net.op_param[1]
+                mem_writes.append((net.op_param[0],) + tuple(net.args))
+                continue
+            if any(arg not in bits for arg in net.args):
+                raise PyrtlError('error, BitSliceSimulation cannot simulate the net "%s" '
+                                 'as it is in a combinational loop' % str(net))
+            args = [bits[arg] for arg in net.args]
+            dest = net.dests[0]
+            if op == 'w':
+                bits[dest] = args[0]
+            elif op == 's':
+                bits[dest] = [args[0][i] for i in net.op_param]
+            elif op == 'c':
+                bits[dest] = [bit for arg in reversed(args) for bit in arg]
+            elif op in '&|^':
+                bits[dest] = [new_bit('%s %s %s' % (a, op, b)) for a, b in zip(*args)]
+            elif op == 'n':
+                bits[dest] = [new_bit('m ^ (%s & %s)' % (a, b)) for a, b in zip(*args)]
+            elif op == '~':
+                bits[dest] = [new_bit('m ^ %s' % a) for a in args[0]]
+            elif op == 'x':
+                sel = args[0][0]
+                bits[dest] = [new_bit('%s ^ ((%s ^ %s) & %s)' % (f, f, t, sel))
+                              for f, t in zip(args[1], args[2])]
+            elif op == 'm':
+                mem = net.op_param[1]
+                if isinstance(mem, RomBlock):
+                    self._roms[net.op_param[0]] = mem
+                else:
+                    self._memories[net.op_param[0]] = mem
+                names = ['v%d_%d' % (len(prog), i) for i in range(len(dest))]
+                prog.append('    %s, = read(%d, (%s,), %d)' % (
+                    ', '.join(names), net.op_param[0], ', '.join(args[0]), len(dest)))
+                bits[dest] = names
+            else:
+                raise PyrtlError('error, BitSliceSimulation cannot simulate "%s" nets '
+                                 '(synthesize the block first)' % op)
+
+        # the register bits for the next step, in the same order as they were read
+        next_bits = [bit for reg in self._registers for bit in bits[reg_next.get(reg, reg)]]
+
+        # the wires whose values can be inspected, and the assertions
+        visible = set(self._inputs) | set(self._registers)
+        visible.update(self.block.wirevector_subset(Output))
+        if self.tracer is not None:
+            for name in self.tracer.trace:
+                visible.add(self.block.get_wirevector_by_name(name, strict=True))
+        visible.update(self.block.rtl_assert_dict)
+        self._visible_index = {}  # map from visible wire->(start, bitwidth) in the visible bits
+        visible_bits = []
+        for wire in sorted(visible, key=lambda w: w.name):
+            self._visible_index[wire] = len(visible_bits), len(wire)
+            visible_bits.extend(bits[wire])
+
+        writes = ''.join('(%d, (%s,), (%s,), %s), ' % (
+            memid, ', '.join(bits[addr]), ', '.join(bits[data]), bits[enable][0])
+            for memid, addr, data, enable in mem_writes)
+        prog.append('    return [%s], [%s], [%s]' % (
+            ', '.join(next_bits), ', '.join(visible_bits), writes))
+        self._source = '\n'.join(prog)
+
+        context = {}
+        exec(compile(self._source, '<string>', 'exec'), context)
+        self._sim_func = context['sim_func']
+
+    def step(self, provided_inputs):
+        """ Take the simulation (of every lane) forward one cycle.
+
+        :param provided_inputs: a dictionary mapping every Input (or its name) to
+          either its value for this step in every lane, or a list of its values
+          for this step in each of the lanes
+        """
+        inputs = {}
+        for w, value in provided_inputs.items():
+            wire = self._resolve(w)
+            if not isinstance(wire, Input):
+                raise PyrtlError('step provided a value for input for "%s" which is '
+                                 'not a known input ' % wire.name)
+            inputs[wire] = value
+        ins = []
+        for wire in self._inputs:
+            if wire not in inputs:
+                raise PyrtlError('Input "%s" has no input value specified' % wire.name)
+            ins.extend(self._slice(wire, inputs[wire]))
+
+        self.regs, visible_bits, mem_writes = self._sim_func(ins, self.regs, self._read)
+        self.values = {}
+        for wire, (start, width) in self._visible_index.items():
+            self.values[wire] = visible_bits[start:start + width]
+
+        for memid, addr, data, enable in mem_writes:
+            if enable:
+                mem = self.mems[memid]
+                addrs, datas = _unslice(addr, self.lanes), _unslice(data, self.lanes)
+                for lane in range(self.lanes):
+                    if (enable >> lane) & 1:
+                        mem[lane][addrs[lane]] = datas[lane]
+
+        if self.tracer is not None:
+            self.tracer.add_step_named({
+                name: self._lane_value(self.values[self.tracer._wires[name]], 0)
+                for name in self.tracer.trace})
+
+        for wire, exp in self.block.rtl_assert_dict.items():
+            if self.values[wire][0] != self._all_lanes:
+                raise exp
+
+    def inspect(self, w):
+        """ Get the values of a wire in each lane in the last simulation cycle.
+
+        :param w: the wire (or its name) to inspect, which must be an Input,
+          Output, Register, or traced wire
+        :return: a list of the value of the wire in each lane
+        """
+        if self.values is None:
+            raise PyrtlError('No context available. Please run a simulation step in '
+                             'order to populate values for wires')
+        wire = self._resolve(w)
+        if wire not in self.values:
+            raise PyrtlError('BitSliceSimulation can only inspect Inputs, Outputs, '
+                             'Registers, and traced wires')
+        return _unslice(self.values[wire], self.lanes)
+
+    def inspect_mem(self, mem):
+        """ Get the contents of a memory in each lane, as a list of {address: value} maps. """
+        if isinstance(self.block, PostSynthBlock) and mem in self.block.mem_map:
+            mem = self.block.mem_map[mem]
+        return self.mems[mem.id]
+
+    def _resolve(self, w):
+        """ Find the wire of the block for a wire (or the wire before synthesis) or name. """
+        if isinstance(w, WireVector):
+            w = getattr(self.block, 'io_map', {}).get(w, w)
+            if w in self.block.wirevector_set:
+                return w
+            w = w.name
+        wire = self.block.get_wirevector_by_name(w) if isinstance(w, six.string_types) else None
+        if wire is None:
+            raise PyrtlError('error, "%s" is not a wire of the simulated block' % str(w))
+        return wire
+
+    def _slice(self, wire, value):
+        """ Return the bits of the wire (as ints with a bit per lane) for a value or values. """
+        lanes = self.lanes
+        if isinstance(value, numbers.Integral):
+            values = None
+        else:
+            values = list(value)
+            if len(values) != lanes:
+                raise PyrtlError('error, %d values given for "%s" but there are %d lanes'
+                                 % (len(values), wire.name, lanes))
+        _check_column(wire, [value] if values is None else values)
+        if values is None:
+            return [self._all_lanes * ((value >> i) & 1) for i in range(len(wire))]
+        return _slice(values, len(wire))
+
+    def _read(self, memid, addr, bitwidth):
+        """ Read a memory in each lane, given the bits of the address. """
+        addrs = _unslice(addr, self.lanes)
+        if memid in self._roms:
+            rom = self._roms[memid]
+            data = [rom._get_read_data(a) for a in addrs]
+        else:
+            data = [lane_mem.get(a, self.default_value)
+                    for lane_mem, a in zip(self.mems[memid], addrs)]
+        return _slice(data, bitwidth)
+
+    @staticmethod
+    def _lane_value(bits, lane):
+        value = 0
+        for i, bit in enumerate(bits):
+            value |= ((bit >> lane) & 1) << i
+        return value
+
+
+def _slice(values, bitwidth):
+    """ Transpose a value for each lane into an int for each bit (with a bit per lane). """
+    # the binary strings of the values, the last lane first, have the bits of the values as
+    # columns (most significant bit first), and reading a column gives the bit for each lane
+    rows = [format(v, '0%db' % bitwidth) for v in reversed(values)]
+    return [int(''.join(column), 2) for column in zip(*rows)][::-1]
+
+
+def _unslice(bits, lanes):
+    """ Transpose an int for each bit (with a bit per lane) into a value for each lane. """
+    rows = [format(bit, '0%db' % lanes) for bit in reversed(bits)]
+    return [int(''.join(column), 2) for column in zip(*rows)][::-1]
@@ -13,7 +13,7 @@ from .core import working_block
 from .wire import Input, Output, Const, WireVector, Register
 from .memory import RomBlock
 from .pyrtlexceptions import PyrtlError, PyrtlInternalError
-from .simulation import SimulationTrace
+from .simulation import SimulationTrace, _Checkpoint, _fork_tracer
 
 
 __all__ = ['CompiledSimulation']
@@ -82,6 +82,9 @@ class CompiledSimulation(object):
         - mips64 (untested)
 
     default_value is currently only implemented for registers, not memories.
+
+    The rtl_asserts of the block are checked by the compiled code: when one fails,
+    run stops at the end of that cycle and raises the exception of the assertion.
     """
 
     def __init__(
@@ -90,6 +93,9 @@ class CompiledSimulation(object):
         self._dll = self._dir = None
         self.block = working_block(block)
         self.block.sanity_check()
+        if self.block.logic_subset('h'):
+            raise PyrtlError('CompiledSimulation does not support module instances, '
+                             'flatten the block first with pyrtl.flatten')
 
         if tracer is True:
             tracer = SimulationTrace()
@@ -107,6 +113,60 @@ class CompiledSimulation(object):
         """Get a view into the contents of a MemBlock."""
         return DllMemInspector(self, mem)
 
+    def checkpoint(self):
+        """Take a snapshot of the registers and memories (see Simulation.checkpoint).
+
+        The state lives in the arrays of the compiled library, so (unlike in the
+        other simulators) taking a checkpoint copies all of the memories.
+        """
+        state = {vn: bytes(bytearray(buf)) for vn, buf in self._state_buffers.items()}
+        return _Checkpoint(CompiledSimulation, self.block, state)
+
+    def restore(self, checkpoint):
+        """Return the registers and memories to the state of a checkpoint."""
+        checkpoint.check(CompiledSimulation, self.block)
+        for vn, data in checkpoint.state.items():
+            ctypes.memmove(self._state_buffers[vn], data, len(data))
+
+    def fork(self, tracer=True):
+        """Return a new CompiledSimulation starting from the current state.
+
+        The fork loads its own copy of the compiled library, rather than compiling
+        the block again.
+        """
+        sim = CompiledSimulation.__new__(CompiledSimulation)
+        sim.__dict__.update(self.__dict__)
+        sim._dll = None
+        sim.tracer = _fork_tracer(self, tracer)
+        if sim.tracer is not None:
+            sim._remove_untraceable()
+        sim._dir = tempfile.mkdtemp()
+        shutil.copy(path.join(self._dir, 'pyrtlsim.so'), sim._dir)
+        sim._load_dll()
+        sim.restore(self.checkpoint())
+        return sim
+
+    def __getstate__(self):
+        """Pickle the compiled library and the state, rather than the loaded library."""
+        state = self.__dict__.copy()
+        for attr in ('_dll', '_dir', '_crun', '_status', '_state_buffers'):
+            del state[attr]
+        with open(path.join(self._dir, 'pyrtlsim.so'), 'rb') as f:
+            state['_library'] = f.read()
+        state['_checkpoint'] = self.checkpoint()
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        library, checkpoint = state.pop('_library'), state.pop('_checkpoint')
+        self.__dict__.update(state)
+        self._dll = None
+        self._dir = tempfile.mkdtemp()
+        with open(path.join(self._dir, 'pyrtlsim.so'), 'wb') as f:
+            f.write(library)
+        self._load_dll()
+        self.restore(checkpoint)
+
     def inspect(self, w):
         """Get the latest value of the wire given, if possible."""
         if isinstance(w, WireVector):
@@ -162,8 +222,11 @@ class CompiledSimulation(object):
                     ibuf[pos] = val & ((1 << 64)-1)
                     val >>= 64
 
-        # run the simulation
+        # run the simulation, which stops at the end of a cycle with a failing assertion
         self._crun(steps, ibuf, obuf)
+        failed_cycle, failed = self._status
+        if failed_cycle:
+            steps = failed_cycle
 
         # save traced wires
         for name in self.tracer.trace:
@@ -187,6 +250,9 @@ class CompiledSimulation(object):
                 start += sz
             self.tracer.trace[name].extend(res)
 
+        if failed_cycle:
+            raise self._assert_exps[failed]
+
     def _traceable(self, wv):
         """Check if wv is able to be traced
 
@@ -221,9 +287,20 @@ class CompiledSimulation(object):
             '-shared', '-fPIC', '-mcmodel=medium',
             path.join(self._dir, 'pyrtlsim.c'), '-o', path.join(self._dir, 'pyrtlsim.so'),
             ], shell=(platform.system() == 'Windows'))
+        self._load_dll()
+
+    def _load_dll(self):
+        """Load the library in self._dir, and find the buffers holding the state."""
         self._dll = ctypes.CDLL(path.join(self._dir, 'pyrtlsim.so'))
         self._crun = self._dll.sim_run_all
         self._crun.restype = None  # argtypes set on use
+        self._status = (ctypes.c_uint64*2).in_dll(self._dll, 'sim_status')
+        self._state_buffers = {}  # map from C variable->array of the register or memory
+        for w in self.block.wirevector_subset(Register):
+            array_type = ctypes.c_uint64*self._limbs(w)
+            self._state_buffers[self.varname[w]] = array_type.in_dll(self._dll, self.varname[w])
+        for mem in {net.op_param[1] for net in self.block.logic_subset('@')}:
+            self._state_buffers[self.varname[mem]] = DllMemInspector(self, mem)._buf
 
     def _limbs(self, w):
         """Number of 64-bit words needed to store value of wire."""
@@ -310,7 +387,8 @@ class CompiledSimulation(object):
             write('const uint64_t {name}[{limbs}] = {val};'.format(
                 limbs=self._limbs(w), name=vn, val=self._makeini(w, w.val)))
         elif isinstance(w, Register):
-            write('static uint64_t {name}[{limbs}] = {val};'.format(
+            write('EXPORT')
+            write('uint64_t {name}[{limbs}] = {val};'.format(
                 limbs=self._limbs(w), name=vn,
                 val=self._makeini(w, self._regmap.get(w, self.default_value))))
         else:
@@ -501,13 +579,18 @@ class CompiledSimulation(object):
         for mem in mems:
             self._declare_mem(write, mem)
 
+        # declare registers (exported, so that checkpoints can read and write them)
+        for w in self.block.wirevector_subset(Register):
+            self._declare_wv(write, w)
+
         # single step function
-        write('static void sim_run_step(uint64_t inputs[], uint64_t outputs[]) {')
+        write('static int64_t sim_run_step(uint64_t inputs[], uint64_t outputs[]) {')
         write('uint64_t tmp, carry, tmphi, tmplo;')  # temporary variables
 
         # declare wire vectors
         for w in self.block.wirevector_set:
-            self._declare_wv(write, w)
+            if not isinstance(w, Register):
+                self._declare_wv(write, w)
 
         # inputs copied in
         inputs = list(self.block.wirevector_subset(Input))
@@ -584,16 +667,35 @@ class CompiledSimulation(object):
                 write('outputs[{pos}] = {vn}[{n}];'.format(pos=opos, vn=self.varname[w], n=n))
                 opos += 1
         self._obufsz = opos  # total length of output array
+
+        # rtl assertions, returning the index of the first one failing (or -1)
+        self._assert_exps = []
+        for w, exp in self.block.rtl_assert_dict.items():
+            write('if (!{vn}[0]) return {index};'.format(
+                vn=self.varname[w], index=len(self._assert_exps)))
+            self._assert_exps.append(exp)
+        write('return -1;')
         write('}')
 
+        # status of the last run: the step (counting from 1) in which an assertion failed
+        # (or 0 if none did), and the index of the assertion
+        write('EXPORT')
+        write('uint64_t sim_status[2];')
+
         # entry point
         write('EXPORT')
         write('void sim_run_all(uint64_t stepcount, uint64_t inputs[], uint64_t outputs[]) {')
         write('uint64_t input_pos = 0, output_pos = 0;')
+        write('sim_status[0] = 0;')
         write('for (uint64_t stepnum = 0; stepnum < stepcount; stepnum++) {')
-        write('sim_run_step(inputs+input_pos, outputs+output_pos);')
+        write('int64_t failed = sim_run_step(inputs+input_pos, outputs+output_pos);')
         write('input_pos += {};'.format(self._ibufsz))
         write('output_pos += {};'.format(self._obufsz))
+        write('if (failed >= 0) {')
+        write('sim_status[0] = stepnum+1;')
+        write('sim_status[1] = failed;')
+        write('return;')
+        write('}')
         write('}}')
 
     def __del__(self):
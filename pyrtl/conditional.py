@@ -45,8 +45,10 @@ under a condition.
 
 from __future__ import print_function, unicode_literals
 
+import threading
+
 from .pyrtlexceptions import PyrtlError, PyrtlInternalError
-from .wire import WireVector, Const, Register
+from .wire import WireVector, Register, _interned_const
 
 
 # -----------------------------------------------------------------------
@@ -58,7 +60,7 @@ from .wire import WireVector, Const, Register
 
 def currently_under_condition():
     """Returns True if execution is currently in the context of a _ConditionalAssignment."""
-    return _depth > 0
+    return _state.depth > 0
 
 
 # -----------------------------------------------------------------------
@@ -68,9 +70,8 @@ def currently_under_condition():
 class _ConditionalAssignment(object):
     """ helper type of global "conditional_assignment". """
     def __enter__(self):
-        global _depth
         _check_no_nesting()
-        _depth = 1
+        _state.depth = 1
 
     def __exit__(self, *exc_info):
         try:
@@ -78,7 +79,7 @@ class _ConditionalAssignment(object):
         finally:
             # even if the above finalization throws an error we need to
             # return reset the state to prevent errors from bleeding over
-            _reset_conditional_state()  # sets _depth back to 0
+            _reset_conditional_state()  # sets depth back to 0
 
 
 class _Otherwise(object):
@@ -90,25 +91,31 @@ class _Otherwise(object):
         _pop_condition()
 
 
+class _ConditionalState(threading.local):
+    """ The state required for conditionals, kept separately for each thread
+    (so that designs can be elaborated in different threads at the same time). """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.depth = 0
+        self.conditions_list_stack = [[]]  # stack of lists of current conditions
+        # predicate_map: map wirevector or mem -> [(final_pred, rhs), ...]
+        self.predicate_map = {}
+        # conflicts_map: map wirevector or mem -> [ set([(pred,bool), (pred,bool)]), set([(pred..
+        # * each element maps to a list of sets of tuples of (predicate id, bool)
+        # * each time a value is written (lhs) we add the predicate set to the list
+        # * each new write happens we have to check that the new predicate has at least one
+        #   negated term with the value we are now trying to write.  Otherwise it is an error.
+        self.conflicts_map = {}
+
+
 def _reset_conditional_state():
-    """Set or reset all the module state required for conditionals."""
-    global _conditions_list_stack
-    global _conflicts_map
-    global _predicate_map
-    global _depth
-    _depth = 0
-    _conditions_list_stack = [[]]  # stack of lists of current conditions
-    # _predicate_map: map wirevector or mem -> [(final_pred, rhs), ...]
-    _predicate_map = {}
-    # _conflicts_map: map wirevector or mem -> [ set([(pred,bool), (pred,bool)]), set([(pred,bool)..
-    # * each element maps to a list of sets of tuples of (predicate id, bool)
-    # * each time a value is written (lhs) we add the predicate set to the list
-    # * each new write happens we have to check that the new predicate has at least one negated
-    #   term with the value we are now trying to write.  Otherwise it is an error.
-    _conflicts_map = {}
-
-
-_reset_conditional_state()
+    """Set or reset all the module state required for conditionals (in the current thread)."""
+    _state.reset()
+
+
+_state = _ConditionalState()
 conditional_assignment = _ConditionalAssignment()
 otherwise = _Otherwise()
 
@@ -119,21 +126,19 @@ otherwise = _Otherwise()
 
 def _push_condition(predicate):
     """As we enter new conditions, this pushes them on the predicate stack."""
-    global _depth
     _check_under_condition()
-    _depth += 1
+    _state.depth += 1
     if predicate is not otherwise and len(predicate) > 1:
         raise PyrtlError('all predicates for conditional assignments must wirevectors of len 1')
-    _conditions_list_stack[-1].append(predicate)
-    _conditions_list_stack.append([])
+    _state.conditions_list_stack[-1].append(predicate)
+    _state.conditions_list_stack.append([])
 
 
 def _pop_condition():
     """As we exit conditions, this pops them off the stack."""
-    global _depth
     _check_under_condition()
-    _conditions_list_stack.pop()
-    _depth -= 1
+    _state.conditions_list_stack.pop()
+    _state.depth -= 1
 
 
 def _build(lhs, rhs):
@@ -141,7 +146,7 @@ def _build(lhs, rhs):
     _check_under_condition()
     final_predicate, pred_set = _current_select()
     _check_and_add_pred_set(lhs, pred_set)
-    _predicate_map.setdefault(lhs, []).append((final_predicate, rhs))
+    _state.predicate_map.setdefault(lhs, []).append((final_predicate, rhs))
 
 
 def _build_read_port(mem, addr):
@@ -153,7 +158,7 @@ def _build_read_port(mem, addr):
 # The following helper functions are used only internally
 
 def _check_no_nesting():
-    if _depth != 0:
+    if _state.depth != 0:
         raise PyrtlError('no nesting of conditional assignments allowed')
 
 
@@ -163,10 +168,11 @@ def _check_under_condition():
 
 
 def _check_and_add_pred_set(lhs, pred_set):
-    for test_set in _conflicts_map.setdefault(lhs, []):
+    conflicts = _state.conflicts_map.setdefault(lhs, [])
+    for test_set in conflicts:
         if _pred_sets_are_in_conflict(pred_set, test_set):
             raise PyrtlError('conflicting conditions for %s' % lhs)
-    _conflicts_map[lhs].append(pred_set)
+    conflicts.append(pred_set)
 
 
 def _pred_sets_are_in_conflict(pred_set_a, pred_set_b):
@@ -184,15 +190,16 @@ def _finalize():
     """Build the required muxes and call back to WireVector to finalize the wirevector build."""
     from .memory import MemBlock
     from pyrtl.corecircuits import select
-    for lhs in _predicate_map:
+    predicate_map = _state.predicate_map
+    for lhs in predicate_map:
         # handle memory write ports
         if isinstance(lhs, MemBlock):
-            p, (addr, data, enable) = _predicate_map[lhs][0]
-            combined_enable = select(p, truecase=enable, falsecase=Const(0))
+            p, (addr, data, enable) = predicate_map[lhs][0]
+            combined_enable = select(p, truecase=enable, falsecase=_interned_const(0))
             combined_addr = addr
             combined_data = data
 
-            for p, (addr, data, enable) in _predicate_map[lhs][1:]:
+            for p, (addr, data, enable) in predicate_map[lhs][1:]:
                 combined_enable = select(p, truecase=enable, falsecase=combined_enable)
                 combined_addr = select(p, truecase=addr, falsecase=combined_addr)
                 combined_data = select(p, truecase=data, falsecase=combined_data)
@@ -207,7 +214,7 @@ def _finalize():
                 result = 0  # default for wire is "0"
             else:
                 raise PyrtlInternalError('unknown assignment in finalize')
-            predlist = _predicate_map[lhs]
+            predlist = predicate_map[lhs]
             for p, rhs in predlist:
                 result = select(p, truecase=rhs, falsecase=result)
             lhs._build(result)
@@ -218,7 +225,7 @@ def _current_select():
 
     Returns a tuple of information: (predicate, pred_set).
     The value pred_set is a set([ (predicate, bool), ... ]) as described in
-    the _reset_conditional_state
+    _ConditionalState
     """
 
     # helper to create the conjuction of predicates
@@ -244,7 +251,7 @@ def _current_select():
     pred_set = set()
 
     # for all conditions except the current children (which should be [])
-    for predlist in _conditions_list_stack[:-1]:
+    for predlist in _state.conditions_list_stack[:-1]:
         # negate all of the predicates between "otherwise" and the current one
         for predicate in between_otherwise_and_current(predlist):
             select = and_with_possible_none(select, ~predicate)
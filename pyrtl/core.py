@@ -10,8 +10,11 @@ Included in this file you will find:
 """
 from __future__ import print_function, unicode_literals
 import collections
+import itertools
 import re
+import threading
 import keyword
+import six
 
 from .pyrtlexceptions import PyrtlError, PyrtlInternalError
 
@@ -70,6 +73,9 @@ class LogicNet(collections.namedtuple('LogicNet', ['op', 'op_param', 'args', 'de
                                                put it into data
         ('@', (memid, mem), (addr, data, wr_en), ()) => write data to mem (w/ id memid) at
                                                         address addr; req. write enable (wr_en)
+        ('h', (name, module), (*args), (*dests)) => instance "name" of module: connects
+                                                    args to module.inputs and dests to
+                                                    module.outputs (in that order)
 
     """
 
@@ -89,12 +95,19 @@ class LogicNet(collections.namedtuple('LogicNet', ['op', 'op_param', 'args', 'de
                 addr, data, we = (str(x) for x in self.args)
                 return "{}[{}] <-- @ -- {} we={} ({})".format(
                     memblock.name, addr, data, we, extrainfo)
+        elif self.op == 'h':
+            name, module = self.op_param
+            return "{} <-- h -- {}({}) ({})".format(lhs, module.name, rhs, name)
         else:
             raise PyrtlInternalError('error, unknown op "%s"' % str(self.op))
 
-    def __hash__(self):
-        # it seems that namedtuple is not always hashable
-        return hash(tuple(self))
+    # no per-instance __dict__, a net is just its four fields
+    __slots__ = ()
+
+    # Defining __eq__ below would otherwise make LogicNet unhashable.  Using the
+    # tuple hash directly (rather than a python-level "hash(tuple(self))", which
+    # builds a temporary tuple) means hashing a net never leaves C code.
+    __hash__ = tuple.__hash__
 
     def __eq__(self, other):
         # We can't be going and calling __eq__ recursively on the logic nets for all of
@@ -128,6 +141,135 @@ class LogicNet(collections.namedtuple('LogicNet', ['op', 'op_param', 'args', 'de
     __ge__ = _compare_error
 
 
+class _TrackedSet(set):
+    """ A set that reports every addition and removal to its owner.
+
+    Used for Block.logic and Block.wirevector_set.  Behaves exactly like a normal
+    set, except that on_add(item) and on_remove(item) are called as items enter
+    and leave the set, no matter how the set is modified (through add_net, a
+    transform, or a user directly calling block.logic.remove).  If on_clear is
+    given it is called in place of on_remove for each item when the set is
+    cleared.  Operations that build a new set (copy, union, "-", etc.) return a
+    plain set.
+    """
+
+    def __init__(self, on_add, on_remove, on_clear=None, items=()):
+        super(_TrackedSet, self).__init__()
+        self._on_add = on_add
+        self._on_remove = on_remove
+        self._on_clear = on_clear
+        self.update(items)
+
+    def __reduce__(self):
+        return set, (list(self),)
+
+    def add(self, item):
+        if not set.__contains__(self, item):
+            set.add(self, item)
+            self._on_add(item)
+
+    def remove(self, item):
+        set.remove(self, item)
+        self._on_remove(item)
+
+    def discard(self, item):
+        if set.__contains__(self, item):
+            self.remove(item)
+
+    def pop(self):
+        item = set.pop(self)
+        self._on_remove(item)
+        return item
+
+    def clear(self):
+        if self._on_clear is not None:
+            set.clear(self)
+            self._on_clear()
+        else:
+            while self:
+                self.pop()
+
+    def update(self, *others):
+        for other in others:
+            for item in other:
+                self.add(item)
+
+    def difference_update(self, *others):
+        for other in others:
+            for item in other:
+                self.discard(item)
+
+    def intersection_update(self, *others):
+        keep = set.intersection(self, *others)
+        self.difference_update([item for item in self if item not in keep])
+
+    def symmetric_difference_update(self, other):
+        for item in set(other):
+            if set.__contains__(self, item):
+                self.remove(item)
+            else:
+                self.add(item)
+
+    def replace_with(self, items):
+        """ Make the set hold exactly items, adding and removing only what differs. """
+        items = list(items)
+        keep = set(items)
+        self.difference_update([item for item in self if item not in keep])
+        self.update(items)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __iand__(self, other):
+        self.intersection_update(other)
+        return self
+
+    def __isub__(self, other):
+        self.difference_update(other)
+        return self
+
+    def __ixor__(self, other):
+        self.symmetric_difference_update(other)
+        return self
+
+
+_HASHABLE_OPS = '~&|^n+-*<>=xcs'  # ops that can be shared under structural hashing
+_COMMUTATIVE_OPS = '&|^n+*='
+
+
+def _structural_key(op, op_param, args):
+    """ Return the key under which structural hashing indexes a net.
+
+    Wires are compared by identity (as WireVector.__eq__ builds hardware), so the
+    key uses the ids of the args, in a canonical order for commutative ops.
+    """
+    ids = tuple(id(arg) for arg in args)
+    if op in _COMMUTATIVE_OPS and len(ids) == 2 and ids[1] < ids[0]:
+        ids = (ids[1], ids[0])
+    return op, op_param, ids
+
+
+class _ReadOnlyDict(collections.Mapping):
+    """ A read-only, live view of one of the dictionaries internal to a Block. """
+    __slots__ = ('_data',)
+
+    def __init__(self, data):
+        self._data = data
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+
 class Block(object):
     """ Block encapsulates a netlist.
 
@@ -197,6 +339,12 @@ class Block(object):
       If multiple writes happen to the same address in the same cycle the behavior is currently
       undefined.
 
+    * The 'h' operator is an instance of a Module (see hierarchy.py), a block defined
+      once and used in any number of places.  The op_param is a tuple of the name of
+      the instance and the Module.  The args are connected to the Inputs of the module
+      and the dests to its Outputs, in the order given by module.inputs and
+      module.outputs.  The outputs are treated as depending on all of the inputs.
+
     The connecting elements (args and dests) should be WireVectors or derived
     from WireVector, and should be registered with the block using
     the method add_wirevector.  Nets should be registered using add_net.
@@ -210,37 +358,315 @@ class Block(object):
 
     def __init__(self):
         """Creates an empty hardware block."""
+        self._wire_src = {}  # map from wire->net driving it (kept in sync with logic)
+        self._wire_extra_srcs = {}  # map from wire->list of any additional drivers
+        self._wire_sinks = {}  # map from wire->list of nets using it (kept in sync with logic)
+        self._wire_src_view = _ReadOnlyDict(self._wire_src)
+        self._wire_sinks_view = _ReadOnlyDict(self._wire_sinks)
+        self._mutation_count = 0  # bumped on every change to the logic of the block
+        self._levels_version = -1  # value of _mutation_count when _levels was computed
+        self._levels = None  # cached result of levels()
+        self._net_level = None  # map from net->its index in _levels
+        self._net_order = collections.OrderedDict()  # the nets, in the order they were added
+        self._dirty_nets = None  # nets added since the last sanity_check (None if unknown)
+        self._dirty_wires = None  # wires touched since the last sanity_check (None if unknown)
+        self._checked_mutation_count = -1  # value of _mutation_count at the last sanity_check
+        self._checked_legal_ops = None  # legal_ops at the last sanity_check
+        self._nets_by_op = {}  # map from op->set of the nets with that op
+        self._wires_by_class = {}  # map from class->set of the wirevectors of exactly that class
         self.logic = set()  # set of nets, each is a LogicNet named tuple
         self.wirevector_set = set()  # set of all wirevectors
-        self.wirevector_by_name = {}  # map from name->wirevector, used for performance
+        self.wirevector_by_name = {}  # map from name->wirevector (of wires with a given name)
+        self._unnamed_wires = {}  # map from index->temporary wire, built as names are looked up
+        self._unnamed_changes = 0  # bumped whenever a temporary is added or removed
+        self._unnamed_wires_version = 0  # value of _unnamed_changes when _unnamed_wires was built
         # pre-synthesis wirevectors to post-synthesis vectors
-        self.legal_ops = set('w~&|^n+-*<>=xcsrm@')  # set of legal OPS
+        self.legal_ops = set('w~&|^n+-*<>=xcsrm@h')  # set of legal OPS
         self.rtl_assert_dict = {}   # map from wirevectors -> exceptions, used by rtl_assert
+        self._bulk_build_depth = 0  # number of bulk_build contexts currently entered
+        self._unchecked_wires = []  # wires added under bulk_build, not yet checked
+        self._unchecked_nets = []  # nets added under bulk_build, not yet checked
+        self._net_keys = None  # map from structural key->net (None unless structural_hashing)
+        self._interned_consts = {}  # map from (type, literal, bitwidth)->Const made by as_wires
 
     def __str__(self):
         """String form has one LogicNet per line."""
         return '\n'.join(str(l) for l in self)
 
+    # attributes derived from logic and wirevector_set, rebuilt when a block is unpickled
+    _derived_state = (
+        '_wire_src', '_wire_extra_srcs', '_wire_sinks', '_wire_src_view', '_wire_sinks_view',
+        '_mutation_count', '_levels_version', '_levels', '_net_level', '_net_order',
+        '_dirty_nets', '_dirty_wires', '_checked_mutation_count', '_checked_legal_ops',
+        '_nets_by_op', '_wires_by_class', '_unnamed_wires', '_unnamed_changes',
+        '_unnamed_wires_version', '_net_keys')
+
+    def __getstate__(self):
+        """ Pickle (or deep copy) the nets and wires, but not the indexes derived from them. """
+        state = {name: value for name, value in self.__dict__.items()
+                 if name not in self._derived_state}
+        state['_logic'] = self._nets_in_order()
+        state['_wirevector_set'] = list(self._wirevector_set)
+        state['_net_keys'] = self._net_keys is not None
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        nets, wires = state.pop('_logic'), state.pop('_wirevector_set')
+        structural_hashing = state.pop('_net_keys')
+        Block.__init__(self)  # fresh (empty) tracked sets and indexes
+        self.__dict__.update(state)
+        self.wirevector_set = wires
+        self.logic = nets  # in the order the nets were added
+        self.structural_hashing = structural_hashing
+
+    @property
+    def logic(self):
+        """ The set of LogicNets in the block.
+
+        Nets can be added and removed either with add_net and remove_net or by
+        modifying this set directly; either way the driver/fanout index used by
+        net_connections is kept up to date.  Assigning a new collection of nets
+        replaces the logic of the block (nets already in the block are kept as is)."""
+        return self._logic
+
+    @logic.setter
+    def logic(self, nets):
+        if not hasattr(self, '_logic'):
+            self._logic = _TrackedSet(self._connect_net, self._disconnect_net,
+                                      self._clear_connections)
+        self._logic.replace_with(nets)
+
+    @property
+    def wirevector_set(self):
+        """ The set of all WireVectors in the block.
+
+        Like logic, this can be modified directly or assigned to, and the block
+        will keep track of the changes."""
+        return self._wirevector_set
+
+    @wirevector_set.setter
+    def wirevector_set(self, wirevectors):
+        if not hasattr(self, '_wirevector_set'):
+            self._wirevector_set = _TrackedSet(self._index_wire, self._unindex_wire)
+        self._wirevector_set.replace_with(wirevectors)
+
+    @property
+    def structural_hashing(self):
+        """ If True, expressions reuse the result of an equivalent net already in the block.
+
+        This is off by default.  When it is on, the block keeps an index of its
+        combinational nets (those with a single, plain WireVector dest) by their
+        op, op_param, and args (in a canonical order for the commutative ops), and
+        building an expression such as "a & b", "~a", "a[0]", concat or mux that
+        matches a net already in the block returns the dest of that net rather than
+        adding a new one.  This keeps the netlist small as it is built, rather than
+        relying on common_subexp_elimination afterwards.  Note that as a result two
+        equal expressions may give the very same WireVector (so naming one names
+        the other).  Nets added directly with add_net are always added, but are
+        indexed for later expressions to reuse, and if a net that is reused is
+        removed, an equivalent net still in the block is reused in its place.
+        """
+        return self._net_keys is not None
+
+    @structural_hashing.setter
+    def structural_hashing(self, enable):
+        if enable and self._net_keys is None:
+            self._net_keys = {}
+            for net in self._nets_in_order():
+                self._index_net(net)
+        elif not enable:
+            self._net_keys = None
+
+    def find_equivalent_net(self, op, op_param, args):
+        """ Return a net in the block computing op over args, or None if there is none.
+
+        Only returns nets when structural_hashing is on (see structural_hashing).
+        """
+        if self._net_keys is None:
+            return None
+        return self._net_keys.get(_structural_key(op, op_param, args))
+
+    def _index_net(self, net):
+        from .wire import WireVector
+        if (net.op in _HASHABLE_OPS and len(net.dests) == 1 and
+                net.dests[0].__class__ is WireVector):
+            self._net_keys.setdefault(_structural_key(net.op, net.op_param, net.args), net)
+
+    def _nets_in_order(self):
+        """ Return a list of the nets of the block in the order they were inserted. """
+        return list(self._net_order)
+
+    def _connect_net(self, net):
+        """ Add net to the driver/fanout index (called by the logic set). """
+        self._mutation_count += 1
+        self._net_order[net] = None
+        if self._dirty_nets is not None:
+            self._dirty_nets.add(net)
+            self._dirty_wires.update(net.args)
+            self._dirty_wires.update(net.dests)
+        for dest in net.dests:
+            if dest in self._wire_src:
+                self._wire_extra_srcs.setdefault(dest, []).append(net)
+            else:
+                self._wire_src[dest] = net
+        if self._net_keys is not None:
+            self._index_net(net)
+        nets = self._nets_by_op.get(net.op)
+        if nets is None:
+            self._nets_by_op[net.op] = {net}
+        else:
+            nets.add(net)
+        for arg in set(net.args):  # prevents unexpected duplicates when doing b <<= a & a
+            sinks = self._wire_sinks.get(arg)
+            if sinks is None:
+                self._wire_sinks[arg] = [net]
+            else:
+                sinks.append(net)
+
+    def _disconnect_net(self, net):
+        """ Remove net from the driver/fanout index (called by the logic set). """
+        self._mutation_count += 1
+        del self._net_order[net]
+        if self._dirty_nets is not None:
+            self._dirty_nets.discard(net)
+            self._dirty_wires.update(net.args)
+            self._dirty_wires.update(net.dests)
+        for dest in net.dests:
+            extras = self._wire_extra_srcs.get(dest)
+            if extras is None:
+                del self._wire_src[dest]
+                continue
+            if self._wire_src[dest] == net:
+                self._wire_src[dest] = extras.pop()
+            else:
+                extras.remove(net)
+            if not extras:
+                del self._wire_extra_srcs[dest]
+        if self._net_keys is not None and net.op in _HASHABLE_OPS:
+            key = _structural_key(net.op, net.op_param, net.args)
+            if self._net_keys.get(key) is net:
+                del self._net_keys[key]
+                # index an equivalent net still in the block, if any (it uses the same args)
+                for other in self._wire_sinks[net.args[0]]:
+                    if (other is not net and other.op == net.op and
+                            _structural_key(other.op, other.op_param, other.args) == key):
+                        self._index_net(other)
+                        if key in self._net_keys:
+                            break
+        self._nets_by_op[net.op].discard(net)
+        for arg in set(net.args):
+            sinks = self._wire_sinks[arg]
+            sinks.remove(net)
+            if not sinks:
+                del self._wire_sinks[arg]
+
+    def _clear_connections(self):
+        self._mutation_count += 1
+        self._net_order.clear()
+        self._dirty_nets = self._dirty_wires = None
+        self._wire_src.clear()
+        self._wire_extra_srcs.clear()
+        self._wire_sinks.clear()
+        self._nets_by_op.clear()
+        if self._net_keys is not None:
+            self._net_keys.clear()
+
+    def _touch_wire(self, wirevector):
+        """ Note that wirevector was added, removed, or renamed (for sanity_check). """
+        if self._dirty_wires is not None:
+            self._dirty_wires.add(wirevector)
+
+    def _index_wire(self, wirevector):
+        """ Add wirevector to the index by class (called by the wirevector set). """
+        self._touch_wire(wirevector)
+        wires = self._wires_by_class.get(wirevector.__class__)
+        if wires is None:
+            self._wires_by_class[wirevector.__class__] = {wirevector}
+        else:
+            wires.add(wirevector)
+
+    def _unindex_wire(self, wirevector):
+        """ Remove wirevector from the index by class (called by the wirevector set). """
+        self._touch_wire(wirevector)
+        self._wires_by_class[wirevector.__class__].discard(wirevector)
+
     def add_wirevector(self, wirevector):
         """ Add a wirevector object to the block."""
-        self.sanity_check_wirevector(wirevector)
+        if self._bulk_build_depth:
+            self._unchecked_wires.append(wirevector)
+        else:
+            self.sanity_check_wirevector(wirevector)
+        if self._dirty_wires is not None:  # also catch a name clash with an existing wire
+            self._touch_wire(self.wirevector_by_name.get(wirevector._name, wirevector))
+            self._touch_wire(wirevector)
+        profiler = _working_block_state.elaboration_profiler
+        if profiler is not None and wirevector not in self.wirevector_set:
+            profiler._record(wire=wirevector)
         self.wirevector_set.add(wirevector)
-        self.wirevector_by_name[wirevector.name] = wirevector
+        if _is_unnamed(wirevector):  # temporaries are found by get_wirevector_by_name
+            self._unnamed_changes += 1
+        else:
+            self.wirevector_by_name[wirevector._name] = wirevector
 
     def remove_wirevector(self, wirevector):
         """ Remove a wirevector object to the block."""
         self.wirevector_set.remove(wirevector)
-        del self.wirevector_by_name[wirevector.name]
+        if _is_unnamed(wirevector):
+            self._unnamed_changes += 1
+        else:
+            del self.wirevector_by_name[wirevector._name]
 
     def add_net(self, net):
         """ Add a net to the logic of the block.
 
         The passed net, which must be of type LogicNet, is checked and then
         added to the block.  No wires are added by this member, they must be
-        added seperately with add_wirevector."""
+        added seperately with add_wirevector.  Under bulk_build the check is
+        deferred until the bulk build is complete."""
 
-        self.sanity_check_net(net)
+        if self._bulk_build_depth:
+            self._sanity_check_net_fields(net)
+            self._unchecked_nets.append(net)
+        else:
+            self.sanity_check_net(net)
         self.logic.add(net)
+        profiler = _working_block_state.elaboration_profiler
+        if profiler is not None:
+            profiler._record(net=net)
+
+    def bulk_build(self):
+        """ Return a context under which wires and nets are added with deferred checks.
+
+        Normally every wire and net is checked as it is added to the block.  When
+        generating very large structures that are known to be well formed, those
+        checks can instead be batched up and done once when the context exits
+        (where, for example, each wire is checked once rather than once per net
+        using it)::
+
+            with block.bulk_build():
+                result = kogge_stone(a, b)
+
+        If a deferred check fails, the error is raised on exit (and the
+        offending nets have already been added to the block).  Contexts can be
+        nested, in which case the checks are done when the outermost one exits.
+        """
+        return _BulkBuild(self)
+
+    def _check_bulk_build(self):
+        """ Do all the checks deferred by bulk_build. """
+        wires, self._unchecked_wires = self._unchecked_wires, []
+        nets, self._unchecked_nets = self._unchecked_nets, []
+        for w in wires:
+            self.sanity_check_wirevector(w)
+        self._sanity_check_nets(nets)
+
+    def remove_net(self, net):
+        """ Remove a net from the logic of the block.
+
+        No wires are removed by this member, they must be removed seperately
+        with remove_wirevector."""
+        self.logic.remove(net)
 
     def wirevector_subset(self, cls=None, exclude=tuple()):
         """Return set of wirevectors, filtered by the type or tuple of types provided as cls.
@@ -248,39 +674,67 @@ class Block(object):
         If no cls is specified, the full set of wirevectors associated with the Block are
         returned.  If cls is a single type, or a tuple of types, only those wirevectors of
         the matching types will be returned.  This is helpful for getting all inputs, outputs,
-        or registers of a block for example."""
-        if cls is None:
-            initial_set = self.wirevector_set
-        else:
-            initial_set = (x for x in self.wirevector_set if isinstance(x, cls))
-        if exclude == tuple():
-            return set(initial_set)
-        else:
-            return set(x for x in initial_set if not isinstance(x, exclude))
+        or registers of a block for example.
+
+        The block keeps its wirevectors indexed by class, so this takes time in
+        proportion to the size of the result rather than the size of the block."""
+        if cls is None and exclude == tuple():
+            return set(self.wirevector_set)
+        return set().union(*(wires for wire_cls, wires in self._wires_by_class.items()
+                             if (cls is None or issubclass(wire_cls, cls))
+                             and not issubclass(wire_cls, exclude)))
 
     def logic_subset(self, op=None):
         """Return set of logicnets, filtered by the type(s) of logic op provided as op.
 
         If no op is specified, the full set of logicnets associated with the Block are
-        returned.  This is helpful for getting all memories of a block for example."""
+        returned.  This is helpful for getting all memories of a block for example.
+
+        The block keeps its logicnets indexed by op, so this takes time in
+        proportion to the size of the result rather than the size of the block."""
         if op is None:
             return self.logic
         else:
-            return set(x for x in self.logic if x.op in op)
+            return set().union(*(nets for net_op, nets in self._nets_by_op.items()
+                                 if net_op in op))
 
     def get_wirevector_by_name(self, name, strict=False):
         """Return the wirevector matching name.
 
         By fallthrough, if a matching wirevector cannot be found the value None is
         returned.  However, if the argument strict is set to True, then this will
-        instead throw a PyrtlError when no match is found."""
+        instead throw a PyrtlError when no match is found.
+
+        Temporary wires (those not given a name) are not kept in wirevector_by_name,
+        but are still found here by their generated names ("tmp" and an index)."""
         if name in self.wirevector_by_name:
             return self.wirevector_by_name[name]
+        wire = self._get_unnamed_wirevector(name)
+        if wire is not None:
+            return wire
         elif strict:
             raise PyrtlError('error, block does not have a wirevector named %s' % name)
         else:
             return None
 
+    def _get_unnamed_wirevector(self, name):
+        """ Return the temporary wire in the block with the generated name, or None. """
+        from .wire import _wvIndexer
+        prefix = _wvIndexer.internal_prefix
+        if not isinstance(name, six.string_types) or not name.startswith(prefix):
+            return None
+        index = name[len(prefix):]
+        if not index.isdigit() or str(int(index)) != index:
+            return None
+        if self._unnamed_wires_version != self._unnamed_changes:
+            # only rebuilt when needed, as most temporaries are never looked up by name
+            self._unnamed_wires = {w._name: w for w in self.wirevector_set if _is_unnamed(w)}
+            self._unnamed_wires_version = self._unnamed_changes
+        wire = self._unnamed_wires.get(int(index))
+        if wire is None or wire._name != int(index) or wire not in self.wirevector_set:
+            return None  # renamed, or removed from the block directly
+        return wire
+
     def net_connections(self, include_virtual_nodes=False):
         """ Returns a representation of the current block useful for creating a graph.
 
@@ -296,39 +750,33 @@ class Block(object):
         well as facilitate other places in which one would need wire source
         and wire sink information
 
+        The block keeps these maps up to date as nets are added and removed, so
+        without virtual nodes this is O(1): the two dictionaries returned are
+        read-only views that will reflect any later changes to the block (and
+        the lists of sinks in them should not be modified).  With virtual nodes
+        a new pair of dictionaries is built each call.
+
         Look at input_output.net_graph for one such graph that uses the information
         from this function
         """
-        src_list = {}
-        dst_list = {}
-
-        def add_wire_src(edge, node):
-            if edge in src_list:
-                raise PyrtlError('Wire "{}" has multiple drivers (check for multiple assignments '
-                                 'with "<<=" or accidental mixing of "|=" and "<<=")'.format(edge))
-            src_list[edge] = node
-
-        def add_wire_dst(edge, node):
-            if edge in dst_list:
-                # if node in dst_list[edge]:
-                #     raise PyrtlError("The net already exists in the graph")
-                dst_list[edge].append(node)
-            else:
-                dst_list[edge] = [node]
+        if self._wire_extra_srcs:
+            edge = next(iter(self._wire_extra_srcs))
+            raise PyrtlError('Wire "{}" has multiple drivers (check for multiple assignments '
+                             'with "<<=" or accidental mixing of "|=" and "<<=")'.format(edge))
 
-        if include_virtual_nodes:
-            from .wire import Input, Output, Const
-            for wire in self.wirevector_subset((Input, Const)):
-                add_wire_src(wire, wire)
+        if not include_virtual_nodes:
+            return self._wire_src_view, self._wire_sinks_view
 
-            for wire in self.wirevector_subset(Output):
-                add_wire_dst(wire, wire)
-
-        for net in self.logic:
-            for arg in set(net.args):  # prevents unexpected duplicates when doing b <<= a & a
-                add_wire_dst(arg, net)
-            for dest in net.dests:
-                add_wire_src(dest, net)
+        from .wire import Input, Output, Const
+        src_list = dict(self._wire_src)
+        dst_list = {w: list(nets) for w, nets in self._wire_sinks.items()}
+        for wire in self.wirevector_subset((Input, Const)):
+            if wire in src_list:
+                raise PyrtlError('Wire "{}" has multiple drivers (check for multiple assignments '
+                                 'with "<<=" or accidental mixing of "|=" and "<<=")'.format(wire))
+            src_list[wire] = wire
+        for wire in self.wirevector_subset(Output):
+            dst_list.setdefault(wire, []).append(wire)
         return src_list, dst_list
 
     def _repr_svg_(self):
@@ -344,38 +792,134 @@ class Block(object):
         Note: this method will throw an error if there are loops in the
         logic that do not involve registers
         Also, the order of the nets is not guaranteed to be the the same
-        over multiple iterations"""
+        over multiple iterations.  The order is the one computed by levels, and
+        so it is cached until the logic of the block is next changed."""
+        for level in self.levels():
+            for net in level:
+                yield net
+
+    def levels(self):
+        """ Return the nets of the block grouped into levels, in topographic order.
+
+        :return: a tuple of tuples of LogicNets, where level i holds the nets
+          whose arguments are all either Inputs, Consts, Registers, or the
+          outputs of nets from levels before i
+
+        Iterating through the levels in order (and through the nets within each
+        level) visits every net after all of its "parents", which is the order
+        used by the simulators and by the block iterator.  The levels are
+        computed in a single linear pass and cached, so all consumers share the
+        same sort until the logic of the block is next changed.  Use net_level
+        to find the level of a particular net.
+
+        Will throw an error if there are loops in the logic that do not
+        involve registers.
+        """
+        if self._levels_version != self._mutation_count:
+            self._levels, self._net_level = self._compute_levels()
+            self._levels_version = self._mutation_count
+        return self._levels
+
+    def net_level(self, net):
+        """ Return the level of net (its index in the tuple returned by levels). """
+        self.levels()
+        return self._net_level[net]
+
+    def _compute_levels(self):
         from .wire import Input, Const, Register
-        src_dict, dest_dict = self.net_connections()
-        to_clear = self.wirevector_subset((Input, Const, Register))
-        cleared = set()
-        remaining = self.logic.copy()
-        try:
-            while len(to_clear):
-                wire_to_check = to_clear.pop()
-                cleared.add(wire_to_check)
-                if wire_to_check in dest_dict:
-                    for gate in dest_dict[wire_to_check]:  # loop over logicnets not yet returned
-                        if all(arg in cleared for arg in gate.args):  # if all args ready
-                            yield gate
-                            remaining.remove(gate)
-                            if gate.op != 'r':
-                                to_clear.update(gate.dests)
-        except KeyError as e:
-            import six
-            six.raise_from(PyrtlError("Cannot Iterate through malformed block"), e)
-
-        if len(remaining) != 0:
+        sources = (Input, Const, Register)
+        dest_dict = self.net_connections()[1]  # also checks for duplicate wire drivers
+
+        waiting_on = {}  # map from net->number of args not yet produced
+        level = []
+        for net in self.logic:
+            count = sum(1 for arg in set(net.args) if not isinstance(arg, sources))
+            if count:
+                waiting_on[net] = count
+            else:
+                level.append(net)
+
+        levels = []
+        net_level = {}
+        while level:
+            next_level = []
+            for net in level:
+                net_level[net] = len(levels)
+                if net.op == 'r':
+                    continue  # register outputs are ready at the start of the cycle
+                for dest in net.dests:
+                    if isinstance(dest, sources):
+                        continue
+                    for gate in dest_dict.get(dest, ()):
+                        waiting_on[gate] -= 1
+                        if not waiting_on[gate]:
+                            next_level.append(gate)
+            levels.append(tuple(level))
+            level = next_level
+
+        if len(net_level) != len(self.logic):
             from pyrtl.helperfuncs import find_and_print_loop
             find_and_print_loop(self)
             raise PyrtlError("Failure in Block Iterator due to non-register loops")
+        return tuple(levels), net_level
 
     def sanity_check(self):
         """ Check block and throw PyrtlError or PyrtlInternalError if there is an issue.
 
         Should not modify anything, only check data structures to make sure they have been
-        built according to the assumptions stated in the Block comments."""
+        built according to the assumptions stated in the Block comments.
+
+        After a successful check the block keeps track of the nets and wires that are
+        added, removed, or renamed, and the next check only looks at those (and the
+        wires they are connected to), returning right away if nothing has changed.
+        Changes made behind the block's back, such as setting the bitwidth of a wire
+        that has already been checked, will not be noticed by such a check."""
+        if (not debug_mode and self._dirty_nets is not None
+                and self._checked_legal_ops == self.legal_ops
+                and self._sanity_check_changes()):
+            return
+        self._sanity_check_all()
+        self._dirty_nets, self._dirty_wires = set(), set()
+        self._checked_mutation_count = self._mutation_count
+        self._checked_legal_ops = frozenset(self.legal_ops)
+
+    def _sanity_check_changes(self):
+        """ Check only the nets and wires that have changed since the last sanity_check.
+
+        Returns True if they are fine.  If anything might be wrong (or if so much has
+        changed that checking the whole block is just as fast) returns False, and
+        the full check should be done to find and report the problem."""
+        from .wire import Input, Const
+        nets, wires = self._dirty_nets, self._dirty_wires
+        if self._wire_extra_srcs or 2 * len(wires) > len(self.wirevector_set):
+            return False
+
+        try:
+            for net in nets:
+                self.sanity_check_net(net)
+        except (PyrtlError, PyrtlInternalError):
+            return False
 
+        for w in wires:
+            if w not in self.wirevector_set:
+                if w in self._wire_src or w in self._wire_sinks:
+                    return False  # removed from the block but still connected
+            elif w.bitwidth is None:
+                return False  # missing bitwidth
+            elif not _is_unnamed(w) and (self.wirevector_by_name.get(w._name) is not w or
+                                         self._get_unnamed_wirevector(w._name) is not None):
+                return False  # possible duplicate name
+            elif w not in self._wire_src and not isinstance(w, (Input, Const)):
+                return False  # either unconnected or used but never driven
+
+        if self._checked_mutation_count != self._mutation_count:
+            self.sanity_check_memory_sync()
+        nets.clear()
+        wires.clear()
+        self._checked_mutation_count = self._mutation_count
+        return True
+
+    def _sanity_check_all(self):
         # TODO: check that the wirevector_by_name is sane
         from .wire import Input, Const, Output
         from .helperfuncs import get_stack, get_stacks
@@ -389,9 +933,12 @@ class Block(object):
                 raise PyrtlError(
                     'error, missing bitwidth for WireVector "%s" \n\n %s' % (w.name, get_stack(w)))
 
-        # check for unique names
-        wirevector_names_set = set(x.name for x in self.wirevector_set)
-        if len(self.wirevector_set) != len(wirevector_names_set):
+        # check for unique names (the indices of temporaries are always unique, but
+        # a wire could have been given the same name as that made for a temporary)
+        named_wires = [x for x in self.wirevector_set if not _is_unnamed(x)]
+        wirevector_names_set = set(x._name for x in named_wires)
+        if len(named_wires) != len(wirevector_names_set) or any(
+                self._get_unnamed_wirevector(name) is not None for name in wirevector_names_set):
             wirevector_names_list = [x.name for x in self.wirevector_set]
             for w in wirevector_names_set:
                 wirevector_names_list.remove(w)
@@ -486,9 +1033,26 @@ class Block(object):
 
     def sanity_check_net(self, net):
         """ Check that net is a valid LogicNet. """
-        from .wire import Input, Output, Const
-        from .memory import _MemReadBase
-
+        self._sanity_check_net_fields(net)
+        for w in net.args + net.dests:
+            self._sanity_check_net_wire(w)
+        self._sanity_check_net_ops(net)
+
+    def _sanity_check_nets(self, nets):
+        """ Check that all of nets are valid, checking each wire used only once.
+
+        Assumes the fields of each net have already been checked (as add_net
+        does as each net is added under bulk_build)."""
+        wires = set()
+        for net in nets:
+            wires.update(net.args)
+            wires.update(net.dests)
+        for w in wires:
+            self._sanity_check_net_wire(w)
+        for net in nets:
+            self._sanity_check_net_ops(net)
+
+    def _sanity_check_net_fields(self, net):
         # general sanity checks that apply to all operations
         if not isinstance(net, LogicNet):
             raise PyrtlInternalError('error, net must be of type LogicNet')
@@ -496,12 +1060,17 @@ class Block(object):
             raise PyrtlInternalError('error, LogicNet args must be tuple')
         if not isinstance(net.dests, tuple):
             raise PyrtlInternalError('error, LogicNet dests must be tuple')
-        for w in net.args + net.dests:
-            self.sanity_check_wirevector(w)
-            if w._block is not self:
-                raise PyrtlInternalError('error, net references different block')
-            if w not in self.wirevector_set:
-                raise PyrtlInternalError('error, net with unknown source "%s"' % w.name)
+
+    def _sanity_check_net_wire(self, w):
+        self.sanity_check_wirevector(w)
+        if w._block is not self:
+            raise PyrtlInternalError('error, net references different block')
+        if w not in self.wirevector_set:
+            raise PyrtlInternalError('error, net with unknown source "%s"' % w.name)
+
+    def _sanity_check_net_ops(self, net):
+        from .wire import Input, Output, Const
+        from .memory import _MemReadBase
 
         # checks that input and output wirevectors are not misused
         for w in net.dests:
@@ -558,6 +1127,17 @@ class Block(object):
                 raise PyrtlInternalError('error, mem op requires first operand as int')
             if not isinstance(net.op_param[1], _MemReadBase):
                 raise PyrtlInternalError('error, mem op requires second operand of a memory type')
+        if net.op == 'h':
+            from .hierarchy import Module
+            if not isinstance(net.op_param, tuple) or len(net.op_param) != 2:
+                raise PyrtlInternalError('error, instance op requires 2 op_params in tuple')
+            if not isinstance(net.op_param[1], Module):
+                raise PyrtlInternalError('error, instance op requires second operand of Module')
+            module = net.op_param[1]
+            if [w.bitwidth for w in net.args] != [w.bitwidth for w in module.inputs]:
+                raise PyrtlInternalError('error, instance args do not match the module inputs')
+            if [w.bitwidth for w in net.dests] != [w.bitwidth for w in module.outputs]:
+                raise PyrtlInternalError('error, instance dests do not match the module outputs')
 
         # check destination validity
         if net.op in 'w~&|^nr' and net.dests[0].bitwidth > net.args[0].bitwidth:
@@ -580,6 +1160,24 @@ class Block(object):
             raise PyrtlInternalError('error, mem write dest should be empty tuple')
 
 
+class _BulkBuild(object):
+    """ Context returned by Block.bulk_build. """
+    def __init__(self, block):
+        self.block = block
+
+    def __enter__(self):
+        self.block._bulk_build_depth += 1
+        return self.block
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.block._bulk_build_depth -= 1
+        if self.block._bulk_build_depth == 0:
+            if exc_type is None:
+                self.block._check_bulk_build()
+            else:  # don't hide the original error behind a check failure
+                self.block._unchecked_wires, self.block._unchecked_nets = [], []
+
+
 class PostSynthBlock(Block):
     """ This is a block with extra metadata required to maintain the
     pre synthesis interface post synthesis
@@ -597,10 +1195,25 @@ class PostSynthBlock(Block):
 #    |/\| \__/ |  \ |  \ | | \| \__>    |__) |___ \__/ \__, |  \
 #
 
-# Right now we use singleton_block to store the one global
-# block, but in the future we should support multiple Blocks.
-# The argument "singleton_block" should never be passed.
-_singleton_block = Block()
+def _is_unnamed(wirevector):
+    """ True if wirevector is a temporary whose name is only made when asked for. """
+    return isinstance(wirevector._name, int)
+
+
+class _WorkingBlockState(threading.local):
+    """ The working block (and elaboration profiler), kept separately for each thread.
+
+    Each thread starts out with its own empty Block as its working block, so
+    independent designs can be elaborated in different threads (for example,
+    by the workers of a ThreadPoolExecutor) at the same time.  A Block (and
+    its wires and nets) should still only be changed by one thread at a time.
+    """
+    def __init__(self):
+        self.block = Block()
+        self.elaboration_profiler = None  # the active analysis.ElaborationProfiler, if any
+
+
+_working_block_state = _WorkingBlockState()
 
 # settings help tweak the behavior of pyrtl as needed, especially
 # when there is a trade off between speed and debugability.  These
@@ -654,7 +1267,7 @@ def working_block(block=None):
     """
 
     if block is None:
-        return _singleton_block
+        return _working_block_state.block
     elif not isinstance(block, Block):
         raise PyrtlError('error, expected instance of Block as block argument')
     else:
@@ -662,9 +1275,8 @@ def working_block(block=None):
 
 
 def reset_working_block():
-    """ Reset the working block to be empty. """
-    global _singleton_block
-    _singleton_block = Block()
+    """ Reset the working block (of the current thread) to be empty. """
+    _working_block_state.block = Block()
 
 
 class set_working_block(object):
@@ -672,18 +1284,18 @@ class set_working_block(object):
         Compatible with the 'with' statement
 
         Sanity checks will only be run if the new block is different
-        from the original block
+        from the original block.  Only the working block of the current
+        thread is changed.
     """
 
     @staticmethod
     def _set_working_block(block, no_sanity_check=False):
-        global _singleton_block
         if not isinstance(block, Block):
             raise PyrtlError('error, expected instance of Block as block argument')
-        if block is not _singleton_block:  # don't update if the blocks are the same
+        if block is not _working_block_state.block:  # don't update if the blocks are the same
             if not no_sanity_check:
                 block.sanity_check()
-            _singleton_block = block
+            _working_block_state.block = block
 
     def __init__(self, block, no_sanity_check=False):
         self.old_block = working_block()  # for with statement compatibility
@@ -713,16 +1325,35 @@ class _NameIndexer(object):
     """ Provides internal names that are based on a prefix and an index"""
     def __init__(self, internal_prefix='_sani_temp'):
         self.internal_prefix = internal_prefix
-        self.internal_index = 0
+        self._counter = itertools.count()
 
     def make_valid_string(self):
         """Build a valid string based on the prefix and internal index"""
         return self.internal_prefix + str(self.next_index())
 
     def next_index(self):
-        index = self.internal_index
-        self.internal_index += 1
-        return index
+        # next() on an itertools.count is atomic, so indices stay unique
+        # even when wires are being created in several threads at once
+        return next(self._counter)
+
+    def __getstate__(self):
+        # itertools.count cannot be pickled (in newer Pythons), so pickle the next index
+        state = self.__dict__.copy()
+        state['_counter'] = index = self.next_index()
+        self._counter = itertools.count(index)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._counter = itertools.count(state['_counter'])
+
+
+def _no_extra_checks(string):
+    return True
+
+
+def _is_not_keyword(string):
+    return not keyword.iskeyword(string)
 
 
 class _NameSanitizer(_NameIndexer):
@@ -737,13 +1368,13 @@ class _NameSanitizer(_NameIndexer):
 
     """
     def __init__(self, identifier_regex_str, internal_prefix='_sani_temp',
-                 map_valid_vals=True, extra_checks=lambda x: True, allow_duplicates=False):
+                 map_valid_vals=True, extra_checks=None, allow_duplicates=False):
         if identifier_regex_str[-1] != '$':
             identifier_regex_str += '$'
         self.identifier = re.compile(identifier_regex_str)
         self.val_map = {}
         self.map_valid = map_valid_vals
-        self.extra_checks = extra_checks
+        self.extra_checks = extra_checks or _no_extra_checks
         self.allow_dups = allow_duplicates
         super(_NameSanitizer, self).__init__(internal_prefix)
 
@@ -774,4 +1405,4 @@ class _PythonSanitizer(_NameSanitizer):
     """ Name Sanitizer specifically built for Python identifers"""
     def __init__(self, internal_prefix='_sani_temp', map_valid_vals=True):
         super(_PythonSanitizer, self).__init__(_py_regex, internal_prefix, map_valid_vals)
-        self.extra_checks = lambda s: not keyword.iskeyword(s)
+        self.extra_checks = _is_not_keyword
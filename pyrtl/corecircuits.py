@@ -15,8 +15,7 @@ Some stuff in CoreCircuits include:
 from __future__ import division
 from .pyrtlexceptions import PyrtlError
 from .helperfuncs import match_bitwidth, as_wires
-from .core import LogicNet, working_block
-from .wire import Const, WireVector
+from .wire import WireVector, _build_net, _interned_const
 
 
 def and_all_bits(vector):
@@ -95,7 +94,8 @@ def _basic_mult(A, B):
     if len(B) == 1:
         A, B = B, A  # so that we can reuse the code below :)
     if len(A) == 1:
-        return concat_list(list(A & b for b in B) + [Const(0)])  # keep WireVector len consistent
+        # the extra 0 keeps the WireVector len consistent
+        return concat_list(list(A & b for b in B) + [_interned_const(0)])
 
     result_bitwidth = len(A) + len(B)
     bits = [[] for weight in range(result_bitwidth)]
@@ -119,7 +119,7 @@ def _basic_mult(A, B):
         bits = deferred[:result_bitwidth]
 
     import six
-    add_wires = tuple(six.moves.zip_longest(*bits, fillvalue=Const(0)))
+    add_wires = tuple(six.moves.zip_longest(*bits, fillvalue=_interned_const(0)))
     adder_result = concat_list(add_wires[0]) + concat_list(add_wires[1])
     return adder_result[:result_bitwidth]
 
@@ -255,11 +255,7 @@ def select(sel, truecase, falsecase):
     """
     sel, f, t = (as_wires(w) for w in (sel, falsecase, truecase))
     f, t = match_bitwidth(f, t)
-    outwire = WireVector(bitwidth=len(f))
-
-    net = LogicNet(op='x', op_param=None, args=(sel, f, t), dests=(outwire,))
-    working_block().add_net(net)  # this includes sanity check on the mux
-    return outwire
+    return _build_net('x', None, (sel, f, t), len(f))  # includes sanity check on the mux
 
 
 def concat(*args):
@@ -279,14 +275,7 @@ def concat(*args):
 
     arg_wirevectors = tuple(as_wires(arg) for arg in args)
     final_width = sum(len(arg) for arg in arg_wirevectors)
-    outwire = WireVector(bitwidth=final_width)
-    net = LogicNet(
-        op='c',
-        op_param=None,
-        args=arg_wirevectors,
-        dests=(outwire,))
-    working_block().add_net(net)
-    return outwire
+    return _build_net('c', None, arg_wirevectors, final_width)
 
 
 def concat_list(wire_list):
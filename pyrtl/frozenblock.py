@@ -0,0 +1,427 @@
+"""
+FrozenBlock is a compact, immutable snapshot of a Block.
+
+A normal Block stores every net as a LogicNet inside a Python set and every
+wire as a full WireVector object, which is very convenient while the design
+is being built but costs hundreds of bytes per wire.  For very large designs
+(such as the result of synthesis) a FrozenBlock stores the same netlist in a
+"struct of arrays" layout instead:
+
+* wires are identified by integer ids, with their names, bitwidths and kinds
+  held in parallel columns
+* the op of each net, and the args and dests of each net, are held in `array`
+  columns, with the args and dests stored "CSR style" (one flat list of wire
+  ids per field plus a list of offsets into it)
+* nets are stored in the order they were inserted into the Block, so the same
+  design always produces the same FrozenBlock
+
+Block remains the mutable front end: `FrozenBlock(block)` takes a snapshot
+and `FrozenBlock.to_block()` builds a new Block from it.
+
+The same layout is used by `save_block` and `load_block` to store a Block in a
+compact binary file, so that a big design can be elaborated once and then
+reloaded quickly: the columns are written out as raw arrays, which on load are
+memory mapped rather than parsed.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import mmap
+import pickle
+import struct
+import sys
+import types
+from array import array
+
+import six
+
+from .pyrtlexceptions import PyrtlError
+from .core import working_block, LogicNet, Block, PostSynthBlock
+from .wire import Const
+from .memory import MemBlock, RomBlock
+from .transform import _get_new_block_mem_instance
+
+
+_OPS = 'w~&|^n+-*<>=xcsrm@h'
+_OP_CODES = {op: code for code, op in enumerate(_OPS)}
+# an unsigned array type that can hold any wire id, offset, or bitwidth
+_INDEX_TYPE = 'I' if array('I').itemsize >= 4 else 'L'
+
+
+class FrozenBlock(object):
+    """ An immutable snapshot of a Block stored as flat arrays.
+
+    The members of a FrozenBlock are:
+
+    * `wire_names`, `wire_bitwidths` and `wire_kinds` -- the name, bitwidth,
+      and class (as an index into `wire_classes`) of each wire, indexed by wire id
+    * `const_vals` -- map from the wire id of each Const to its value
+    * `net_ops` -- the op of each net, as an index into the string FrozenBlock.OPS
+    * `net_params` -- map from net index to op_param, for the nets that have one
+      (memory ops store the index of their memory in `mems` in place of the memory)
+    * `arg_offsets`, `arg_ids` -- the args of net i are
+      arg_ids[arg_offsets[i]:arg_offsets[i+1]], and likewise for
+      `dest_offsets` and `dest_ids`
+    * `mems` -- the memories (MemBlocks and RomBlocks) referenced by the nets
+
+    along with `legal_ops`, `rtl_asserts`, and (for a PostSynthBlock) the
+    `io_map` and `mem_map` with the values replaced by wire ids and memory
+    indices respectively.
+    """
+
+    OPS = _OPS
+
+    __slots__ = ('block_class', 'legal_ops', 'wire_names', 'wire_bitwidths', 'wire_kinds',
+                 'wire_classes', 'const_vals', 'net_ops', 'net_params', 'arg_offsets',
+                 'arg_ids', 'dest_offsets', 'dest_ids', 'mems', 'rtl_asserts', 'io_map',
+                 'mem_map', '_ids_by_name')
+
+    def __init__(self, block=None):
+        """ Take a snapshot of block (defaults to the working block). """
+        block = working_block(block)
+        self.block_class = block.__class__
+        self.legal_ops = frozenset(block.legal_ops)
+        self._ids_by_name = None
+
+        wire_ids = {}
+        self.wire_names = []
+        self.wire_bitwidths = array(_INDEX_TYPE)
+        self.wire_kinds = array('B')
+        self.wire_classes = []
+        self.const_vals = {}
+
+        def wire_id(w):
+            if w not in wire_ids:
+                wire_ids[w] = len(self.wire_names)
+                if w.__class__ not in self.wire_classes:
+                    self.wire_classes.append(w.__class__)
+                if isinstance(w, Const):
+                    self.const_vals[wire_ids[w]] = w.val
+                self.wire_names.append(w.name)
+                self.wire_bitwidths.append(w.bitwidth)
+                self.wire_kinds.append(self.wire_classes.index(w.__class__))
+            return wire_ids[w]
+
+        mem_ids = {}
+
+        def mem_id(mem):
+            if mem not in mem_ids:
+                mem_ids[mem] = len(self.mems)
+                self.mems.append(mem)
+            return mem_ids[mem]
+
+        self.net_ops = array('B')
+        self.net_params = {}
+        self.arg_offsets = array(_INDEX_TYPE, [0])
+        self.arg_ids = array(_INDEX_TYPE)
+        self.dest_offsets = array(_INDEX_TYPE, [0])
+        self.dest_ids = array(_INDEX_TYPE)
+        self.mems = []
+
+        for net in block._nets_in_order():
+            if net.op in 'm@':
+                memid, mem = net.op_param
+                self.net_params[len(self.net_ops)] = (memid, mem_id(mem))
+            elif net.op_param is not None:
+                self.net_params[len(self.net_ops)] = net.op_param
+            self.net_ops.append(_OP_CODES[net.op])
+            self.arg_ids.extend(wire_id(w) for w in net.args)
+            self.arg_offsets.append(len(self.arg_ids))
+            self.dest_ids.extend(wire_id(w) for w in net.dests)
+            self.dest_offsets.append(len(self.dest_ids))
+
+        # wires not connected to any net are given ids after all the others
+        for w in sorted(block.wirevector_set.difference(wire_ids), key=lambda w: w.name):
+            wire_id(w)
+
+        self.rtl_asserts = tuple((wire_id(w), exp) for w, exp in block.rtl_assert_dict.items())
+        if isinstance(block, PostSynthBlock):
+            self.io_map = {orig: wire_id(w) for orig, w in block.io_map.items()}
+            self.mem_map = {orig: mem_id(mem) for orig, mem in block.mem_map.items()}
+        else:
+            self.io_map = self.mem_map = None
+
+    def __len__(self):
+        """ The number of nets in the block. """
+        return len(self.net_ops)
+
+    @property
+    def num_wires(self):
+        return len(self.wire_names)
+
+    def op(self, i):
+        """ Return the op (as a single character string) of net i. """
+        return _OPS[self.net_ops[i]]
+
+    def op_param(self, i):
+        """ Return the op_param of net i (memory ops will have a memory index). """
+        return self.net_params.get(i)
+
+    def args(self, i):
+        """ Return the wire ids of the args of net i. """
+        return self.arg_ids[self.arg_offsets[i]:self.arg_offsets[i+1]]
+
+    def dests(self, i):
+        """ Return the wire ids of the dests of net i. """
+        return self.dest_ids[self.dest_offsets[i]:self.dest_offsets[i+1]]
+
+    def nets(self):
+        """ Generate a tuple (op, op_param, args, dests) for each net in order.
+
+        The args and dests are tuples of wire ids."""
+        arg_ids, dest_ids = self.arg_ids, self.dest_ids
+        arg_offsets, dest_offsets = self.arg_offsets, self.dest_offsets
+        for i, code in enumerate(self.net_ops):
+            yield (_OPS[code], self.net_params.get(i),
+                   tuple(arg_ids[arg_offsets[i]:arg_offsets[i+1]]),
+                   tuple(dest_ids[dest_offsets[i]:dest_offsets[i+1]]))
+
+    def wire_class(self, wire_id):
+        """ Return the WireVector class (Input, Register, etc.) of the wire. """
+        return self.wire_classes[self.wire_kinds[wire_id]]
+
+    def wire_id(self, name):
+        """ Return the id of the wire with the given name (or None if there is none). """
+        if self._ids_by_name is None:
+            self._ids_by_name = {name: i for i, name in enumerate(self.wire_names)}
+        return self._ids_by_name.get(name)
+
+    def to_block(self):
+        """ Build and return a new (mutable) Block equivalent to this snapshot.
+
+        The new block has new wires with the same names, kinds, and bitwidths,
+        and new copies of any memories (with the same memory ids).
+        """
+        block = self.block_class()
+        block.legal_ops = set(self.legal_ops)
+
+        with block.bulk_build():
+            wires = []
+            for i, name in enumerate(self.wire_names):
+                cls, bitwidth = self.wire_class(i), self.wire_bitwidths[i]
+                if issubclass(cls, Const):
+                    w = cls(self.const_vals[i], bitwidth=bitwidth, block=block)
+                    w.name = name
+                else:
+                    w = cls(bitwidth=bitwidth, name=name, block=block)
+                wires.append(w)
+
+            mem_copies = {}
+
+            def mem_copy(mem_index):
+                mem = self.mems[mem_index]
+                return _get_new_block_mem_instance((mem.id, mem), mem_copies, block)[1]
+
+            for op, param, args, dests in self.nets():
+                if op in 'm@':
+                    param = (param[0], mem_copy(param[1]))
+                net = LogicNet(op, param, tuple(wires[a] for a in args),
+                               tuple(wires[d] for d in dests))
+                block.add_net(net)
+
+        block.rtl_assert_dict = {wires[w]: exp for w, exp in self.rtl_asserts}
+        if self.io_map is not None:
+            block.io_map = {orig: wires[w] for orig, w in self.io_map.items()}
+            block.mem_map = {orig: mem_copy(m) for orig, m in self.mem_map.items()}
+        return block
+
+
+# ---- saving and loading blocks ----
+
+_FILE_MAGIC = b'PYRTLBLK'
+_FILE_VERSION = 1
+_FILE_HEADER = struct.Struct(str('<8sIQ'))  # magic, version, length of the metadata
+_ARRAY_FIELDS = ('wire_bitwidths', 'wire_kinds', 'net_ops', 'arg_offsets', 'arg_ids',
+                 'dest_offsets', 'dest_ids')
+
+
+def _align(n):
+    """ Round n up to a multiple of 8 (so every array in the file is aligned). """
+    return (n + 7) & ~7
+
+
+def _column_bytes(column):
+    """ Return the raw bytes of an array (or memoryview) column. """
+    if hasattr(column, 'tobytes'):
+        return column.tobytes()
+    return column.tostring()
+
+
+def _describe_wire(w):
+    return w.__class__, w.name, w.bitwidth
+
+
+def _describe_mem(mem):
+    """ Return (class, id, constructor arguments) for a MemBlock or RomBlock. """
+    kwargs = dict(bitwidth=mem.bitwidth, addrwidth=mem.addrwidth, name=mem.name,
+                  max_read_ports=mem.max_read_ports, asynchronous=mem.asynchronous)
+    if isinstance(mem, RomBlock):
+        data = mem.data
+        if isinstance(data, types.FunctionType):  # functions can't be saved, so save the values
+            data = [mem._get_read_data(addr) for addr in range(2**mem.addrwidth)]
+        kwargs['romdata'] = data
+    elif isinstance(mem, MemBlock):
+        kwargs['max_write_ports'] = mem.max_write_ports
+    return mem.__class__, mem.id, kwargs
+
+
+def save_block(dest_file, block=None):
+    """ Save a block to a compact binary file that can be loaded with load_block.
+
+    :param dest_file: a file name, or a file object open for writing in binary mode
+    :param block: the Block (or FrozenBlock) to save, defaults to the working block
+
+    Each wire is stored as an integer id, with the names of all the wires
+    stored once as a single string, and the net tables are stored as raw
+    arrays.  The memories (including the contents of RomBlocks), the
+    rtl_asserts, and for a PostSynthBlock the io_map and mem_map are saved as
+    well.  The keys of io_map and mem_map are wires and memories of another
+    block, so only a description of each (name, bitwidth, etc.) is saved.
+
+    The rest of the metadata is stored with pickle, so, as with pickle, only
+    load files from sources that you trust.
+    """
+    frozen = block if isinstance(block, FrozenBlock) else FrozenBlock(block)
+    if _OP_CODES['h'] in frozen.net_ops:
+        raise PyrtlError('error, cannot save a block with module instances '
+                         '(flatten it first with pyrtl.flatten)')
+    names = '\0'.join(frozen.wire_names)
+    if names.count('\0') != max(frozen.num_wires - 1, 0):
+        raise PyrtlError('error, cannot save a wire name containing a null character')
+
+    # each section is (typecode, itemsize, raw bytes); the names are just a string
+    sections = {'wire_names': (None, 1, names.encode('utf-8'))}
+    for field in _ARRAY_FIELDS:
+        column = getattr(frozen, field)  # an array, or a memoryview if loaded from a file
+        typecode = getattr(column, 'typecode', None) or column.format
+        sections[field] = (typecode, column.itemsize, _column_bytes(column))
+
+    data = []
+    offset = 0
+    for field in sorted(sections):
+        typecode, itemsize, raw = sections[field]
+        sections[field] = (typecode, itemsize, offset, len(raw))
+        data.append(raw + b'\0' * (_align(len(raw)) - len(raw)))
+        offset += _align(len(raw))
+
+    meta = {
+        'byteorder': sys.byteorder,
+        'sections': sections,
+        'block_class': frozen.block_class,
+        'legal_ops': frozen.legal_ops,
+        'wire_classes': frozen.wire_classes,
+        'const_vals': frozen.const_vals,
+        'net_params': frozen.net_params,
+        'mems': [_describe_mem(mem) for mem in frozen.mems],
+        'rtl_asserts': frozen.rtl_asserts,
+        'io_map': None, 'mem_map': None}
+    if frozen.io_map is not None:
+        meta['io_map'] = [(_describe_wire(w), i) for w, i in frozen.io_map.items()]
+        meta['mem_map'] = [(_describe_mem(mem), i) for mem, i in frozen.mem_map.items()]
+    meta = pickle.dumps(meta, 2)
+    header_size = _FILE_HEADER.size + len(meta)
+
+    def write(f):
+        f.write(_FILE_HEADER.pack(_FILE_MAGIC, _FILE_VERSION, len(meta)))
+        f.write(meta)
+        f.write(b'\0' * (_align(header_size) - header_size))
+        for raw in data:
+            f.write(raw)
+
+    if isinstance(dest_file, six.string_types):
+        with open(dest_file, 'wb') as f:
+            write(f)
+    else:
+        write(dest_file)
+
+
+def _map_file(f):
+    """ Return the contents of f, memory mapped if possible. """
+    try:
+        if f.tell() == 0:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, EnvironmentError, ValueError):
+        pass  # not a real file (e.g. a BytesIO), so just read it
+    return f.read()
+
+
+def _load_column(buf, typecode, itemsize, swap):
+    """ Return an array-like view of a column, without copying it where possible. """
+    if array(typecode).itemsize != itemsize:
+        raise PyrtlError('error, block file uses an unsupported array size')
+    if not swap and hasattr(buf, 'cast'):
+        return buf.cast(str(typecode))
+    column = array(str(typecode))
+    if hasattr(column, 'frombytes'):
+        column.frombytes(buf.tobytes())
+    else:
+        column.fromstring(buf.tobytes())
+    if swap:
+        column.byteswap()
+    return column
+
+
+def load_block(src_file, frozen=False):
+    """ Load a block saved by save_block.
+
+    :param src_file: a file name, or a file object open for reading in binary mode
+    :param frozen: if True, return the FrozenBlock read from the file (whose
+        net tables are memory mapped from the file) rather than building a Block
+    :return: the loaded Block (which is not made the working block)
+
+    New wires and memories are created for the loaded block.  For a
+    PostSynthBlock, the keys of io_map and mem_map are also new wires and
+    memories (with the same names, bitwidths, and kinds as the originals)
+    which belong to a separate block of their own.
+    """
+    if isinstance(src_file, six.string_types):
+        with open(src_file, 'rb') as f:
+            buf = _map_file(f)
+    else:
+        buf = _map_file(src_file)
+
+    if len(buf) < _FILE_HEADER.size:
+        raise PyrtlError('error, file is not a saved PyRTL block')
+    magic, version, meta_len = _FILE_HEADER.unpack_from(buf, 0)
+    if magic != _FILE_MAGIC:
+        raise PyrtlError('error, file is not a saved PyRTL block')
+    if version != _FILE_VERSION:
+        raise PyrtlError('error, unsupported block file version %d' % version)
+    meta = pickle.loads(buf[_FILE_HEADER.size:_FILE_HEADER.size + meta_len])
+    data = memoryview(buf)[_align(_FILE_HEADER.size + meta_len):]
+    swap = meta['byteorder'] != sys.byteorder
+
+    result = FrozenBlock.__new__(FrozenBlock)
+    for field, (typecode, itemsize, offset, length) in meta['sections'].items():
+        section = data[offset:offset + length]
+        if field == 'wire_names':
+            names = section.tobytes().decode('utf-8')
+            intern = getattr(sys, 'intern', None)
+            names = names.split('\0') if names else []
+            result.wire_names = [intern(n) for n in names] if intern else names
+        else:
+            setattr(result, field, _load_column(section, typecode, itemsize, swap))
+
+    stand_ins = Block()  # the block holding the keys of io_map and mem_map
+
+    def make_mem(description, block):
+        cls, memid, kwargs = description
+        mem = cls(block=block, **kwargs)
+        mem.id = memid
+        return mem
+
+    result.block_class = meta['block_class']
+    result.legal_ops = meta['legal_ops']
+    result.wire_classes = meta['wire_classes']
+    result.const_vals = meta['const_vals']
+    result.net_params = meta['net_params']
+    result.mems = [make_mem(description, stand_ins) for description in meta['mems']]
+    result.rtl_asserts = meta['rtl_asserts']
+    result.io_map = result.mem_map = None
+    result._ids_by_name = None
+    if meta['io_map'] is not None:
+        result.io_map = {cls(bitwidth=bitwidth, name=name, block=stand_ins): i
+                         for (cls, name, bitwidth), i in meta['io_map']}
+        result.mem_map = {make_mem(description, stand_ins): i
+                          for description, i in meta['mem_map']}
+    return result if frozen else result.to_block()
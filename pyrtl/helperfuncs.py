@@ -15,7 +15,7 @@ import math
 
 from .core import working_block, _NameIndexer
 from .pyrtlexceptions import PyrtlError, PyrtlInternalError
-from .wire import WireVector, Input, Output, Const, Register
+from .wire import WireVector, Input, Output, Const, Register, _interned_const
 from pyrtl.rtllib import barrel
 
 # -----------------------------------------------------------------
@@ -133,7 +133,7 @@ def as_wires(val, bitwidth=None, truncating=True, block=None):
 
     if isinstance(val, (int, six.string_types)):
         # note that this case captures bool as well (as bools are instances of ints)
-        return Const(val, bitwidth=bitwidth, block=block)
+        return _interned_const(val, bitwidth=bitwidth, block=block)
     elif isinstance(val, _MemIndexed):
         # convert to a memory read when the value is actually used
         if val.wire is None:
@@ -253,7 +253,7 @@ def shift_right_arithmetic(bits_to_shift, shift_amount):
     """
     a, shamt = _check_shift_inputs(bits_to_shift, shift_amount)
     bit_in = bits_to_shift[-1]  # shift in sign_bit
-    dir = Const(0)  # shift right
+    dir = _interned_const(0)  # shift right
     return barrel.barrel_shifter(bits_to_shift, bit_in, dir, shift_amount)
 
 
@@ -271,8 +271,8 @@ def shift_left_logical(bits_to_shift, shift_amount):
     `shift_amount` is treated as unsigned.
     """
     a, shamt = _check_shift_inputs(bits_to_shift, shift_amount)
-    bit_in = Const(0)  # shift in a 0
-    dir = Const(1)  # shift left
+    bit_in = _interned_const(0)  # shift in a 0
+    dir = _interned_const(1)  # shift left
     return barrel.barrel_shifter(bits_to_shift, bit_in, dir, shift_amount)
 
 
@@ -290,8 +290,8 @@ def shift_right_logical(bits_to_shift, shift_amount):
     the "sign bit".  Note that `shift_amount` is treated as unsigned.
     """
     a, shamt = _check_shift_inputs(bits_to_shift, shift_amount)
-    bit_in = Const(0)  # shift in a 0
-    dir = Const(0)  # shift right
+    bit_in = _interned_const(0)  # shift in a 0
+    dir = _interned_const(0)  # shift right
     return barrel.barrel_shifter(bits_to_shift, bit_in, dir, shift_amount)
 
 
@@ -405,90 +405,89 @@ def check_rtl_assertions(sim):
             pass
 
 
-def _check_for_loop(block=None):
-    block = working_block(block)
-    logic_left = block.logic.copy()
-    wires_left = block.wirevector_subset(exclude=(Input, Const, Output, Register))
-    prev_logic_left = len(logic_left) + 1
-    while prev_logic_left > len(logic_left):
-        prev_logic_left = len(logic_left)
-        nets_to_remove = set()  # bc it's not safe to mutate a set inside its own iterator
-        for net in logic_left:
-            if not any(n_wire in wires_left for n_wire in net.args):
-                nets_to_remove.add(net)
-                wires_left.difference_update(net.dests)
-        logic_left -= nets_to_remove
-
-    if 0 == len(logic_left):
-        return None
-    return wires_left, logic_left
+def find_loops(block=None):
+    """ Find every combinational loop (a loop that does not pass through a register).
 
+    :param block: the block to search (defaults to the working block)
+    :return: a list of loops, each of which is a list of the LogicNets in one
+      strongly connected component of the combinational connections between
+      nets (so every net in a loop is on a cycle through the others)
 
-def find_loop(block=None):
+    Runs Tarjan's algorithm over the nets, so it takes time linear in the
+    number of nets and wires.  The result is empty if there are no loops.
+    """
     block = working_block(block)
     block.sanity_check()  # make sure that the block is sane first
+    wire_sinks = block.net_connections()[1]
 
-    result = _check_for_loop(block)
-    if not result:
-        return
-    wires_left, logic_left = result
-    import random
-
-    class _FilteringState(object):
-        def __init__(self, dst_w):
-            self.dst_w = dst_w
-            self.arg_num = -1
-
-    def dead_end():
-        # clean up after a wire is found to not be part of the loop
-        wires_left.discard(cur_item.dst_w)
-        current_wires.discard(cur_item.dst_w)
-        del checking_stack[-1]
+    def successors(net):
+        if net.op == 'r':
+            return []  # the output of a register is not combinationally dependent
+        return [sink for dest in net.dests for sink in wire_sinks.get(dest, ())]
 
-    # now making a map to quickly look up nets
-    dest_nets = {dest_w: net_ for net_ in logic_left for dest_w in net_.dests}
-    initial_w = random.sample(wires_left, 1)[0]
+    index = {}  # map from net -> order in which it was first visited
+    lowlink = {}  # map from net -> lowest index reachable from it on the stack
+    stack = []
+    on_stack = set()
+    loops = []
 
-    current_wires = set()
-    checking_stack = [_FilteringState(initial_w)]
+    def visit(net):
+        index[net] = lowlink[net] = len(index)
+        stack.append(net)
+        on_stack.add(net)
+        return net, iter(successors(net))
 
     # we don't use a recursive method as Python has a limited stack (default: 999 frames)
-    while len(checking_stack):
-        cur_item = checking_stack[-1]
-        if cur_item.arg_num == -1:
-            #  first time testing this item
-            if cur_item.dst_w not in wires_left:
-                dead_end()
-                continue
-            current_wires.add(cur_item.dst_w)
-            cur_item.net = dest_nets[cur_item.dst_w]
-            if cur_item.net.op == 'r':
-                dead_end()
-                continue
-        cur_item.arg_num += 1  # go to the next item
-        if cur_item.arg_num == len(cur_item.net.args):
-            dead_end()
+    for root in block._nets_in_order():
+        if root in index:
             continue
-        next_wire = cur_item.net.args[cur_item.arg_num]
-        if next_wire not in current_wires:
-            current_wires.add(next_wire)
-            checking_stack.append(_FilteringState(next_wire))
-        else:  # We have found the loop!!!!!
-            loop_info = []
-            for f_state in reversed(checking_stack):
-                loop_info.append(f_state)
-                if f_state.dst_w is next_wire:
+        work = [visit(root)]
+        while work:
+            net, children = work[-1]
+            for child in children:
+                if child not in index:
+                    work.append(visit(child))
                     break
+                elif child in on_stack:
+                    lowlink[net] = min(lowlink[net], index[child])
             else:
-                raise PyrtlError("Shouldn't get here! Couldn't figure out the loop")
-            return loop_info
-    raise PyrtlError("Error in detecting loop")
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[net])
+                if lowlink[net] == index[net]:
+                    component = []
+                    while True:
+                        n = stack.pop()
+                        on_stack.discard(n)
+                        component.append(n)
+                        if n is net:
+                            break
+                    if len(component) > 1 or net in successors(net):
+                        component.reverse()
+                        loops.append(component)
+    return loops
+
+
+def find_loop(block=None):
+    """ Find a combinational loop in the block.
+
+    :param block: the block to search (defaults to the working block)
+    :return: a list of the LogicNets in one loop (as in find_loops), or None
+      if there are no loops
+    """
+    loops = find_loops(block)
+    return loops[0] if loops else None
 
 
 def find_and_print_loop(block=None):
-    loop_data = find_loop(block)
-    print_loop(loop_data)
-    return loop_data
+    """ Print every combinational loop in the block, and return one of them (as find_loop). """
+    loops = find_loops(block)
+    if not loops:
+        print_loop(None)
+    for loop_data in loops:
+        print_loop(loop_data)
+    return loops[0] if loops else None
 
 
 def print_loop(loop_data):
@@ -496,8 +495,7 @@ def print_loop(loop_data):
         print("No Loop Found")
     else:
         print("Loop found:")
-        print('\n'.join("{}".format(fs.net) for fs in loop_data))
-        # print '\n'.join("{} (dest wire: {})".format(fs.net, fs.dst_w) for fs in loop_info)
+        print('\n'.join("{}".format(net) for net in loop_data))
         print("")
 
 
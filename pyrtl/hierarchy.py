@@ -0,0 +1,230 @@
+"""
+Hierarchy allows hardware to be defined once and instantiated many times.
+
+Included in this file you will find:
+
+* `Module` -- a Block, with its Inputs and Outputs as ports, that can be instantiated
+* `flatten` -- replace every instance in a block with a copy of the logic of its module
+
+An instance is a single net (op 'h') that refers to the definition of its
+module rather than a copy of its logic, so a design built from many copies of
+the same module costs memory in proportion to its unique logic.  Simulation
+and FastSimulation simulate instances directly (FastSimulation compiles each
+module only once), OutputToVerilog outputs one verilog module per Module, and
+the block of a module can be optimized like any other block.  Anything else
+(such as synthesis) works on a flattened copy of the design.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import six
+
+from .pyrtlexceptions import PyrtlError
+from .core import LogicNet, Block, working_block, set_working_block, _NameIndexer
+from .wire import WireVector, Input, Output, Const
+from .helperfuncs import as_wires
+
+
+class Module(object):
+    """ A piece of hardware that is defined once and can be instantiated many times.
+
+    The definition of a module is an ordinary Block (module.block), and the
+    Inputs and Outputs of that block are the ports of the module.  Build the
+    definition under `definition()` (or pass in an existing block), and then
+    call `instantiate` to add instances of it to other blocks::
+
+        adder = pyrtl.Module('adder')
+        with adder.definition():
+            a, b = pyrtl.Input(8, 'a'), pyrtl.Input(8, 'b')
+            s = pyrtl.Output(9, 's')
+            s <<= a + b
+
+        total = adder.instantiate({'a': x, 'b': y})['s']
+
+    Each instance adds one net to the block, with the op 'h', the op_param
+    (instance name, module), and the wires connected to the ports of the
+    module as its args and dests (in the order of module.inputs and
+    module.outputs).  The outputs of an instance are treated as depending
+    combinationally on all of its inputs, so any feedback from the outputs of
+    an instance back to its inputs must go through a register outside of the
+    instance.  Once a module has been instantiated its ports are fixed, and
+    the definition can no longer be changed with `definition()`.
+    """
+
+    def __init__(self, name, block=None):
+        """ Create a new module.
+
+        :param name: the name of the module (used for the verilog module, and
+          as the default prefix of the names of its instances)
+        :param block: the Block defining the module (defaults to a new, empty Block)
+        """
+        if not isinstance(name, six.string_types):
+            raise PyrtlError('error, module name must be a string')
+        self.name = name
+        self.block = Block() if block is None else working_block(block)
+        self._ports = None  # (inputs, outputs), fixed once the module is instantiated
+        self._instance_names = _NameIndexer(name + '_')
+
+    def __str__(self):
+        return self.name
+
+    def definition(self):
+        """ Return a context under which the block of the module is the working block. """
+        if self._ports is not None:
+            raise PyrtlError('error, module "%s" cannot be redefined once it has been '
+                             'instantiated' % self.name)
+        return set_working_block(self.block, no_sanity_check=True)
+
+    @property
+    def inputs(self):
+        """ The Inputs of the module, sorted by name. """
+        return self._get_ports()[0]
+
+    @property
+    def outputs(self):
+        """ The Outputs of the module, sorted by name. """
+        return self._get_ports()[1]
+
+    def _get_ports(self):
+        if self._ports is None:
+            self.block.sanity_check()
+
+            def ports(cls):
+                return tuple(sorted(self.block.wirevector_subset(cls), key=lambda w: w.name))
+            self._ports = ports(Input), ports(Output)
+        return self._ports
+
+    def instantiate(self, inputs, name=None, block=None):
+        """ Add an instance of the module to a block.
+
+        :param inputs: a dictionary mapping the name of each input of the module
+          to the value (a WireVector, or anything as_wires accepts) connected to it
+        :param name: the name of the instance (defaults to the name of the module
+          followed by a number)
+        :param block: the block to add the instance to (defaults to the working block)
+        :return: a dictionary mapping the name of each output of the module to a
+          new WireVector carrying its value
+
+        Values narrower than the input they are connected to are zero extended.
+        """
+        block = working_block(block)
+        if block is self.block:
+            raise PyrtlError('error, module "%s" cannot be instantiated in its own '
+                             'definition' % self.name)
+
+        values = {}
+        for port, value in inputs.items():
+            port_name = port.name if isinstance(port, WireVector) else port
+            values[port_name] = value
+        port_names = set(w.name for w in self.inputs)
+        for port_name in values:
+            if port_name not in port_names:
+                raise PyrtlError('error, module "%s" has no input named "%s"'
+                                 % (self.name, port_name))
+        for port_name in port_names:
+            if port_name not in values:
+                raise PyrtlError('error, no value given for input "%s" of module "%s"'
+                                 % (port_name, self.name))
+
+        if name is None:
+            name = self._instance_names.make_valid_string()
+        with set_working_block(block, no_sanity_check=True):
+            args = []
+            for port in self.inputs:
+                arg = as_wires(values[port.name], bitwidth=port.bitwidth, truncating=False,
+                               block=block)
+                if arg.bitwidth > port.bitwidth:
+                    raise PyrtlError('error, value for input "%s" of module "%s" is wider '
+                                     'than %d bits' % (port.name, self.name, port.bitwidth))
+                args.append(arg)
+            dests = tuple(WireVector(bitwidth=port.bitwidth, block=block)
+                          for port in self.outputs)
+            block.add_net(LogicNet('h', (name, self), tuple(args), dests))
+        return {port.name: dest for port, dest in zip(self.outputs, dests)}
+
+
+def _modules_in_order(block):
+    """ Return the Modules instantiated under block, each one after those it instantiates. """
+    modules = []
+    seen = set()
+
+    def visit(b):
+        for net in b.logic_subset('h'):
+            module = net.op_param[1]
+            if module not in seen:
+                seen.add(module)
+                visit(module.block)
+                modules.append(module)
+
+    visit(block)
+    return modules
+
+
+def flatten(block=None):
+    """ Replace each instance in the block with a copy of the logic of its module.
+
+    :param block: the block to flatten (defaults to the working block)
+
+    Instances inside of the modules are flattened as well, so the resulting
+    block has no 'h' nets.  The wires copied into the block for an instance
+    are named "<instance name>_<wire name>" (so wires of nested instances are
+    prefixed with each level of the hierarchy, and a numeric suffix is added
+    if a wire in the block already has that name), except for the inputs and
+    outputs of the module, which are replaced by the wires the instance
+    connects to them.  Each instance gets its own copy of any memories in the
+    module.
+    """
+    block = working_block(block)
+    with set_working_block(block, no_sanity_check=True), block.bulk_build():
+        instances = list(block.logic_subset('h'))
+        while instances:
+            instances.extend(_inline_instance(instances.pop(), block))
+
+
+def _inline_instance(net, block):
+    """ Replace an instance net with a copy of its logic, returning any instances in the copy. """
+    inst_name, module = net.op_param
+    block.remove_net(net)
+
+    wire_map = dict(zip(module.inputs, net.args))
+    wire_map.update(zip(module.outputs, net.dests))
+    for w in module.block.wirevector_set:
+        if w in wire_map:
+            continue
+        elif isinstance(w, Const):
+            wire_map[w] = Const(w.val, bitwidth=w.bitwidth, block=block)
+        else:
+            name = _free_wire_name(block, '%s_%s' % (inst_name, w.name))
+            wire_map[w] = w.__class__(bitwidth=w.bitwidth, name=name, block=block)
+
+    mem_map = {}
+    nested = []
+    for n in module.block.logic:
+        op_param = n.op_param
+        if n.op in 'm@':
+            mem = op_param[1]
+            if mem not in mem_map:  # a new memory (with a new id) for each instance
+                mem_map[mem] = mem._make_copy(block)
+                mem_map[mem].name = '%s_%s' % (inst_name, mem.name)
+            op_param = (mem_map[mem].id, mem_map[mem])
+        elif n.op == 'h':
+            op_param = ('%s_%s' % (inst_name, op_param[0]), op_param[1])
+        new_net = LogicNet(n.op, op_param, tuple(wire_map[w] for w in n.args),
+                           tuple(wire_map[w] for w in n.dests))
+        block.add_net(new_net)
+        if n.op == 'h':
+            nested.append(new_net)
+
+    for w, exp in module.block.rtl_assert_dict.items():
+        block.rtl_assert_dict[wire_map[w]] = exp
+    return nested
+
+
+def _free_wire_name(block, name):
+    """ Return name, or if a wire in block already has it, name with the first free suffix. """
+    suffix = 0
+    free_name = name
+    while free_name in block.wirevector_by_name:
+        suffix += 1
+        free_name = '%s_%d' % (name, suffix)
+    return free_name
@@ -11,10 +11,11 @@ import re
 import collections
 
 from .pyrtlexceptions import PyrtlError, PyrtlInternalError
-from .core import working_block, _NameSanitizer
+from .core import working_block, _NameSanitizer, _NameIndexer
 from .wire import WireVector, Input, Output, Const, Register
 from .corecircuits import concat
 from .memory import RomBlock
+from .hierarchy import _modules_in_order
 
 
 # -----------------------------------------------------------------
@@ -349,6 +350,8 @@ def _graphviz_default_namer(thing, is_edge=True, is_to_splitmerge=False):
                 return '[label="%s.next", shape=square, fillcolor=gold]' % name
             elif thing.op == 'w':
                 return '[label="buf"]'
+            elif thing.op == 'h':
+                return '[label="%s", shape=box]' % thing.op_param[1].name
             else:
                 return '[label="%s"]' % (thing.op + str(thing.op_param or ''))
         except AttributeError:
@@ -506,15 +509,35 @@ def _verilog_vector_decl(w):
 
 class OutputToVerilog(object):
     def __init__(self, dest_file, block=None):
-        """ A class to walk the block and output it in verilog format to the open file """
+        """ A class to walk the block and output it in verilog format to the open file
 
-        self.block = working_block(block)
+        Each Module instantiated in the block (directly or inside of another module)
+        is output once, as its own verilog module, ahead of the toplevel module.
+        """
+
+        block = working_block(block)
         self.file = dest_file
+        self.module_names = {}  # map from Module->the name of its verilog module
+        self.module_wire_names = {}  # map from Module->the sanitizer used for its wires
+        self._to_verilog_comment()
+        module_indexer = _NameIndexer('_verout_module_')
+        for module in _modules_in_order(block):
+            name = module.name
+            if (not _VerilogSanitizer().is_valid_str(name) or name == 'toplevel' or
+                    name in self.module_names.values()):
+                name = module_indexer.make_valid_string()
+            self.module_names[module] = name
+            self._to_verilog_module(module.block, name)
+            self.module_wire_names[module] = self.internal_names
+        self._to_verilog_module(block, 'toplevel')
+
+    def _to_verilog_module(self, block, module_name):
+        self.block = block
         self.internal_names = _VerilogSanitizer('_verout_tmp_')
+        self.instance_names = _NameIndexer('_verout_inst_')
         for wire in self.block.wirevector_set:
             self.internal_names.make_valid_string(wire.name)
-        self._to_verilog_comment()
-        self._to_verilog_header()
+        self._to_verilog_header(module_name)
         self._to_verilog_combinational()
         self._to_verilog_sequential()
         self._to_verilog_footer()
@@ -523,16 +546,23 @@ class OutputToVerilog(object):
         """ Converts WireVectors to internal names """
         return self.internal_names[wire.name]
 
+    def _instname(self, name):
+        """ Converts instance names to verilog names (distinct from the wire names) """
+        if (self.block.get_wirevector_by_name(name) is not None
+                or not self.internal_names.is_valid_str(name)):
+            return self.instance_names.make_valid_string()
+        return name
+
     def _to_verilog_comment(self):
         print('// Generated automatically via PyRTL', file=self.file)
         print('// As one initial test of synthesis, map to FPGA with:', file=self.file)
         print('//   yosys -p "synth_xilinx -top toplevel" thisfile.v\n', file=self.file)
 
-    def _to_verilog_header(self):
+    def _to_verilog_header(self, module_name='toplevel'):
         io_list = [self._varname(w) for w in self.block.wirevector_subset((Input, Output))]
         io_list.append('clk')
         io_list_str = ', '.join(io_list)
-        print('module toplevel(%s);' % io_list_str, file=self.file)
+        print('module %s(%s);' % (module_name, io_list_str), file=self.file)
 
         inputs = self.block.wirevector_subset(Input)
         outputs = self.block.wirevector_subset(Output)
@@ -625,6 +655,15 @@ class OutputToVerilog(object):
                 print('    end', file=self.file)
             elif net.op == '@':
                 pass
+            elif net.op == 'h':
+                inst_name, module = net.op_param
+                port_names = self.module_wire_names[module]
+                ports = module.inputs + module.outputs
+                connections = ['.%s(%s)' % (port_names[port.name], self._varname(w))
+                               for port, w in zip(ports, net.args + net.dests)]
+                connections.append('.clk(clk)')
+                t = (self.module_names[module], self._instname(inst_name), ', '.join(connections))
+                print('    %s %s(%s);' % t, file=self.file)
             else:
                 raise PyrtlInternalError("nets with op '{}' not supported".format(net.op))
         print('', file=self.file)
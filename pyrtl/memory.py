@@ -16,7 +16,7 @@ import collections
 
 from .pyrtlexceptions import PyrtlError
 from .core import working_block, LogicNet, _NameIndexer
-from .wire import WireVector, Const, next_tempvar_name
+from .wire import WireVector, next_tempvar_name, _interned_const
 from .helperfuncs import as_wires
 # ------------------------------------------------------------------------
 #
@@ -208,7 +208,7 @@ class MemBlock(_MemReadBase):
         if isinstance(val, MemBlock.EnabledWrite):
             data, enable = val.data, val.enable
         else:
-            data, enable = val, Const(1, bitwidth=1)
+            data, enable = val, _interned_const(1, bitwidth=1)
         data = as_wires(data, bitwidth=self.bitwidth, truncating=False)
         enable = as_wires(enable, bitwidth=1, truncating=False)
 
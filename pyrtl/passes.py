@@ -14,6 +14,7 @@ from .memory import MemBlock
 from .pyrtlexceptions import PyrtlError, PyrtlInternalError
 from .wire import WireVector, Input, Output, Const, Register
 from .transform import net_transform, _get_new_block_mem_instance, copy_block, replace_wires
+from .hierarchy import flatten
 from . import transform  # transform.all_nets loos better than all_nets
 
 
@@ -95,8 +96,7 @@ def _remove_wire_nets(block):
     # now update the block with the new logic and remove wirevectors
     block.logic = new_logic
     for dead_wirevector in wire_removal_set:
-        del block.wirevector_by_name[dead_wirevector.name]
-        block.wirevector_set.remove(dead_wirevector)
+        block.remove_wirevector(dead_wirevector)
 
     block.sanity_check()
 
@@ -238,6 +238,8 @@ def _find_common_subexps(block):
     t = tuple()  # just a placeholder
     const_dict = {}
     for net in block.logic:
+        if net.op == 'h':
+            continue  # instances have state, so are never merged
         if net.op in ops_where_arg_order_matters:
             new_args = tuple(_const_to_int(w, const_dict) for w in net.args)
         else:
@@ -308,7 +310,7 @@ def _remove_unlistened_nets(block):
         listened_wires.update(net.args)
 
     for a_net in block.logic:
-        if a_net.op == '@':
+        if a_net.op in '@h':  # instances might write to memories
             add_to_listened(a_net)
         elif any(isinstance(destW, Output) for destW in a_net.dests):
             add_to_listened(a_net)
@@ -381,13 +383,16 @@ def synthesize(update_working_block=True, block=None):
     block_pre = working_block(block)
     block_pre.sanity_check()  # before going further, make sure that pressynth is valid
     block_in = copy_block(block_pre, update_working_block=False)
+    flatten(block_in)
 
     block_out = PostSynthBlock()
     # resulting block should only have one of a restricted set of net ops
     block_out.legal_ops = set('~&|^nrwcsm@')
     wirevector_map = {}  # map from (vector,index) -> new_wire
 
-    with set_working_block(block_out, no_sanity_check=True):
+    # the new block is built entirely from the (already checked) block_in, so the
+    # per-wire and per-net checks are batched up until the block is complete
+    with set_working_block(block_out, no_sanity_check=True), block_out.bulk_build():
         # First, replace advanced operators with simpler ones
         for op, fun in [
                 ('*', _basic_mult),
@@ -417,10 +422,12 @@ def synthesize(update_working_block=True, block=None):
         # Now connect up the inputs and outputs to maintain the interface
         for wirevector in block_in.wirevector_subset(Input):
             input_vector = Input(name=wirevector.name, bitwidth=len(wirevector))
+            block_out.io_map[block_pre.get_wirevector_by_name(wirevector.name)] = input_vector
             for i in range(len(wirevector)):
                 wirevector_map[(wirevector, i)] <<= input_vector[i]
         for wirevector in block_in.wirevector_subset(Output):
             output_vector = Output(name=wirevector.name, bitwidth=len(wirevector))
+            block_out.io_map[block_pre.get_wirevector_by_name(wirevector.name)] = output_vector
             # the "reversed" is needed because most significant bit comes first in concat
             output_bits = [wirevector_map[(wirevector, i)]
                            for i in range(len(output_vector))]
@@ -0,0 +1,157 @@
+"""
+SimulationPool runs many independent testbenches against the same design in parallel.
+
+The simulator given to the pool (a Simulation, FastSimulation, or
+CompiledSimulation, already built and possibly already run for a while) is
+pickled once, along with its block, its compiled code, and its current state.
+Each worker process loads it the first time it is given work, and then runs
+every testbench sent to it from that same starting state (using checkpoint and
+restore), so neither the design nor the compiled simulator is rebuilt per
+testbench.
+
+This needs concurrent.futures, which is part of Python 3 (and available for
+Python 2.7 as the "futures" package).
+"""
+
+from __future__ import print_function, unicode_literals
+
+import collections
+import os
+import pickle
+import shutil
+import tempfile
+
+from .pyrtlexceptions import PyrtlError
+from .simulation import SimulationTrace
+
+
+__all__ = ['SimulationPool', 'SimulationResult']
+
+
+class SimulationResult(collections.namedtuple('SimulationResult', 'outputs, trace, error')):
+    """ The result of running one testbench in a SimulationPool.
+
+    outputs is a dictionary mapping the name of each of the outputs requested to a
+    list of its values in each cycle, trace is a dictionary mapping the name of each
+    traced wire to its values (or None, if the simulator has no tracer), and error is
+    the exception raised by the simulation (such as a failing rtl_assert), or None.
+    If there was an error, outputs hold the values of the cycles before it.
+    """
+    __slots__ = ()
+
+
+class SimulationPool(object):
+    """ Runs independent testbenches against one simulator, in a pool of processes.
+
+    Example::
+
+        sim = pyrtl.FastSimulation(tracer=None)
+        with pyrtl.SimulationPool(sim) as pool:
+            results = pool.run([{'a': [1, 2, 3], 'b': [0, 0, 1]},
+                                {'a': [7, 7, 7], 'b': [1, 0, 1]}], outputs=['o'])
+        results[1].outputs['o']  # the values of o in each cycle of the second testbench
+
+    Every testbench starts from the state the simulator was in when the pool was
+    made, and is run in one of the worker processes.  The simulator (and the
+    exceptions of its rtl_asserts) must be picklable: designs with RomBlocks
+    built from functions, for example, cannot be run in a pool.
+    """
+
+    def __init__(self, sim, processes=None):
+        """
+        :param sim: the simulator to run the testbenches with, in its starting state
+        :param processes: the number of worker processes (defaults to the number of CPUs)
+        """
+        try:
+            from concurrent.futures import ProcessPoolExecutor
+        except ImportError:
+            raise PyrtlError('SimulationPool requires concurrent.futures '
+                             '(install the "futures" package on Python 2)')
+        if processes is None:
+            import multiprocessing
+            processes = multiprocessing.cpu_count()
+        self.processes = processes
+
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, 'sim.pickle')
+        with open(self._path, 'wb') as f:
+            pickle.dump(sim, f, pickle.HIGHEST_PROTOCOL)
+        self._executor = ProcessPoolExecutor(self.processes)
+
+    def run(self, testbenches, outputs=None, batch_size=None):
+        """ Run each testbench, returning a list of their SimulationResults (in order).
+
+        :param testbenches: a list of testbenches, each a dictionary mapping every
+          Input name to a sequence of its values, one for each cycle (as for
+          Simulation.run)
+        :param outputs: a list of the names of the wires to collect the values of
+        :param batch_size: the number of testbenches sent to a worker at a time
+          (defaults to splitting them into four batches per worker)
+        """
+        if self._executor is None:
+            raise PyrtlError('error, the simulation pool has been closed')
+        testbenches = list(testbenches)
+        for inputs in testbenches:
+            if len(set(len(column) for column in inputs.values())) > 1:
+                raise PyrtlError('error, the inputs of a testbench are given different '
+                                 'numbers of values')
+        outputs = list(outputs or ())
+        if batch_size is None:
+            batch_size = max(1, -(-len(testbenches) // (4 * self.processes)))
+        futures = [self._executor.submit(_run_batch, self._path,
+                                         testbenches[i:i + batch_size], outputs)
+                   for i in range(0, len(testbenches), batch_size)]
+        return [result for future in futures for result in future.result()]
+
+    def close(self):
+        """ Shut down the worker processes, and remove the pickled simulator. """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._dir is not None:
+            shutil.rmtree(self._dir)
+            self._dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+# the simulators loaded in this (worker) process: map from pickle path->(simulator, checkpoint)
+_loaded_sims = {}
+
+
+def _run_batch(sim_path, testbenches, outputs):
+    """ Run in a worker: run each testbench, starting from the pickled simulator's state. """
+    if sim_path not in _loaded_sims:
+        with open(sim_path, 'rb') as f:
+            sim = pickle.load(f)
+        _loaded_sims[sim_path] = sim, sim.checkpoint()
+    sim, checkpoint = _loaded_sims[sim_path]
+    return [_run_testbench(sim, checkpoint, inputs, outputs) for inputs in testbenches]
+
+
+def _run_testbench(sim, checkpoint, inputs, outputs):
+    sim.restore(checkpoint)
+    if sim.tracer is not None:
+        sim.tracer = SimulationTrace(wires_to_track=sim.tracer.wires_to_track, block=sim.block)
+    names = list(inputs)
+    rows = list(zip(*(inputs[name] for name in names)))
+    values = {name: [] for name in outputs}
+    error = None
+    try:
+        if hasattr(sim, 'run_stream'):
+            for row_values in sim.run_stream(rows, names, outputs):
+                for name, value in zip(outputs, row_values):
+                    values[name].append(value)
+        else:  # CompiledSimulation, where the outputs have to come from the trace
+            sim.run([dict(zip(names, row)) for row in rows])
+            values = {name: list(sim.tracer.trace[name]) for name in outputs}
+    except Exception as e:
+        error = e
+    trace = None
+    if sim.tracer is not None:
+        trace = {name: list(trace_values) for name, trace_values in sim.tracer.trace.items()}
+    return SimulationResult(values, trace, error)
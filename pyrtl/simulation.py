@@ -2,13 +2,21 @@
 
 from __future__ import print_function, unicode_literals
 
+import os
 import sys
 import re
+import array
+import marshal
+import hashlib
+import tempfile
+import heapq
+import itertools
 import numbers
 import collections
+import six
 
 from .pyrtlexceptions import PyrtlError, PyrtlInternalError
-from .core import working_block, PostSynthBlock, _PythonSanitizer
+from .core import working_block, PostSynthBlock
 from .wire import Input, Register, Const, Output, WireVector
 from .memory import RomBlock
 from .helperfuncs import check_rtl_assertions, _currently_in_ipython
@@ -21,28 +29,22 @@ from .inputoutput import _VerilogSanitizer
 #
 
 
+# the opcodes of the compiled nets, roughly in order of how common they are
+(_OP_WIRE, _OP_AND, _OP_OR, _OP_XOR, _OP_NOT, _OP_ADD, _OP_SUB, _OP_MUX, _OP_CONCAT,
+ _OP_SLICE, _OP_EQ, _OP_LT, _OP_GT, _OP_MUL, _OP_NAND, _OP_SELECT, _OP_MEM, _OP_ROM,
+ _OP_INSTANCE) = range(19)
+
+_OPCODES = {'w': _OP_WIRE, '&': _OP_AND, '|': _OP_OR, '^': _OP_XOR, '~': _OP_NOT,
+            '+': _OP_ADD, '-': _OP_SUB, 'x': _OP_MUX, '=': _OP_EQ, '<': _OP_LT,
+            '>': _OP_GT, '*': _OP_MUL, 'n': _OP_NAND}
+
+
 class Simulation(object):
     """A class for simulating blocks of logic step by step."""
 
-    simple_func = {  # OPS
-        'w': lambda x: x,
-        '~': lambda x: ~x,
-        '&': lambda l, r: l & r,
-        '|': lambda l, r: l | r,
-        '^': lambda l, r: l ^ r,
-        'n': lambda l, r: ~(l & r),
-        '+': lambda l, r: l + r,
-        '-': lambda l, r: l - r,
-        '*': lambda l, r: l * r,
-        '<': lambda l, r: int(l < r),
-        '>': lambda l, r: int(l > r),
-        '=': lambda l, r: int(l == r),
-        'x': lambda sel, f, t: f if (sel == 0) else t
-    }
-
     def __init__(
             self, tracer=True, register_value_map=None, memory_value_map=None,
-            default_value=0, block=None):
+            default_value=0, block=None, event_driven=False, dense_memories=None):
         """ Creates a new circuit simulator
 
         :param tracer: an instance of SimulationTrace used to store execution results.
@@ -58,6 +60,18 @@ class Simulation(object):
           use the value stored in the object (default to 0)
         :param block: the hardware block to be traced (which might be of type PostSynthesisBlock).
           defaults to the working block
+        :param event_driven: if True, after the first step only the nets downstream of
+          the inputs, registers, and memories that changed are evaluated each step
+          (which is much faster for designs where little changes from cycle to cycle)
+        :param dense_memories: the memories to hold in an array with an entry for every
+          address (rather than in a dict of the addresses written).  Defaults to holding
+          every memory with an address space of at most 2**16 in an array.
+
+        In the event driven mode the simulation keeps track of which wires changed value,
+        and evaluates just the nets that read them (in the same order as a full step).
+        Instances of Modules are evaluated every step.  Changes made to the memories
+        from outside of the simulation (for example through inspect_mem) are not seen
+        by the memory reads until the address read changes.
 
         Warning: Simulation initializes some things when called with __init__,
         so changing items in the block for Simulation will likely break
@@ -71,7 +85,6 @@ class Simulation(object):
         block = working_block(block)
         block.sanity_check()  # check that this is a good hw block
 
-        self.value = {}  # map from signal->value
         self.regvalue = {}  # map from register->value on next tick
         self.memvalue = {}  # map from {memid :{address: value}}
         self.block = block
@@ -79,6 +92,8 @@ class Simulation(object):
         if tracer is True:
             tracer = SimulationTrace()
         self.tracer = tracer
+        self.event_driven = event_driven
+        self.dense_memories = _post_synth_mems(block, dense_memories)
         self._initialize(register_value_map, memory_value_map)
 
     def _initialize(self, register_value_map=None, memory_value_map=None, default_value=None):
@@ -94,6 +109,11 @@ class Simulation(object):
         if default_value is None:
             default_value = self.default_value
 
+        # every wire gets a slot in the value store, all starting at the default value
+        self._slot = {w: i for i, w in enumerate(self.block.wirevector_set)}
+        self._store = [default_value] * len(self._slot)
+        self.value = _ValueMap(self._slot, self._store)  # map from signal->value
+
         # set registers to their values
         reg_set = self.block.wirevector_subset(Register)
         if register_value_map is not None:
@@ -108,9 +128,10 @@ class Simulation(object):
         # set memories to their passed values
 
         for mem_net in self.block.logic_subset('m@'):
-            memid = mem_net.op_param[1].id
-            if memid not in self.memvalue:
-                self.memvalue[memid] = {}
+            mem = mem_net.op_param[1]
+            if mem.id not in self.memvalue:
+                self.memvalue[mem.id] = {} if isinstance(mem, RomBlock) else \
+                    _new_memory(mem, self.dense_memories)
 
         if memory_value_map is not None:
             for (mem, mem_map) in memory_value_map.items():
@@ -118,7 +139,6 @@ class Simulation(object):
                     raise PyrtlError('error, one or more of the memories in the map is a RomBlock')
                 if isinstance(self.block, PostSynthBlock):
                     mem = self.block.mem_map[mem]  # pylint: disable=maybe-no-member
-                self.memvalue[mem.id] = mem_map
                 max_addr_val, max_bit_val = 2**mem.addrwidth, 2**mem.bitwidth
                 for (addr, val) in mem_map.items():
                     if addr < 0 or addr >= max_addr_val:
@@ -127,15 +147,84 @@ class Simulation(object):
                     if val < 0 or val >= max_bit_val:
                         raise PyrtlError('error, %s at %s in %s outside of bounds' %
                                          (str(val), str(addr), mem.name))
-
-        # set all other variables to default value
-        for w in self.block.wirevector_set:
-            if w not in self.value:
-                self.value[w] = default_value
+                _set_memory(self.memvalue, mem.id, mem_map)
 
         self.ordered_nets = tuple((i for i in self.block))
         self.reg_update_nets = tuple((self.block.logic_subset('r')))
         self.mem_update_nets = tuple((self.block.logic_subset('@')))
+        self._instances = {net: _InstanceSimulation(net.op_param[1], default_value)
+                           for net in self.block.logic_subset('h')}
+        self._shared_mems = set()  # memids whose maps are shared with a checkpoint
+        self._compile()
+        if self.event_driven:
+            self._initialize_events()
+
+    def _compile(self):
+        """ Compile the nets into records for _execute_program, in the order they are run.
+
+        Each combinational net becomes a tuple (opcode, dest, mask, a, b, c, param),
+        where dest, a, b, and c are the slots in the value store of the net's dest
+        and args (or 0 if it has fewer), mask is the bitmask of the dest, and param
+        is any other information the opcode needs.  The registers and memory writes
+        are compiled into the lists of slots read and written by _update_state.
+        """
+        slot = self._slot
+        self._program_nets = tuple(net for net in self.ordered_nets if net.op not in 'r@')
+        self._program = [self._compile_net(net) for net in self._program_nets]
+        self._reg_updates = [(net.dests[0], slot[net.args[0]], net.dests[0].bitmask)
+                             for net in self.reg_update_nets]
+        self._mem_writes = [(net.op_param[0],) + tuple(slot[arg] for arg in net.args)
+                            for net in self.mem_update_nets]
+
+    def _compile_net(self, net):
+        """ Compile one combinational net into a record (as described in _compile). """
+        slot = self._slot
+        op, param = net.op, None
+        args = [slot[arg] for arg in net.args]
+        if op in _OPCODES:
+            opcode = _OPCODES[op]
+        elif op == 'c':
+            opcode = _OP_CONCAT
+            param = tuple((slot[arg], len(arg)) for arg in net.args)
+        elif op == 's':
+            low = net.op_param[0]
+            if net.op_param == tuple(range(low, low + len(net.op_param))):
+                opcode, args = _OP_SLICE, args + [low]  # a contiguous range of bits
+            else:
+                opcode, param = _OP_SELECT, net.op_param[::-1]
+        elif op == 'm':
+            if isinstance(net.op_param[1], RomBlock):
+                opcode, param = _OP_ROM, net.op_param[1]
+            else:
+                opcode, param = _OP_MEM, net.op_param[0]
+        elif op == 'h':
+            opcode, args = _OP_INSTANCE, []
+            param = (self._instances[net], tuple(slot[arg] for arg in net.args),
+                     tuple(slot[dest] for dest in net.dests))
+            return (opcode, 0, 0, 0, 0, 0, param)
+        else:
+            raise PyrtlInternalError('error, unknown op type')
+        a, b, c = (args + [0, 0, 0])[:3]
+        dest = net.dests[0]
+        return (opcode, slot[dest], dest.bitmask, a, b, c, param)
+
+    def _initialize_events(self):
+        """ Build the maps from each wire and memory to the records (by index) to evaluate. """
+        slot = self._slot
+        net_index = {net: i for i, net in enumerate(self._program_nets)}
+        self._fanout = {}  # map from slot->indices of the nets reading it
+        for wire, sinks in self.block.net_connections()[1].items():
+            indices = tuple(net_index[net] for net in sinks if net.op not in 'r@')
+            if indices:
+                self._fanout[slot[wire]] = indices
+        self._mem_readers = {}  # map from memid->indices of the nets reading the memory
+        for net in self.block.logic_subset('m'):
+            self._mem_readers.setdefault(net.op_param[0], []).append(net_index[net])
+        self._always_evaluated = [net_index[net] for net in self._instances]
+        self._program_dests = [tuple(slot[dest] for dest in net.dests)
+                               for net in self._program_nets]
+        self._written_mems = set()  # memids written at the end of the last step
+        self._evaluated_all = False  # the first step evaluates every net
 
     def step(self, provided_inputs):
         """ Take the simulation forward one cycle
@@ -152,13 +241,13 @@ class Simulation(object):
 
         # Check that all Input have a corresponding provided_input
         input_set = self.block.wirevector_subset(Input)
-        supplied_inputs = set()
+        supplied_inputs = {}
         for i in provided_inputs:
             if isinstance(i, WireVector):
                 name = i.name
             else:
                 name = i
-            sim_wire = self.block.wirevector_by_name[name]
+            sim_wire = self.block.get_wirevector_by_name(name)
             if sim_wire not in input_set:
                 raise PyrtlError(
                     'step provided a value for input for "%s" which is '
@@ -174,37 +263,140 @@ class Simulation(object):
                     % (name, sim_wire.bitwidth,
                        provided_inputs[i], len(bin(provided_inputs[i]))-2))
 
-            self.value[sim_wire] = provided_inputs[i]
-            supplied_inputs.add(sim_wire)
+            supplied_inputs[sim_wire] = provided_inputs[i]
 
         # Check that only inputs are specified, and set the values
-        if input_set != supplied_inputs:
+        if len(input_set) != len(supplied_inputs):
             for i in input_set.difference(supplied_inputs):
                 raise PyrtlError('Input "%s" has no input value specified' % i.name)
 
-        self.value.update(self.regvalue)  # apply register updates from previous step
-
-        for net in self.ordered_nets:
-            self._execute(net)
-
-        # Do all of the mem operations based off the new values changed in _execute()
-        for net in self.mem_update_nets:
-            self._mem_update(net)
+        self._step(supplied_inputs)
+
+    def _step(self, input_values):
+        """ Take a step, given a map from every Input to its (already checked) value. """
+        store, slot = self._store, self._slot
+        changed = []  # slots changing value this step (when event driven)
+        if self.event_driven:
+            changed.extend(slot[w] for w, v in input_values.items() if store[slot[w]] != v)
+            changed.extend(slot[r] for r, v in self.regvalue.items() if store[slot[r]] != v)
+        for w, v in input_values.items():
+            store[slot[w]] = v
+        for r, v in self.regvalue.items():  # apply register updates from previous step
+            store[slot[r]] = v
+
+        if self.event_driven and self._evaluated_all:
+            self._execute_changed(changed)
+        else:
+            self._execute_program(self._program)
+            self._evaluated_all = True
 
         # at the end of the step, record the values to the trace
         # print self.value # Helpful Debug Print
         if self.tracer is not None:
             self.tracer.add_step(self.value)
 
-        # Do all of the reg updates based off of the new values
-        for net in self.reg_update_nets:
-            argval = self.value[net.args[0]]
-            self.regvalue[net.dests[0]] = self._sanitize(argval, net.dests[0])
+        if self.event_driven:
+            self._written_mems = set(memid for memid, _, _, enable in self._mem_writes
+                                     if store[enable])
+        failed = self._update_state()
 
         # finally, if any of the rtl_assert assertions are failing then we should
         # raise the appropriate exceptions
+        if failed is not None:
+            raise failed
         check_rtl_assertions(self)
 
+    def run(self, inputs, outputs=None):
+        """ Run the simulation for a number of cycles, with the values of the inputs as columns.
+
+        :param inputs: a dictionary mapping every Input (or its name) to a sequence of
+          its values, one for each cycle (all of the sequences must be the same length)
+        :param outputs: a list of wires (or their names) to collect the values of
+        :return: a dictionary mapping the name of each of the outputs to a list of its
+          values in each cycle (empty if no outputs are given)
+
+        This has the same result as calling step for each cycle, but resolves the
+        inputs once and checks each column of values at once, rather than checking
+        everything again on every step.
+        """
+        return _run(self, inputs, outputs)
+
+    def run_stream(self, values, inputs=None, outputs=None):
+        """ Run the simulation for a cycle for each tuple of input values from an iterable.
+
+        :param values: an iterable (such as a generator) of tuples, each holding the
+          values of the inputs for one cycle
+        :param inputs: the Inputs (or their names) in the order their values are given
+          in each tuple (defaults to all of the Inputs, sorted by name)
+        :param outputs: a list of wires (or their names) whose values are to be yielded
+        :return: a generator that runs a cycle each time it is advanced, yielding a
+          tuple of the values of the outputs in that cycle
+
+        The cycles are only run as the generator is consumed, so a testbench can
+        decide on the next inputs after seeing the outputs (for example, by sending
+        them to a generator that is passed as values)::
+
+            for x, y in sim.run_stream(((a, a + 1) for a in range(100)), ['a', 'b'], ['x', 'y']):
+                ...
+        """
+        return _run_stream(self, values, inputs, outputs)
+
+    def _run_step(self, plan, row):
+        self._step(dict(zip(plan.wires, row)))
+
+    def _run_value(self, wire):
+        return self.value[wire]
+
+    def _execute_changed(self, changed):
+        """ Evaluate the nets reading the changed slots and written memories, and so on.
+
+        The nets are evaluated in the order of the program (a topological order), so
+        each net is evaluated at most once, after all of the nets it depends on.
+        """
+        store = self._store
+        program = self._program
+        fanout = self._fanout
+        scheduled = set(self._always_evaluated)
+        for s in changed:
+            scheduled.update(fanout.get(s, ()))
+        for memid in self._written_mems:
+            scheduled.update(self._mem_readers.get(memid, ()))
+        heap = list(scheduled)
+        heapq.heapify(heap)
+        while heap:
+            index = heapq.heappop(heap)
+            dests = self._program_dests[index]
+            old_values = [store[dest] for dest in dests]
+            self._execute_program((program[index],))
+            for dest, old_value in zip(dests, old_values):
+                if store[dest] != old_value:
+                    for i in fanout.get(dest, ()):
+                        if i not in scheduled:
+                            scheduled.add(i)
+                            heapq.heappush(heap, i)
+
+    def _update_state(self):
+        """ Do the memory and register updates at the end of a step.
+
+        Returns the exception of the first rtl_assert failing in an instance
+        (or None), to be raised once every instance has been updated.
+        """
+        store = self._store
+        # Do all of the mem operations based off the new values changed in _execute_program()
+        for memid, addr, data, enable in self._mem_writes:
+            if store[enable]:
+                if memid in self._shared_mems:  # copy on the first write after a checkpoint
+                    self.memvalue[memid] = self.memvalue[memid].copy()
+                    self._shared_mems.discard(memid)
+                self.memvalue[memid][store[addr]] = store[data]
+
+        # Do all of the reg updates based off of the new values
+        for reg, arg, mask in self._reg_updates:
+            self.regvalue[reg] = store[arg] & mask
+
+        failures = [instance._update_state() for instance in self._instances.values()]
+        return next((exp for exp in failures if exp is not None), None)
+
     def inspect(self, w):
         """ Get the value of a wirevector in the last simulation cycle.
 
@@ -214,81 +406,415 @@ class Simulation(object):
 
         Will throw KeyError if w does not exist in the simulation.
         """
-        wire = self.block.wirevector_by_name.get(w, w)
+        wire = self.block.get_wirevector_by_name(w) if isinstance(w, six.string_types) else w
+        if wire is None:
+            raise KeyError(w)
         return self.value[wire]
 
     def inspect_mem(self, mem):
         """ Get the values in a map during the current simulation cycle.
 
         :param mem: the memory to inspect
-        :return: {address: value}
+        :return: {address: value} (for a memory held densely, a map that acts like a dict)
 
         Note that this returns the current memory state. Modifying the dictonary
         will also modify the state in the simulator
         """
         return self.memvalue[mem.id]
 
-    @staticmethod
-    def _sanitize(val, wirevector):
-        """Return a modified version of val that would fit in wirevector.
+    def checkpoint(self):
+        """ Take a snapshot of the state of the simulation, which can be restored later.
+
+        :return: a checkpoint, to pass to restore (of this simulation, or of
+          another Simulation of the same block)
 
-        This function should be applied to every primitive call, and it's
-        default behavior is to mask the upper bits of value and return that
-        new value.
+        The checkpoint holds the values of the registers, memories, and wires at the
+        end of the last step.  Memories are copied on write: taking a checkpoint does
+        not copy them, but the next write to each memory does (so a map returned by
+        inspect_mem before the checkpoint is no longer updated after that write).
+        The trace is not part of the checkpoint, and is not rewound by restore.
         """
-        return val & wirevector.bitmask
+        return _Checkpoint(Simulation, self.block, self._get_state())
 
-    def _execute(self, net):
-        """Handle the combinational logic update rules for the given net.
+    def restore(self, checkpoint):
+        """ Return the simulation to the state of a checkpoint.
 
-        This function, along with edge_update, defined the semantics
-        of the primitive ops. Function updates self.value accordingly.
+        :param checkpoint: a checkpoint, as returned by checkpoint
+
+        The same checkpoint can be restored any number of times, for example to try
+        different inputs from the same starting state.
         """
-        if net.op in 'r@':
-            return  # registers and memory write ports have no logic function
-        elif net.op in self.simple_func:
-            argvals = (self.value[arg] for arg in net.args)
-            result = self.simple_func[net.op](*argvals)
-        elif net.op == 'c':
-            result = 0
-            for arg in net.args:
-                result = result << len(arg)
-                result = result | self.value[arg]
-        elif net.op == 's':
-            result = 0
-            source = self.value[net.args[0]]
-            for b in net.op_param[::-1]:
-                result = (result << 1) | (0x1 & (source >> b))
-        elif net.op == 'm':
-            # memories act async for reads
-            memid = net.op_param[0]
-            mem = net.op_param[1]
-            read_addr = self.value[net.args[0]]
-            if isinstance(mem, RomBlock):
-                result = mem._get_read_data(read_addr)
+        checkpoint.check(Simulation, self.block)
+        self._set_state(checkpoint.state)
+
+    def fork(self, tracer=True):
+        """ Return a new Simulation of the same block, starting from the current state.
+
+        :param tracer: the tracer for the new simulation; defaults to a new
+          SimulationTrace of the same wires as this simulation's tracer (if any)
+        """
+        sim = Simulation(tracer=_fork_tracer(self, tracer), default_value=self.default_value,
+                         block=self.block, event_driven=self.event_driven)
+        sim.restore(self.checkpoint())
+        return sim
+
+    def _get_state(self):
+        self._shared_mems.update(self.memvalue)
+        instances = {net: instance._get_state() for net, instance in self._instances.items()}
+        events = None
+        if self.event_driven:
+            events = (set(self._written_mems), self._evaluated_all)
+        return list(self._store), dict(self.regvalue), dict(self.memvalue), instances, events
+
+    def _set_state(self, state):
+        store, regvalue, memvalue, instances, events = state
+        self._store[:] = store
+        self.regvalue = dict(regvalue)
+        self.memvalue = dict(memvalue)
+        self._shared_mems = set(memvalue)
+        for net, instance_state in instances.items():
+            self._instances[net]._set_state(instance_state)
+        if self.event_driven:
+            written_mems, evaluated_all = events or (set(), False)
+            self._written_mems, self._evaluated_all = set(written_mems), evaluated_all
+
+    def _execute_program(self, program):
+        """ Run the compiled records of program, updating the value store.
+
+        This function, along with _update_state, defines the semantics of the
+        primitive ops.  Every result is masked to the bitwidth of its dest.
+        """
+        store = self._store
+        for opcode, dest, mask, a, b, c, param in program:
+            if opcode == _OP_WIRE:
+                store[dest] = store[a] & mask
+            elif opcode == _OP_AND:
+                store[dest] = store[a] & store[b] & mask
+            elif opcode == _OP_OR:
+                store[dest] = (store[a] | store[b]) & mask
+            elif opcode == _OP_XOR:
+                store[dest] = (store[a] ^ store[b]) & mask
+            elif opcode == _OP_NOT:
+                store[dest] = ~store[a] & mask
+            elif opcode == _OP_ADD:
+                store[dest] = (store[a] + store[b]) & mask
+            elif opcode == _OP_SUB:
+                store[dest] = (store[a] - store[b]) & mask
+            elif opcode == _OP_MUX:
+                store[dest] = (store[c] if store[a] else store[b]) & mask
+            elif opcode == _OP_CONCAT:
+                result = 0
+                for arg, width in param:
+                    result = (result << width) | store[arg]
+                store[dest] = result & mask
+            elif opcode == _OP_SLICE:
+                store[dest] = (store[a] >> b) & mask
+            elif opcode == _OP_EQ:
+                store[dest] = int(store[a] == store[b]) & mask
+            elif opcode == _OP_LT:
+                store[dest] = int(store[a] < store[b]) & mask
+            elif opcode == _OP_GT:
+                store[dest] = int(store[a] > store[b]) & mask
+            elif opcode == _OP_MUL:
+                store[dest] = (store[a] * store[b]) & mask
+            elif opcode == _OP_NAND:
+                store[dest] = ~(store[a] & store[b]) & mask
+            elif opcode == _OP_SELECT:
+                result = 0
+                source = store[a]
+                for bit in param:
+                    result = (result << 1) | (0x1 & (source >> bit))
+                store[dest] = result & mask
+            elif opcode == _OP_MEM:
+                # memories act async for reads
+                store[dest] = self.memvalue[param].get(store[a], self.default_value) & mask
+            elif opcode == _OP_ROM:
+                store[dest] = param._get_read_data(store[a]) & mask
+            elif opcode == _OP_INSTANCE:
+                instance, args, dests = param
+                results = instance._evaluate([store[arg] for arg in args])
+                for dest, result in zip(dests, results):
+                    store[dest] = result
             else:
-                result = self.memvalue[memid].get(read_addr, self.default_value)
-        else:
-            raise PyrtlInternalError('error, unknown op type')
+                raise PyrtlInternalError('error, unknown opcode %d' % opcode)
 
-        self.value[net.dests[0]] = self._sanitize(result, net.dests[0])
 
-    def _mem_update(self, net):
-        """Handle the mem update for the simulation of the given net (which is a memory).
+class _InstanceSimulation(Simulation):
+    """ The state of one instance of a Module, simulated as part of its parent.
 
-        Combinational logic should have no posedge behavior, but registers and
-        memory should.  This function, used after _execute, defines the
-        semantics of the primitive ops.  Function updates self.memvalue accordingly
-        (using prior_value)
-        """
-        if net.op != '@':
-            raise PyrtlInternalError
-        memid = net.op_param[0]
-        write_addr = self.value[net.args[0]]
-        write_val = self.value[net.args[1]]
-        write_enable = self.value[net.args[2]]
-        if write_enable:
-            self.memvalue[memid][write_addr] = write_val
+    Registers and memories inside of an instance start out at the default value,
+    and its wires are not traced.
+    """
+
+    def __init__(self, module, default_value):
+        self.regvalue = {}
+        self.memvalue = {}
+        self.block = module.block
+        self.module = module
+        self.default_value = default_value
+        self.tracer = None
+        self.event_driven = False
+        self.dense_memories = None
+        self._initialize()
+        self._input_slots = [self._slot[port] for port in module.inputs]
+        self._output_slots = [self._slot[port] for port in module.outputs]
+
+    def _evaluate(self, argvals):
+        """ Evaluate the instance for the current step, returning the values of its outputs. """
+        store, slot = self._store, self._slot
+        for r, v in self.regvalue.items():
+            store[slot[r]] = v
+        for port, val in zip(self._input_slots, argvals):
+            store[port] = val
+        self._execute_program(self._program)
+        return [store[port] for port in self._output_slots]
+
+    def _update_state(self):
+        failed = super(_InstanceSimulation, self)._update_state()
+        if failed is None:
+            failed = next((exp for wire, exp in self.block.rtl_assert_dict.items()
+                           if not self.value[wire]), None)
+        return failed
+
+
+class _ValueMap(collections.Mapping):
+    """ The values of the wires in a Simulation, as a map from wire to value.
+
+    The values themselves are kept in a list (the value store) indexed by the
+    slot of each wire, and can be read or set through this map.
+    """
+
+    def __init__(self, slot, store):
+        self._slot = slot
+        self._store = store
+
+    def __getitem__(self, wire):
+        return self._store[self._slot[wire]]
+
+    def __setitem__(self, wire, value):
+        self._store[self._slot[wire]] = value
+
+    def __iter__(self):
+        return iter(self._slot)
+
+    def __len__(self):
+        return len(self._slot)
+
+
+class _DenseMemory(collections.MutableMapping):
+    """ The contents of a memory, held in an array with an entry for every address.
+
+    This acts like the {address: value} dict that holds the contents of a memory
+    when it is held sparsely (only the addresses that were written are in the
+    map), but takes a few bytes per address rather than a dict entry for each
+    address written, which is much smaller and faster for memories whose
+    address space is small or densely used.
+    """
+
+    def __init__(self, addrwidth, bitwidth):
+        self.addrwidth = addrwidth
+        self.bitwidth = bitwidth
+        size = 1 << addrwidth
+        self._values = array.array(_array_typecode(bitwidth), [0]) * size
+        self._written = bytearray(size)  # 1 for each address in the map
+
+    def get(self, addr, default=None):
+        return self._values[addr] if self._written[addr] else default
+
+    def __getitem__(self, addr):
+        if not self._written[addr]:
+            raise KeyError(addr)
+        return self._values[addr]
+
+    def __setitem__(self, addr, value):
+        self._values[addr] = value
+        self._written[addr] = 1
+
+    def __delitem__(self, addr):
+        if not self._written[addr]:
+            raise KeyError(addr)
+        self._written[addr] = 0
+
+    def __contains__(self, addr):
+        return 0 <= addr < len(self._written) and self._written[addr] == 1
+
+    def __iter__(self):
+        return itertools.compress(range(len(self._written)), self._written)
+
+    def __len__(self):
+        return len(self._written) - self._written.count(b'\x00')
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def copy(self):
+        memory = _DenseMemory.__new__(_DenseMemory)
+        memory.addrwidth, memory.bitwidth = self.addrwidth, self.bitwidth
+        memory._values, memory._written = self._values[:], self._written[:]
+        return memory
+
+
+# the widest address space held as a _DenseMemory when the storage is chosen automatically
+_DENSE_MEMORY_MAX_ADDRWIDTH = 16
+
+
+def _array_typecode(bitwidth):
+    """ The typecode of the smallest unsigned array.array type of at least bitwidth bits. """
+    for typecode in 'BHILQ':
+        try:
+            if array.array(str(typecode)).itemsize * 8 >= bitwidth:
+                return str(typecode)
+        except ValueError:  # there is no 'Q' before python 3.3
+            pass
+    return None
+
+
+def _new_memory(mem, dense_memories=None):
+    """ Make the empty storage for the contents of a memory: a _DenseMemory or a dict.
+
+    :param dense_memories: the memories to hold in a _DenseMemory, or None to hold
+      every memory with an address space of at most 2**_DENSE_MEMORY_MAX_ADDRWIDTH
+      in one (memories too wide for an array are always held in a dict)
+    """
+    if dense_memories is None:
+        dense = mem.addrwidth <= _DENSE_MEMORY_MAX_ADDRWIDTH
+    else:
+        dense = mem in dense_memories
+    if dense and _array_typecode(mem.bitwidth) is not None:
+        return _DenseMemory(mem.addrwidth, mem.bitwidth)
+    return {}
+
+
+def _set_memory(memories, key, mem_map):
+    """ Set the contents of a memory from memory_value_map, keeping its kind of storage. """
+    if isinstance(memories.get(key), _DenseMemory):
+        memories[key].update(mem_map)
+    else:
+        memories[key] = mem_map
+
+
+class _Checkpoint(object):
+    """ The state of a simulator at the end of a step, as returned by its checkpoint method. """
+
+    def __init__(self, simulator, block, state):
+        self.simulator = simulator  # the class of simulator the state is from
+        self.block = block
+        self.state = state
+
+    def check(self, simulator, block):
+        """ Raise a PyrtlError if the checkpoint cannot be restored to the given simulator. """
+        if simulator is not self.simulator:
+            raise PyrtlError('error, cannot restore a checkpoint of a %s in a %s'
+                             % (self.simulator.__name__, simulator.__name__))
+        if block is not self.block:
+            raise PyrtlError('error, cannot restore a checkpoint of a different block')
+
+
+def _post_synth_mems(block, mems):
+    """ The memories of the block for a collection of memories (from before synthesis). """
+    if mems is None or not isinstance(block, PostSynthBlock):
+        return mems
+    return set(block.mem_map.get(mem, mem) for mem in mems)
+
+
+def _fork_tracer(sim, tracer):
+    """ The tracer for a fork of sim: by default a new trace of the same wires. """
+    if tracer is True:
+        if sim.tracer is None:
+            return None
+        return SimulationTrace(wires_to_track=sim.tracer.wires_to_track, block=sim.block)
+    return tracer
+
+
+class _InputPlan(object):
+    """ The Inputs of a block in a fixed order, resolved and checked once for many cycles. """
+
+    def __init__(self, block, inputs=None):
+        block_inputs = block.wirevector_subset(Input)
+        if inputs is None:
+            self.wires = sorted(block_inputs, key=lambda w: w.name)
+        else:
+            self.wires = [_resolve_wire(block, w) for w in inputs]
+            for wire in self.wires:
+                if wire not in block_inputs:
+                    raise PyrtlError('"%s" is not a known input' % wire.name)
+            if len(set(self.wires)) != len(self.wires):
+                raise PyrtlError('error, an input is given more than once')
+        for wire in block_inputs.difference(self.wires):
+            raise PyrtlError('Input "%s" has no input value specified' % wire.name)
+        self.names = [w.name for w in self.wires]
+
+    def check_column(self, wire, values):
+        """ Check all of the values given for one Input. """
+        _check_column(wire, values)
+
+    def check_row(self, row):
+        """ Check the values given for all of the Inputs in one cycle. """
+        if len(row) != len(self.wires):
+            raise PyrtlError('error, expected values for %d inputs but got %d'
+                             % (len(self.wires), len(row)))
+        for wire, value in zip(self.wires, row):
+            if not isinstance(value, numbers.Integral) or value < 0 or value > wire.bitmask:
+                _check_value(wire, value)
+
+
+def _check_column(wire, values):
+    """ Check a sequence of values for an Input, checking the types and range in bulk. """
+    if len(values) == 0:
+        return
+    for value_type in set(map(type, values)):
+        if not issubclass(value_type, numbers.Integral):
+            _check_value(wire, next(v for v in values if type(v) is value_type))
+    low, high = min(values), max(values)
+    if low < 0:
+        _check_value(wire, low)
+    if high > wire.bitmask:
+        _check_value(wire, high)
+
+
+def _check_value(wire, value):
+    """ Raise the error for a bad input value (in the same form as step). """
+    if not isinstance(value, numbers.Integral) or value < 0:
+        raise PyrtlError('step provided an input "%s" which is not a valid '
+                         'positive integer' % value)
+    raise PyrtlError('the bitwidth for "%s" is %d, but the provided input %d requires %d bits '
+                     'to represent' % (wire.name, wire.bitwidth, value, len(bin(value)) - 2))
+
+
+def _resolve_wire(block, wire):
+    return block.get_wirevector_by_name(wire, strict=True) if isinstance(
+        wire, six.string_types) else wire
+
+
+def _run(sim, inputs, outputs):
+    """ Implements run for both Simulation and FastSimulation. """
+    plan = _InputPlan(sim.block, list(inputs))
+    columns = list(inputs.values())
+    lengths = set(len(column) for column in columns)
+    if len(lengths) > 1:
+        raise PyrtlError('error, the inputs are given different numbers of values')
+    for wire, column in zip(plan.wires, columns):
+        plan.check_column(wire, column)
+    out_wires = [_resolve_wire(sim.block, w) for w in outputs or ()]
+    results = [[] for _ in out_wires]
+    for row in zip(*columns):
+        sim._run_step(plan, row)
+        for result, wire in zip(results, out_wires):
+            result.append(sim._run_value(wire))
+    return {wire.name: result for wire, result in zip(out_wires, results)}
+
+
+def _run_stream(sim, values, inputs, outputs):
+    """ Implements run_stream for both Simulation and FastSimulation. """
+    plan = _InputPlan(sim.block, inputs)
+    out_wires = [_resolve_wire(sim.block, w) for w in outputs or ()]
+
+    def cycles():
+        for row in values:
+            plan.check_row(row)
+            sim._run_step(plan, row)
+            yield tuple(sim._run_value(wire) for wire in out_wires)
+    return cycles()
 
 
 # ----------------------------------------------------------------
@@ -297,6 +823,9 @@ class Simulation(object):
 #   |    /~~\ .__/  |     .__/ |  |  |
 #
 
+# the version of the code generated by FastSimulation, part of the key of the cached code
+_FASTSIM_CODE_VERSION = 1
+
 
 class FastSimulation(object):
     """A class for running JIT implementations of blocks.
@@ -307,9 +836,11 @@ class FastSimulation(object):
 
     # Dev Notes:
     #  Wire name processing:
-    #  Sanitized names are only used when using and assigning variables inside of
-    #  the generated function. Normal names are used when interacting with
-    #  the dictionaries passed in and created by the exec'ed function.
+    #  Inside of the generated function, the values of the wires are held in
+    #  locals named after the structural label of the wire (see _label_block),
+    #  so that the code only depends on the structure of the block and not on
+    #  the names of the temporary wires. Normal names are used when interacting
+    #  with the dictionaries passed in and created by the exec'ed function.
     #  Therefore, everything outside of this function uses normal
     #  WireVector names.
     #  Careful use of repr() is used to make sure that strings stay the same
@@ -317,12 +848,18 @@ class FastSimulation(object):
 
     def __init__(
             self, register_value_map=None, memory_value_map=None,
-            default_value=0, tracer=True, block=None, code_file=None):
+            default_value=0, tracer=True, block=None, code_file=None, dense_memories=None,
+            cache_dir=None):
         """
         Instantiates a Fast Simulation instance.
 
         :param code_file: The file in which to store a copy of the generated
         python code. Defaults to no code being stored.
+        :param dense_memories: the memories to hold in an array with an entry for
+        every address (see Simulation.__init__)
+        :param cache_dir: a directory in which to keep the compiled code, keyed by
+        a hash of the structure of the block, so that simulating the same design
+        again skips generating and compiling the code. Defaults to no cache.
 
         Look at Simulation.__init__ for descriptions for the other parameters
 
@@ -341,9 +878,12 @@ class FastSimulation(object):
         self.tracer = tracer
         self.sim_func = None
         self.code_file = code_file
+        self.cache_dir = cache_dir
+        self.dense_memories = _post_synth_mems(block, dense_memories)
         self.mems = {}
         self.regs = {}
-        self.internal_names = _PythonSanitizer('_fastsim_tmp_')
+        self._module_sims = {}  # map from Module->FastSimulation compiled for it
+        self._shared_mems = set()  # names of the memories shared with a checkpoint
         self._initialize(register_value_map, memory_value_map)
 
     def _initialize(self, register_value_map=None, memory_value_map=None, default_value=None):
@@ -352,9 +892,6 @@ class FastSimulation(object):
         if register_value_map is None:
             register_value_map = {}
 
-        for wire in self.block.wirevector_set:
-            self.internal_names.make_valid_string(wire.name)
-
         # set registers to their values
         reg_set = self.block.wirevector_subset(Register)
         for r in reg_set:
@@ -363,32 +900,226 @@ class FastSimulation(object):
             else:
                 self.regs[r.name] = default_value
 
+        self._label_block()
         self._initialize_mems(memory_value_map)
-
-        s = self._compiled()
+        self._instances = {}  # map from instance varname->_FastInstance
+        for net in self._nets:
+            if net.op == 'h':
+                self._instances[self._inst_varnames[net]] = _FastInstance(
+                    net.op_param[1], self._module_sim(net))
+
+        self._code = self._load_cached_code()
+        self._source = None
+        if self._code is None or self.code_file is not None:
+            self._source = self._compiled()
         if self.code_file is not None:
             with open(self.code_file, 'w') as file:
-                file.write(s)
+                file.write(self._source)
+        if self._code is None:
+            self._code = compile(self._source, '<fastsim>', 'exec')
+            self._store_cached_code()
+        self._exec_code()
 
+    def _exec_code(self):
         context = {}
-        logic_creator = compile(s, '<string>', 'exec')
-        exec(logic_creator, context)
+        exec(self._code, context)
         self.sim_func = context['sim_func']
 
+    def __getstate__(self):
+        """ The compiled function cannot be pickled, so its code is marshalled instead. """
+        state = self.__dict__.copy()
+        state['sim_func'] = None
+        state['_code'] = marshal.dumps(self._code)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._code = marshal.loads(self._code)
+        self._exec_code()
+
+    def _label_block(self):
+        """ Label the wires and nets of the block by their structure, and order the nets.
+
+        The label of a net is a hash of its op, its params, the labels of its
+        args, and the names of its dests that are visible outside of the
+        generated code (Outputs and Registers); the labels of Inputs and
+        Registers are hashes of their names, of Consts of their values, and of
+        memories of their shapes and (unless temporary) names.
+        Nets with the same label compute the same values, so only one of them
+        is compiled, and the nets are ordered by a topological sort that breaks
+        ties by label. So the generated code (and its hash, which keys the cache)
+        only depends on the structure of the block, not on the order of the sets
+        in the block or the names of the temporary wires.
+        """
+        def label(*parts):
+            return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+        def label_nets(mem_labels):
+            wire_labels = leaf_labels.copy()
+            labelled_nets = []
+            for net in self.block:  # in topological order
+                if net.op in 'm@':
+                    param = mem_labels[net.op_param[1]]
+                elif net.op == 'h':
+                    param = (net.op_param[0], self._module_sim(net)._code_hash)
+                else:
+                    param = net.op_param
+                dests = tuple((len(w), w.name if isinstance(w, (Output, Register)) else None)
+                              for w in net.dests)
+                net_label = label(net.op, param, tuple(wire_labels[w] for w in net.args), dests)
+                labelled_nets.append((net_label, net))
+                for i, wire in enumerate(net.dests):
+                    if not isinstance(wire, Register):
+                        wire_labels[wire] = '%s:%d' % (net_label, i)
+            return wire_labels, labelled_nets
+
+        def distinct(mem_labels, refine):
+            counts = collections.Counter(mem_labels.values())
+            return {mem: mem_label if counts[mem_label] == 1 else label(mem_label, refine(mem))
+                    for mem, mem_label in mem_labels.items()}
+
+        leaf_labels = {}
+        for wire in self.block.wirevector_subset((Input, Register)):
+            leaf_labels[wire] = label(type(wire).__name__, wire.name, len(wire))
+        for wire in self.block.wirevector_subset(Const):
+            leaf_labels[wire] = label('Const', wire.val, len(wire))
+
+        # memories are labelled by their shape and name, unless it is a temporary name
+        mem_labels = {}
+        for net in self.block.logic_subset('m@'):
+            mem = net.op_param[1]
+            name = None if mem.name.startswith('tmp') else mem.name
+            mem_labels[mem] = label(type(mem).__name__, mem.bitwidth, mem.addrwidth, name)
+        wire_labels, labelled_nets = label_nets(mem_labels)
+        if len(set(mem_labels.values())) < len(mem_labels):
+            # tell apart the memories that look the same by their writes (or else their ids)
+            writes = collections.defaultdict(list)
+            for net_label, net in labelled_nets:
+                if net.op == '@':
+                    writes[net.op_param[1]].append(net_label)
+            mem_labels = distinct(mem_labels, lambda mem: sorted(writes[mem]))
+            mem_labels = distinct(mem_labels, lambda mem: mem.id)
+            wire_labels, labelled_nets = label_nets(mem_labels)
+
+        producers = {}  # map from the label of a wire->the label of the net producing it
+        net_labels = {}  # map from label->a net with that label
+        for net_label, net in labelled_nets:
+            net_labels.setdefault(net_label, net)
+            for wire in net.dests:
+                if not isinstance(wire, Register):
+                    producers[wire_labels[wire]] = net_label
+
+        # topologically sort the labels of the nets, taking the smallest label that is ready
+        users = collections.defaultdict(set)
+        waiting = {}
+        for net_label, net in net_labels.items():
+            deps = {producers[wire_labels[w]] for w in net.args
+                    if wire_labels[w] in producers}
+            for dep in deps:
+                users[dep].add(net_label)
+            waiting[net_label] = len(deps)
+        ready = [net_label for net_label, count in waiting.items() if count == 0]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            net_label = heapq.heappop(ready)
+            order.append(net_label)
+            for user in users[net_label]:
+                waiting[user] -= 1
+                if waiting[user] == 0:
+                    heapq.heappush(ready, user)
+
+        # name the locals, memories, and instances in the order of the nets
+        self._nets = [net_labels[net_label] for net_label in order]
+        local_names = {}  # map from label->local
+        self._mem_varnames = {}
+        self._inst_varnames = {}
+        for net in self._nets:
+            for wire in net.dests:
+                local_names.setdefault(wire_labels[wire], 'w%d' % len(local_names))
+            if net.op in 'm@':
+                mem = net.op_param[1]
+                self._mem_varnames.setdefault(mem, 'fs_mem%d' % len(self._mem_varnames))
+            elif net.op == 'h':
+                self._inst_varnames[net] = 'fs_inst%d' % len(self._inst_varnames)
+        self._locals = {wire: local_names[wire_label] for wire, wire_label in wire_labels.items()
+                        if wire_label in local_names}
+
+        self._traced = []
+        if self.tracer is not None:
+            for wire_name in sorted(self.tracer.trace):
+                wire = self.block.get_wirevector_by_name(wire_name, strict=True)
+                if not isinstance(wire, (Input, Const, Register, Output)):
+                    self._traced.append(wire)
+        self._asserts = sorted(self.block.rtl_assert_dict.items(),
+                               key=lambda item: wire_labels[item[0]])
+        self._assert_exps = [exp for wire, exp in self._asserts]
+
+        self._code_hash = label(
+            _FASTSIM_CODE_VERSION, sys.version, self.default_value, sorted(net_labels),
+            [(wire.name, wire_labels[wire]) for wire in self._traced],
+            [wire_labels[wire] for wire, exp in self._asserts])
+
+    def _cache_file(self):
+        return os.path.join(self.cache_dir, self._code_hash + '.fastsim')
+
+    def _load_cached_code(self):
+        """ Return the code compiled for a block with the same structure, if in the cache. """
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._cache_file(), 'rb') as file:
+                return marshal.loads(file.read())
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return None  # not cached (or unreadable), so the code is compiled again
+
+    def _store_cached_code(self):
+        if self.cache_dir is None:
+            return
+        try:
+            os.makedirs(self.cache_dir)
+        except OSError:
+            if not os.path.isdir(self.cache_dir):
+                raise
+        # write a temporary file and rename it, so that no one reads a partial file
+        fd, path = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, 'wb') as file:
+            file.write(marshal.dumps(self._code))
+        os.rename(path, self._cache_file())
+
     def _initialize_mems(self, memory_value_map):
+        for mem, varname in self._mem_varnames.items():
+            if isinstance(mem, RomBlock):
+                self.mems[varname] = mem
+            else:
+                self.mems[varname] = _new_memory(mem, self.dense_memories)
+
         if memory_value_map is not None:
             for (mem, mem_map) in memory_value_map.items():
                 if isinstance(mem, RomBlock):
                     raise PyrtlError('error, one or more of the memories in the map is a RomBlock')
-                self.mems[self._mem_varname(mem)] = mem_map
-
-        for net in self.block.logic_subset('m@'):
-            mem = net.op_param[1]
-            if self._mem_varname(mem) not in self.mems:
-                if isinstance(mem, RomBlock):
-                    self.mems[self._mem_varname(mem)] = mem
-                else:
-                    self.mems[self._mem_varname(mem)] = {}
+                _set_memory(self.mems, self._mem_varname(mem), mem_map)
+
+    def _module_sim(self, net):
+        """ Return the FastSimulation of the module of an instance, compiling it once. """
+        module = net.op_param[1]
+        if module not in self._module_sims:
+            module_sim = FastSimulation.__new__(FastSimulation)
+            module.block.sanity_check()
+            module_sim.block = module.block
+            module_sim.default_value = self.default_value
+            module_sim.tracer = None
+            module_sim.sim_func = None
+            module_sim.code_file = None
+            module_sim.cache_dir = self.cache_dir
+            module_sim.dense_memories = self.dense_memories
+            module_sim.mems = {}
+            module_sim.regs = {}
+            module_sim._module_sims = self._module_sims
+            module_sim._shared_mems = set()
+            module_sim._initialize()
+            self._module_sims[module] = module_sim
+        return self._module_sims[module]
 
     def step(self, provided_inputs):
         """ Run the simulation for a cycle
@@ -404,16 +1135,24 @@ class FastSimulation(object):
                 raise PyrtlError("Wire {} has value {} which cannot be represented"
                                  " using its bitwidth".format(wire, value))
 
+        self._step({self._to_name(wire): value for wire, value in provided_inputs.items()})
+
+    def _step(self, ins):
+        """ Run a cycle, given a map from the names of the Inputs to their (checked) values. """
         # building the simulation data
-        ins = {self._to_name(wire): value for wire, value in provided_inputs.items()}
         ins.update(self.regs)
         ins.update(self.mems)
+        ins.update(self._instances)
 
         # propagate through logic
-        self.regs, self.outs, mem_writes = self.sim_func(ins)
+        self.regs, self.outs, mem_writes, failed = self.sim_func(ins)
 
         for mem, addr, value in mem_writes:
+            if mem in self._shared_mems:  # copy on the first write after a checkpoint
+                self.mems[mem] = self.mems[mem].copy()
+                self._shared_mems.discard(mem)
             self.mems[mem][addr] = value
+        failures = [instance.update_state() for instance in self._instances.values()]
 
         # for tracer compatibility
         self.context = self.outs.copy()
@@ -421,8 +1160,31 @@ class FastSimulation(object):
         if self.tracer is not None:
             self.tracer.add_fast_step(self)
 
-        # check the rtl assertions
-        check_rtl_assertions(self)
+        # the rtl assertions are checked by sim_func, which returns the first one failing
+        for failure in failures:
+            if failure is not None:
+                module_sim, index = failure
+                raise module_sim._assert_exps[index]
+        if failed >= 0:
+            raise self._assert_exps[failed]
+
+    def run(self, inputs, outputs=None):
+        """ Run the simulation for a number of cycles (see Simulation.run).
+
+        Only the values of Inputs, Outputs, Registers, and the wires being traced
+        can be collected as outputs.
+        """
+        return _run(self, inputs, outputs)
+
+    def run_stream(self, values, inputs=None, outputs=None):
+        """ Run the simulation for each tuple of input values (see Simulation.run_stream). """
+        return _run_stream(self, values, inputs, outputs)
+
+    def _run_step(self, plan, row):
+        self._step(dict(zip(plan.names, row)))
+
+    def _run_value(self, wire):
+        return self.context[wire.name]
 
     def inspect(self, w):
         """ Get the value of a wirevector in the last simulation cycle.
@@ -447,7 +1209,7 @@ class FastSimulation(object):
         """ Get the values in a map during the current simulation cycle.
 
         :param mem: the memory to inspect
-        :return: {address: value}
+        :return: {address: value} (for a memory held densely, a map that acts like a dict)
 
         Note that this returns the current memory state. Modifying the dictonary
         will also modify the state in the simulator
@@ -456,6 +1218,43 @@ class FastSimulation(object):
             raise PyrtlError("ROM blocks are not stored in the simulation object")
         return self.mems[self._mem_varname(mem)]
 
+    def checkpoint(self):
+        """ Take a snapshot of the state of the simulation (see Simulation.checkpoint). """
+        return _Checkpoint(FastSimulation, self.block, self._get_state())
+
+    def restore(self, checkpoint):
+        """ Return the simulation to the state of a checkpoint (see Simulation.restore). """
+        checkpoint.check(FastSimulation, self.block)
+        self._set_state(checkpoint.state)
+
+    def fork(self, tracer=True):
+        """ Return a new FastSimulation starting from the current state (see Simulation.fork). """
+        sim = FastSimulation(default_value=self.default_value, tracer=_fork_tracer(self, tracer),
+                             block=self.block, cache_dir=self.cache_dir)
+        sim.restore(self.checkpoint())
+        return sim
+
+    def _get_state(self):
+        self._shared_mems.update(self._ram_names())
+        instances = {name: instance._get_state() for name, instance in self._instances.items()}
+        context = getattr(self, 'context', None)
+        return dict(self.regs), dict(self.mems), instances, context and dict(context)
+
+    def _set_state(self, state):
+        regs, mems, instances, context = state
+        self.regs = dict(regs)
+        self.mems = dict(mems)
+        self._shared_mems = set(self._ram_names())
+        for name, instance_state in instances.items():
+            self._instances[name]._set_state(instance_state)
+        if context is not None:
+            self.context = dict(context)
+        elif hasattr(self, 'context'):
+            del self.context
+
+    def _ram_names(self):
+        return [name for name, mem in self.mems.items() if not isinstance(mem, RomBlock)]
+
     def _to_name(self, name):
         """ Converts Wires to strings, keeps strings as is """
         if isinstance(name, WireVector):
@@ -464,10 +1263,10 @@ class FastSimulation(object):
 
     def _varname(self, val):
         """ Converts WireVectors to internal names """
-        return self.internal_names[val.name]
+        return self._locals[val]
 
     def _mem_varname(self, val):
-        return 'fs_mem' + str(val.id)
+        return self._mem_varnames.get(val, 'fs_mem_' + str(val.id))  # or a memory not used
 
     def _arg_varname(self, wire):
         """
@@ -556,7 +1355,7 @@ class FastSimulation(object):
                 bit = '(%d & (%s >> %d))' % ((1 << split_length) - 1, source, split_start_bit)
             return shift(bit, '<<', split_res_start_bit)
 
-        for net in self.block:
+        for net in self._nets:
             if net.op in simple_func:
                 argvals = (self._arg_varname(arg) for arg in net.args)
                 expr = simple_func[net.op](*argvals)
@@ -600,6 +1399,12 @@ class FastSimulation(object):
                 prog.append('        mem_ws.append(("{}", {}, {}))'
                             .format(mem, write_addr, write_val))
                 continue  # memwrites are special
+            elif net.op == 'h':
+                results = ''.join(self._dest_varname(dest) + ', ' for dest in net.dests)
+                argvals = ', '.join(self._arg_varname(arg) for arg in net.args)
+                prog.append('    {}= d["{}"]({})'.format(
+                    results or '_ ', self._inst_varnames[net], argvals))
+                continue  # the outputs of an instance are already masked
             else:
                 raise PyrtlError('FastSimulation cannot handle primitive "%s"' % net.op)
 
@@ -612,17 +1417,83 @@ class FastSimulation(object):
                 prog.append('    %s = %s & %s' % (result, mask, expr))
 
         # add traced wires to dict
-        if self.tracer is not None:
-            for wire_name in self.tracer.trace:
-                wire = self.block.wirevector_by_name[wire_name]
-                if not isinstance(wire, (Input, Const, Register, Output)):
-                    v_wire_name = self._varname(wire)
-                    prog.append('    outs["%s"] = %s' % (wire_name, v_wire_name))
+        for wire in self._traced:
+            prog.append('    outs[%s] = %s' % (repr(wire.name), self._varname(wire)))
 
-        prog.append("    return regs, outs, mem_ws")
+        # check the rtl assertions, finding the index of the first one failing (or -1)
+        assert_values = [self._dest_varname(wire) for wire, exp in self._asserts]
+        prog.append('    failed = -1')
+        if assert_values:
+            prog.append('    if not (%s):' % ' and '.join(assert_values))
+            prog.append('        failed = [%s].index(0)' % ', '.join(assert_values))
+
+        prog.append("    return regs, outs, mem_ws, failed")
         return '\n'.join(prog)
 
 
+class _FastInstance(object):
+    """ The state of one instance of a Module in a FastSimulation.
+
+    Calling the instance evaluates it (with the code compiled for its module)
+    and returns the values of its outputs; update_state then does the register
+    and memory updates at the end of the step.
+    """
+
+    def __init__(self, module, module_sim):
+        self.module = module
+        self.module_sim = module_sim
+        self.input_names = [w.name for w in module.inputs]
+        self.output_names = [w.name for w in module.outputs]
+        self.regs = dict(module_sim.regs)
+        self.mems = {name: mem if isinstance(mem, RomBlock) else mem.copy()
+                     for name, mem in module_sim.mems.items()}
+        self.instances = {name: _FastInstance(inst.module, inst.module_sim)
+                          for name, inst in module_sim._instances.items()}
+        self._next_state = None
+        self._shared_mems = set()
+
+    def __call__(self, *args):
+        ins = dict(zip(self.input_names, args))
+        ins.update(self.regs)
+        ins.update(self.mems)
+        ins.update(self.instances)
+        regs, outs, mem_writes, failed = self.module_sim.sim_func(ins)
+        self._next_state = regs, mem_writes, failed
+        return tuple(outs[name] for name in self.output_names)
+
+    def update_state(self):
+        """ Do the register and memory updates of the instance (and the instances in it).
+
+        Returns (module_sim, index) for the first rtl_assert failing in the step,
+        or None if they all hold, for the caller to raise once every instance
+        has been updated.
+        """
+        self.regs, mem_writes, failed = self._next_state
+        for mem, addr, value in mem_writes:
+            if mem in self._shared_mems:
+                self.mems[mem] = self.mems[mem].copy()
+                self._shared_mems.discard(mem)
+            self.mems[mem][addr] = value
+        failures = [instance.update_state() for instance in self.instances.values()]
+        failures.append((self.module_sim, failed) if failed >= 0 else None)
+        return next((failure for failure in failures if failure is not None), None)
+
+    def _get_state(self):
+        self._shared_mems.update(name for name, mem in self.mems.items()
+                                 if not isinstance(mem, RomBlock))
+        instances = {name: instance._get_state() for name, instance in self.instances.items()}
+        return dict(self.regs), dict(self.mems), instances
+
+    def _set_state(self, state):
+        regs, mems, instances = state
+        self.regs = dict(regs)
+        self.mems = dict(mems)
+        self._shared_mems = set(name for name, mem in mems.items()
+                                if not isinstance(mem, RomBlock))
+        for name, instance_state in instances.items():
+            self.instances[name]._set_state(instance_state)
+
+
 # ----------------------------------------------------------------
 #    ___  __        __   ___
 #     |  |__)  /\  /  ` |__
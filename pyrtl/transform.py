@@ -37,7 +37,7 @@ def net_transform(transform_func, block=None, **kwargs):
         for net in block.logic.copy():
             keep_orig_net = transform_func(net, **kwargs)
             if not keep_orig_net:
-                block.logic.remove(net)
+                block.remove_net(net)
 
 
 def all_nets(transform_func):
@@ -89,7 +89,7 @@ def replace_wire(orig_wire, new_src, new_dst, block=None):
                         op=net.op, op_param=net.op_param, args=net.args,
                         dests=tuple(new_src if w is orig_wire else w for w in net.dests))
                     block.add_net(new_net)
-                    block.logic.remove(net)
+                    block.remove_net(net)
                     break
 
     if new_dst is not orig_wire:
@@ -100,7 +100,7 @@ def replace_wire(orig_wire, new_src, new_dst, block=None):
                         op=net.op, op_param=net.op_param, dests=net.dests,
                         args=tuple(new_src if w is orig_wire else w for w in net.args))
                     block.add_net(new_net)
-                    block.logic.remove(net)
+                    block.remove_net(net)
 
     if new_dst is not orig_wire and new_src is not orig_wire:
         block.remove_wirevector(orig_wire)
@@ -120,27 +120,37 @@ def replace_wires(wire_map, block=None):
 
 
 def replace_wire_fast(orig_wire, new_src, new_dst, src_nets, dst_nets, block=None):
+    """ Replace orig_wire using the connection maps src_nets and dst_nets
+
+    src_nets and dst_nets are expected to be the maps returned by
+    block.net_connections(), which the block keeps up to date itself.  If they
+    are instead private copies, they are updated here as nets are replaced.
+    """
     def remove_net(net_):
-        for arg in set(net_.args):
-            dst_nets[arg].remove(net_)
-            if not len(dst_nets[arg]):
-                del dst_nets[arg]
-        if len(net_.dests) == 1:
-            del src_nets[net_.dests[0]]
-        block.logic.remove(net_)
+        if not live_maps:
+            for arg in set(net_.args):
+                dst_nets[arg].remove(net_)
+                if not len(dst_nets[arg]):
+                    del dst_nets[arg]
+            if len(net_.dests) == 1:
+                del src_nets[net_.dests[0]]
+        block.remove_net(net_)
 
     def add_net(net_):
-        for arg in set(net_.args):
-            if arg not in dst_nets:
-                dst_nets[arg] = [net_]
-            else:
-                dst_nets[arg].append(net_)
-        if len(net_.dests) == 1:
-            src_nets[net_.dests[0]] = net_
-        block.add_net(new_net)
+        if not live_maps:
+            for arg in set(net_.args):
+                if arg not in dst_nets:
+                    dst_nets[arg] = [net_]
+                else:
+                    dst_nets[arg].append(net_)
+            if len(net_.dests) == 1:
+                src_nets[net_.dests[0]] = net_
+        block.add_net(net_)
 
     # src and dst in this function are all relative to wires
     block = working_block(block)
+    live_src, live_dst = block.net_connections()
+    live_maps = src_nets is live_src and dst_nets is live_dst
     if new_src is not orig_wire and orig_wire in src_nets:
         # don't need to add the new_src and new_dst because they were made added at creation
         net = src_nets[orig_wire]
@@ -192,8 +202,9 @@ def copy_block(block=None, update_working_block=True):
     block_in = working_block(block)
     block_out, temp_wv_map = _clone_block_and_wires(block_in)
     mems = {}
-    for net in block_in.logic:
-        _copy_net(block_out, net, temp_wv_map, mems)
+    with block_out.bulk_build():
+        for net in block_in.logic:
+            _copy_net(block_out, net, temp_wv_map, mems)
     block_out.mem_map = mems
 
     if update_working_block:
@@ -213,7 +224,7 @@ def _clone_block_and_wires(block_in):
     block_in.sanity_check()  # make sure that everything is valid
     block_out = block_in.__class__()
     temp_wv_map = {}
-    with set_working_block(block_out, no_sanity_check=True):
+    with set_working_block(block_out, no_sanity_check=True), block_out.bulk_build():
         for wirevector in block_in.wirevector_subset():
             new_wv = clone_wire(wirevector)
             temp_wv_map[wirevector] = new_wv
@@ -47,6 +47,22 @@ def next_tempvar_name(name=""):
         return name
 
 
+def _build_net(op, op_param, args, bitwidth):
+    """ Add a net computing op over args to the working block, returning its new dest.
+
+    If structural hashing is on for the block and it already has an equivalent
+    net, the dest of that net is returned instead.
+    """
+    block = working_block()
+    if block._net_keys is not None:
+        net = block.find_equivalent_net(op, op_param, args)
+        if net is not None and net.dests[0].bitwidth == bitwidth:
+            return net.dests[0]
+    dest = WireVector(bitwidth=bitwidth)
+    block.add_net(LogicNet(op=op, op_param=op_param, args=args, dests=(dest,)))
+    return dest
+
+
 class WireVector(object):
     """ The main class for describing the connections between operators.
 
@@ -63,6 +79,10 @@ class WireVector(object):
     # Each class inheriting from WireVector should overload accordingly
     _code = 'W'
 
+    # WireVectors are created by the hundreds of thousands so they have no
+    # per-instance __dict__ (subclasses should declare their own __slots__)
+    __slots__ = ('_name', '_block', 'bitwidth', '_bitmask', 'init_call_stack')
+
     def __init__(self, bitwidth=None, name='', block=None):
         """ Construct a generic WireVector
 
@@ -78,7 +98,12 @@ class WireVector(object):
 
         # used only to verify the one to one relationship of wires and blocks
         self._block = working_block(block)
-        self.name = next_tempvar_name(name)
+        if name == '' and not core._setting_slower_but_more_descriptive_tmps:
+            # temporaries keep just their index, and their name is made when asked for
+            self._name = _wvIndexer.next_index()
+            self._block.add_wirevector(self)
+        else:
+            self.name = next_tempvar_name(name)
         self._validate_bitwidth(bitwidth)
 
         if core._setting_keep_wirevector_call_stack:
@@ -87,6 +112,9 @@ class WireVector(object):
 
     @property
     def name(self):
+        """ The name of the wire (for temporaries, "tmp" followed by the index of the wire). """
+        if isinstance(self._name, int):
+            return _wvIndexer.internal_prefix + str(self._name)
         return self._name
 
     @name.setter
@@ -97,8 +125,9 @@ class WireVector(object):
         self._name = value
         self._block.add_wirevector(self)
 
-    def __hash__(self):
-        return id(self)
+    # hash by identity (as the C-level default, as this is called on every set
+    # and dict operation on wires) since __eq__ is overloaded to build hardware
+    __hash__ = object.__hash__
 
     def __str__(self):
         """ A string representation of the wire in 'name/bitwidth code'  form """
@@ -163,14 +192,7 @@ class WireVector(object):
         elif op in '<>=':
             resultlen = 1
 
-        s = WireVector(bitwidth=resultlen)
-        net = LogicNet(
-            op=op,
-            op_param=None,
-            args=(a, b),
-            dests=(s,))
-        working_block().add_net(net)
-        return s
+        return _build_net(op, None, (a, b), resultlen)
 
     def __bool__(self):
         """ Use of a wirevector in a statement like "a or b" is forbidden."""
@@ -322,14 +344,7 @@ class WireVector(object):
         Creates LogicNets that inverts a wire
         :return Wirevector: a result wire for the operation
         """
-        outwire = WireVector(bitwidth=len(self))
-        net = LogicNet(
-            op='~',
-            op_param=None,
-            args=(self,),
-            dests=(outwire,))
-        working_block().add_net(net)
-        return outwire
+        return _build_net('~', None, (self,), len(self))
 
     def __getitem__(self, item):
         """
@@ -345,14 +360,7 @@ class WireVector(object):
             selectednums = tuple(allindex[item])
         if not selectednums:
             raise PyrtlError('selection %s must have at least select one wire' % str(item))
-        outwire = WireVector(bitwidth=len(selectednums))
-        net = LogicNet(
-            op='s',
-            op_param=selectednums,
-            args=(self,),
-            dests=(outwire,))
-        working_block().add_net(net)
-        return outwire
+        return _build_net('s', selectednums, (self,), len(selectednums))
 
     def __lshift__(self, other):
         raise PyrtlError("Shifting using the << and >> operators are not supported"
@@ -397,9 +405,11 @@ class WireVector(object):
     @property
     def bitmask(self):
         """ Return an integer appropriate as a bitmask for this wirevector. """
-        if "_bitmask" not in self.__dict__:
+        try:
+            return self._bitmask
+        except AttributeError:
             self._bitmask = (1 << len(self)) - 1
-        return self._bitmask
+            return self._bitmask
 
     def sign_extended(self, bitwidth):
         """ Return a sign extended wirevector derived from self """
@@ -420,14 +430,8 @@ class WireVector(object):
         else:
             from .corecircuits import concat
             if isinstance(extbit, int):
-                extbit = Const(extbit, bitwidth=1)
-            extvector = WireVector(bitwidth=numext)
-            net = LogicNet(
-                op='s',
-                op_param=(0,)*numext,
-                args=(extbit,),
-                dests=(extvector,))
-            working_block().add_net(net)
+                extbit = _interned_const(extbit, bitwidth=1)
+            extvector = _build_net('s', (0,)*numext, (extbit,), numext)
             return concat(extvector, self)
 
 
@@ -440,6 +444,7 @@ class WireVector(object):
 class Input(WireVector):
     """ A WireVector type denoting inputs to a block (no writers) """
     _code = 'I'
+    __slots__ = ()
 
     def __init__(self, bitwidth=None, name='', block=None):
         super(Input, self).__init__(bitwidth=bitwidth, name=name, block=block)
@@ -467,11 +472,27 @@ class Output(WireVector):
     them will throw an error.
     """
     _code = 'O'
+    __slots__ = ()
 
     def __init__(self, bitwidth=None, name='', block=None):
         super(Output, self).__init__(bitwidth, name, block)
 
 
+def _interned_const(val, bitwidth=None, block=None):
+    """ Return a Const of val, reusing the one already made for the same literal in the block.
+
+    Integer (and string) literals used in expressions, such as the 1 in "x + 1",
+    are converted through this, so that a block has one Const for each distinct
+    (literal, bitwidth) pair rather than one for every use of a literal.
+    """
+    block = working_block(block)
+    key = (type(val), val, bitwidth)  # as True == 1, but Const(True, 4) is an error
+    const = block._interned_consts.get(key)
+    if const is None or const not in block.wirevector_set:
+        const = block._interned_consts[key] = Const(val, bitwidth=bitwidth, block=block)
+    return const
+
+
 class Const(WireVector):
     """ A WireVector representation of a constant value
 
@@ -483,6 +504,7 @@ class Const(WireVector):
     to a two's complement representation of the specified bitwidth."""
 
     _code = 'C'
+    __slots__ = ('val',)
 
     def __init__(self, val, bitwidth=None, block=None):
         """ Construct a constant implementation at initialization
@@ -606,6 +628,7 @@ class Register(WireVector):
     to specify a counter it would look like: "a.next <<= a + 1"
     """
     _code = 'R'
+    __slots__ = ('reg_in',)
 
     # When the register is called as such:  r.next <<= foo
     # the sequence of actions that happens is:
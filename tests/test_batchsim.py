@@ -0,0 +1,129 @@
+import unittest
+import random
+import pyrtl
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, 'BatchSimulation requires numpy')
+class TestBatchSimulation(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        self.rand = random.Random(5)
+
+    def build(self):
+        a, b = pyrtl.Input(8, 'a'), pyrtl.Input(8, 'b')
+        acc = pyrtl.Register(16, 'acc')
+        mem = pyrtl.MemBlock(8, 4, name='mem')
+        rom = pyrtl.RomBlock(8, 3, [3, 1, 4, 1, 5, 9, 2, 6], name='rom')
+        acc.next <<= pyrtl.select(a < b, acc + a, acc - b)
+        mem[a[2:6]] <<= b ^ a
+        s = pyrtl.Output(17, 's')
+        s <<= a + b
+        p = pyrtl.Output(16, 'p')
+        p <<= a * b
+        cmp = pyrtl.Output(3, 'cmp')
+        cmp <<= pyrtl.concat(a < b, a > b, a == b)
+        bits = pyrtl.Output(8, 'bits')
+        bits <<= ~pyrtl.concat(a[5], a[0], b[7], a[1:4], a.nand(b)[:2])
+        m = pyrtl.Output(8, 'm')
+        m <<= mem[b[:4]] | rom[a[:3]]
+        acc_out = pyrtl.Output(16, 'acc_out')
+        acc_out <<= acc
+
+    def reference(self, inputs, names):
+        """ The values of the wires in each cycle (and instance), from Simulation. """
+        cycles, instances = inputs['a'].shape
+        results = {name: numpy.zeros((cycles, instances), dtype=object) for name in names}
+        for i in range(instances):
+            sim = pyrtl.Simulation(tracer=None)
+            for cycle in range(cycles):
+                sim.step({name: int(values[cycle, i]) for name, values in inputs.items()})
+                for name in names:
+                    results[name][cycle, i] = sim.inspect(name)
+        return results
+
+    def test_run_matches_simulation(self):
+        self.build()
+        inputs = {name: numpy.array([[self.rand.randrange(256) for _ in range(9)]
+                                     for _ in range(12)]) for name in 'ab'}
+        names = ['s', 'p', 'cmp', 'bits', 'm', 'acc_out']
+        outputs = pyrtl.BatchSimulation(tracer=None, instances=9).run(inputs)
+        self.assertEqual(sorted(outputs), sorted(names))
+        expected = self.reference(inputs, names)
+        for name in names:
+            self.assertEqual(outputs[name].shape, (12, 9))
+            self.assertEqual(outputs[name].tolist(), expected[name].tolist())
+
+    def test_wide_wires(self):
+        a, b = pyrtl.Input(70, 'a'), pyrtl.Input(40, 'b')
+        acc = pyrtl.Register(80, 'acc')
+        acc.next <<= acc ^ (a * b)[:80]
+        p = pyrtl.Output(110, 'p')
+        p <<= a * b
+        d = pyrtl.Output(71, 'd')
+        d <<= a - b
+        low = pyrtl.Output(40, 'low')
+        low <<= pyrtl.select(a > b, a[:40], b)
+        top = pyrtl.Output(64, 'top')
+        top <<= pyrtl.concat(a[60:], b[:54])
+        acc_out = pyrtl.Output(80, 'acc_out')
+        acc_out <<= acc
+        inputs = {'a': numpy.array([[self.rand.getrandbits(70) for _ in range(4)]
+                                    for _ in range(5)], dtype=object),
+                  'b': numpy.array([[self.rand.getrandbits(40) for _ in range(4)]
+                                    for _ in range(5)], dtype=numpy.uint64)}
+        names = ['p', 'd', 'low', 'top', 'acc_out']
+        outputs = pyrtl.BatchSimulation(tracer=None, instances=4).run(inputs, names)
+        expected = self.reference(inputs, names)
+        for name in names:
+            self.assertEqual(outputs[name].tolist(), expected[name].tolist())
+        self.assertEqual(outputs['p'].dtype, object)
+        self.assertEqual(outputs['top'].dtype, numpy.uint64)
+
+    def test_step_memories_and_trace(self):
+        addr, data = pyrtl.Input(30, 'addr'), pyrtl.Input(8, 'data')
+        big = pyrtl.MemBlock(8, 30, name='big')
+        small = pyrtl.MemBlock(8, 2, name='small')
+        big[addr] <<= pyrtl.MemBlock.EnabledWrite(data, data != 0)
+        small[addr[:2]] <<= data
+        o = pyrtl.Output(8, 'o')
+        o <<= big[addr] + small[addr[:2]]
+        sim = pyrtl.BatchSimulation(instances=3, memory_value_map={small: {1: 7}})
+        sim.step({'addr': [5, 2**29, 5], 'data': [1, 2, 0]})
+        sim.step({'addr': 5, 'data': 0})
+        self.assertEqual(sim.inspect('o').tolist(), [1 + 1, 0 + 7, 0 + 0])
+        self.assertEqual(sim.inspect_mem(big), [{5: 1}, {2**29: 2}, {}])
+        self.assertEqual(sim.inspect_mem(small), [{}, {0: 2}, {}])
+        self.assertEqual(sim.tracer.trace['o'], [7, 2])
+
+    def test_bad_inputs(self):
+        self.build()
+        sim = pyrtl.BatchSimulation(instances=2)
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.inspect('s')
+        for bad in ({'a': 256, 'b': 0}, {'a': [1, 2, 3], 'b': 0}, {'a': [1, -1], 'b': 0},
+                    {'a': [1.5, 1], 'b': 0}, {'a': 1}, {'a': 1, 'b': 1, 's': 1}):
+            with self.assertRaises(pyrtl.PyrtlError):
+                sim.step(bad)
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run({'a': [[1, 2]], 'b': [[1, 2], [3, 4]]})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run({'a': [1, 2], 'b': [1, 2]})
+
+    def test_assertion_in_any_instance(self):
+        a = pyrtl.Input(4, 'a')
+        o = pyrtl.Output(4, 'o')
+        o <<= a
+        pyrtl.rtl_assert(a != 7, pyrtl.PyrtlError('a is 7'))
+        sim = pyrtl.BatchSimulation(instances=4)
+        sim.step({'a': [0, 1, 2, 4]})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.step({'a': [0, 1, 2, 7]})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+import random
+import pyrtl
+
+
+class TestBitSliceSimulation(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        self.rand = random.Random(11)
+
+    def build(self):
+        a, b = pyrtl.Input(4, 'a'), pyrtl.Input(4, 'b')
+        s, lt, m = pyrtl.Output(5, 's'), pyrtl.Output(1, 'lt'), pyrtl.Output(4, 'm')
+        acc = pyrtl.Register(6, 'acc')
+        mem = pyrtl.MemBlock(4, 2, name='mem')
+        acc.next <<= acc + pyrtl.select(a < b, a, b)
+        mem[a[:2]] <<= b
+        s <<= a + b
+        lt <<= a < b
+        m <<= mem[b[:2]]
+
+    def test_lanes_match_simulation(self):
+        self.build()
+        pyrtl.synthesize()
+        lanes = 70
+        steps = [{'a': [self.rand.randrange(16) for _ in range(lanes)],
+                  'b': [self.rand.randrange(16) for _ in range(lanes)]} for _ in range(6)]
+        sim = pyrtl.BitSliceSimulation(lanes=lanes)
+        results = []
+        for step in steps:
+            sim.step(step)
+            results.append({name: sim.inspect(name) for name in ('s', 'lt', 'm')})
+
+        for lane in (0, 1, 37, lanes - 1):
+            ref = pyrtl.Simulation(tracer=None)
+            for step, result in zip(steps, results):
+                ref.step({name: values[lane] for name, values in step.items()})
+                for name, values in result.items():
+                    self.assertEqual(values[lane], ref.inspect(name))
+
+    def test_same_trace_as_simulation(self):
+        self.build()
+        pyrtl.synthesize()
+        inputs = [{'a': self.rand.randrange(16), 'b': self.rand.randrange(16)} for _ in range(8)]
+        traces = []
+        for sim_class in (pyrtl.Simulation, pyrtl.BitSliceSimulation):
+            sim = sim_class()
+            for step in inputs:
+                sim.step(step)
+            traces.append({name: sim.tracer.trace[name] for name in ('s', 'lt', 'm')})
+        self.assertEqual(traces[0], traces[1])
+
+    def test_nand_synth_and_io_map(self):
+        self.build()
+        a = pyrtl.working_block().get_wirevector_by_name('a')
+        pyrtl.synthesize()
+        pyrtl.nand_synth()
+        sim = pyrtl.BitSliceSimulation(lanes=3, tracer=None)
+        sim.step({a: [1, 2, 3], 'b': 5})
+        self.assertEqual(sim.inspect('s'), [6, 7, 8])
+        self.assertEqual(sim.inspect(a), [1, 2, 3])
+
+    def test_bad_blocks_and_inputs(self):
+        a = pyrtl.Input(4, 'a')
+        o = pyrtl.Output(5, 'o')
+        o <<= a + 1
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.BitSliceSimulation()
+        pyrtl.synthesize()
+        sim = pyrtl.BitSliceSimulation(lanes=2)
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.inspect('o')
+        for bad in ({'a': 16}, {'a': [1, 2, 3]}, {}, {'a': 1, 'o': 1}):
+            with self.assertRaises(pyrtl.PyrtlError):
+                sim.step(bad)
+
+    def test_assertion_in_any_lane(self):
+        a = pyrtl.Input(4, 'a')
+        o = pyrtl.Output(4, 'o')
+        o <<= a
+        pyrtl.rtl_assert(~(a[0] & a[1]), pyrtl.PyrtlError('a ends in 11'))
+        sim = pyrtl.BitSliceSimulation(lanes=4)
+        sim.step({'a': [0, 1, 2, 4]})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.step({'a': [0, 1, 2, 7]})
+
+
+if __name__ == "__main__":
+    unittest.main()
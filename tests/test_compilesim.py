@@ -723,6 +723,48 @@ class TraceErrorBase(unittest.TestCase):
             self.sim_trace.print_trace(base=4)
 
 
+class CheckpointBase(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        a = pyrtl.Input(4, 'a')
+        o = pyrtl.Output(8, 'o')
+        count = pyrtl.Register(4, 'count')
+        count.next <<= count + 1
+        mem = pyrtl.MemBlock(4, 4, name='mem')
+        mem[count] <<= a
+        o <<= pyrtl.concat(mem[a], count)
+
+    def run_sim(self, sim, values):
+        for value in values:
+            sim.step({'a': value})
+        return sim.tracer.trace['o'][-len(values):]
+
+    def test_restore(self):
+        sim = self.sim()
+        self.run_sim(sim, [3, 1, 4, 1, 5, 9])
+        checkpoint = sim.checkpoint()
+        first = self.run_sim(sim, [2, 6, 5, 3, 5])
+        sim.restore(checkpoint)
+        self.assertNotEqual(self.run_sim(sim, [1, 1, 1, 1, 1]), first)
+        sim.restore(checkpoint)
+        self.assertEqual(self.run_sim(sim, [2, 6, 5, 3, 5]), first)
+
+    def test_fork(self):
+        sim = self.sim()
+        self.run_sim(sim, [3, 1, 4, 1, 5, 9])
+        fork = sim.fork()
+        forked = self.run_sim(fork, [2, 6, 5, 3, 5])
+        self.assertEqual(len(fork.tracer), 5)
+        self.run_sim(fork, [7, 7, 7])
+        self.assertEqual(self.run_sim(sim, [2, 6, 5, 3, 5]), forked)
+
+    def test_restore_other_block(self):
+        checkpoint = self.sim().checkpoint()
+        self.setUp()
+        with self.assertRaises(pyrtl.PyrtlError):
+            self.sim().restore(checkpoint)
+
+
 def make_unittests():
     """
     Generates separate unittests for each of the simulators
@@ -1,5 +1,7 @@
 from __future__ import print_function
 import unittest
+import copy
+import pickle
 import pyrtl
 
 
@@ -51,6 +53,16 @@ class TestBlock(unittest.TestCase):
         with self.assertRaises(pyrtl.PyrtlError):
             foo = net1 >= net2
 
+    def test_logic_net_hash(self):
+        a = pyrtl.WireVector(bitwidth=3)
+        b = pyrtl.WireVector(bitwidth=3)
+        net1 = pyrtl.LogicNet(op='s', op_param=(0, 1, 2), args=(a,), dests=(b,))
+        net2 = pyrtl.LogicNet(op='s', op_param=(0, 1, 2), args=(a,), dests=(b,))
+        net3 = pyrtl.LogicNet(op='s', op_param=(2, 1, 0), args=(a,), dests=(b,))
+        self.assertEqual(hash(net1), hash(net2))
+        self.assertEqual(len({net1, net2, net3}), 2)
+        self.assertFalse(hasattr(net1, '__dict__'))
+
     def test_logicsubset_no_op(self):
         w = pyrtl.WireVector(name='testwire1', bitwidth=1)
         v = pyrtl.WireVector(name='testwire2', bitwidth=1)
@@ -58,6 +70,31 @@ class TestBlock(unittest.TestCase):
         block = pyrtl.working_block()
         self.assertEqual(block.logic_subset(None), block.logic)
 
+    def test_subsets_follow_changes(self):
+        class SpecialInput(pyrtl.Input):
+            __slots__ = ()
+        a = pyrtl.Input(1, 'a')
+        b = SpecialInput(1, 'b')
+        r = pyrtl.Register(1, 'r')
+        c = pyrtl.Const(1)
+        r.next <<= a & b
+        block = pyrtl.working_block()
+        self.assertEqual(block.wirevector_subset(pyrtl.Input), {a, b})
+        self.assertEqual(block.wirevector_subset((pyrtl.Register, pyrtl.Const)), {r, c})
+        self.assertEqual(block.wirevector_subset(pyrtl.Input, exclude=SpecialInput), {a})
+        self.assertEqual(len(block.wirevector_subset(exclude=pyrtl.Input)),
+                         len(block.wirevector_set) - 2)
+        and_net = block.logic_subset('&').pop()
+        reg_net = block.logic_subset('r').pop()
+        self.assertEqual(block.logic_subset('&r'), {and_net, reg_net})
+
+        block.remove_wirevector(b)
+        block.remove_net(and_net)
+        self.assertEqual(block.wirevector_subset(pyrtl.Input), {a})
+        self.assertEqual(block.logic_subset('&'), set())
+        block.logic.clear()
+        self.assertEqual(block.logic_subset('r'), set())
+
     def test_sanity_check(self):
         pass
 
@@ -85,6 +122,160 @@ class TestBlock(unittest.TestCase):
         for net in block.logic:
             print(net)
 
+    def test_block_levels(self):
+        a = pyrtl.Input(bitwidth=2)
+        b = pyrtl.Input(bitwidth=2)
+        r = pyrtl.Register(bitwidth=2)
+        o = pyrtl.Output()
+        c = a & b
+        d = c | r
+        r.next <<= d
+        o <<= d
+
+        block = pyrtl.working_block()
+        levels = block.levels()
+        self.assertEqual(sum(len(level) for level in levels), len(block.logic))
+        src_dict = block.net_connections()[0]
+        self.assertEqual(block.net_level(src_dict[c]), 0)
+        self.assertEqual(block.net_level(src_dict[d]), 1)
+        self.assertEqual(block.net_level(src_dict[o]), 2)
+        self.assertEqual(block.net_level(src_dict[r]), 2)
+        self.assertEqual(list(block), [net for level in levels for net in level])
+
+        self.assertIs(block.levels(), levels)  # cached until the logic changes
+        e = ~a
+        self.assertIsNot(block.levels(), levels)
+        self.assertIs(block.levels(), block.levels())
+
+    def test_pickle_and_deepcopy_keep_indexes(self):
+        a = pyrtl.Input(4, 'a')
+        o = pyrtl.Output(4, 'o')
+        o <<= a & 5
+        block = pyrtl.working_block()
+        block.structural_hashing = True
+        for copied in (pickle.loads(pickle.dumps(block)), copy.deepcopy(block)):
+            a2 = copied.get_wirevector_by_name('a')
+            and_wire = copied.net_connections()[0][copied.get_wirevector_by_name('o')].args[0]
+            o2 = pyrtl.Output(4, 'o2', block=copied)
+            with pyrtl.set_working_block(copied, no_sanity_check=True):
+                o2 <<= ~a2
+                self.assertIs(a2 & 5, and_wire)  # found by structural hashing
+            copied.sanity_check()
+            self.assertEqual(len(copied.logic_subset('~')), 1)
+            src_dict, dst_dict = copied.net_connections()
+            self.assertEqual(src_dict[o2].op, 'w')
+            self.assertEqual([net.op for net in dst_dict[a2]], ['&', '~'])
+            self.assertEqual(len(copied.wirevector_subset(pyrtl.Output)), 2)
+
+
+class TestBulkBuild(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+
+    def test_bulk_build_same_result(self):
+        a = pyrtl.Input(8, 'a')
+        b = pyrtl.Input(8, 'b')
+        o = pyrtl.Output(9, 'o')
+        block = pyrtl.working_block()
+        with block.bulk_build():
+            o <<= a + b
+            self.assertTrue(len(block._unchecked_nets) > 0)
+        self.assertEqual(block._unchecked_nets, [])
+        block.sanity_check()
+        sim = pyrtl.Simulation(tracer=None)
+        sim.step({'a': 200, 'b': 100})
+        self.assertEqual(sim.inspect('o'), 300)
+
+    def test_bulk_build_deferred_error(self):
+        a = pyrtl.Input(2, 'a')
+        o = pyrtl.Output(2, 'o')
+        block = pyrtl.working_block()
+        other_block = pyrtl.Block()
+        bad = pyrtl.WireVector(2, 'bad', block=other_block)
+        with self.assertRaisesRegexp(pyrtl.PyrtlInternalError, "different block"):
+            with block.bulk_build():
+                block.add_net(pyrtl.LogicNet('&', None, (a, bad), (o,)))
+        self.assertEqual(block._bulk_build_depth, 0)
+
+    def test_bulk_build_nested(self):
+        a = pyrtl.Input(2, 'a')
+        o = pyrtl.Output(2, 'o')
+        block = pyrtl.working_block()
+        with block.bulk_build():
+            with block.bulk_build():
+                o <<= ~a
+            self.assertEqual(len(block._unchecked_nets), 2)  # the "~" and the "w"
+        self.assertEqual(block._unchecked_nets, [])
+
+    def test_bulk_build_still_checks_net_type(self):
+        with self.assertRaisesRegexp(pyrtl.PyrtlInternalError, "must be of type LogicNet"):
+            with pyrtl.working_block().bulk_build():
+                pyrtl.working_block().add_net(None)
+
+
+class TestStructuralHashing(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+
+    def test_off_by_default(self):
+        a = pyrtl.Input(4, 'a')
+        self.assertFalse(pyrtl.working_block().structural_hashing)
+        self.assertIsNot(a[0], a[0])
+
+    def test_reuses_equivalent_nets(self):
+        a = pyrtl.Input(4, 'a')
+        b = pyrtl.Input(4, 'b')
+        block = pyrtl.working_block()
+        block.structural_hashing = True
+        self.assertIs(a & b, b & a)
+        self.assertIs(a[1:3], a[1:3])
+        self.assertIs(~a, ~a)
+        self.assertIs(pyrtl.concat(a, b), pyrtl.concat(a, b))
+        self.assertIs(pyrtl.select(a[0], a, b), pyrtl.select(a[0], a, b))
+        self.assertIsNot(a - b, b - a)
+        self.assertIsNot(a[0], a[1])
+        self.assertEqual(len(block.logic), 9)
+
+    def test_enabled_on_existing_block(self):
+        a = pyrtl.Input(4, 'a')
+        b = pyrtl.Input(4, 'b')
+        s = a + b
+        block = pyrtl.working_block()
+        block.structural_hashing = True
+        self.assertIs(a + b, s)
+        block.structural_hashing = False
+        self.assertIsNot(a + b, s)
+
+    def test_removed_nets_not_reused(self):
+        a = pyrtl.Input(4, 'a')
+        block = pyrtl.working_block()
+        block.structural_hashing = True
+        inv = ~a
+        net = block.logic_subset('~').pop()
+        block.remove_net(net)
+        block.remove_wirevector(inv)
+        self.assertIsNot(~a, inv)
+
+    def test_removed_net_replaced_by_equivalent(self):
+        a = pyrtl.Input(4, 'a')
+        first, second = ~a, ~a  # built before structural hashing was on
+        block = pyrtl.working_block()
+        block.structural_hashing = True
+        self.assertIs(~a, first)
+        block.remove_net(block.net_connections()[0][first])
+        block.remove_wirevector(first)
+        self.assertIs(~a, second)
+        self.assertEqual(len(block.logic), 1)
+
+    def test_outputs_and_registers_not_reused(self):
+        a = pyrtl.Input(4, 'a')
+        o = pyrtl.Output(4, 'o')
+        block = pyrtl.working_block()
+        block.structural_hashing = True
+        block.add_net(pyrtl.LogicNet('~', None, (a,), (o,)))
+        self.assertIsNot(~a, o)
+        block.sanity_check()
+
 
 class TestSanityCheckNet(unittest.TestCase):
     def setUp(self):
@@ -313,6 +504,52 @@ class TestSetWorkingBlock(unittest.TestCase):
         self.assertEqual(pyrtl.working_block(), self.block_a)
 
 
+    def test_working_block_is_per_thread(self):
+        import threading
+        pyrtl.set_working_block(self.block_a)
+        seen = []
+
+        def worker():
+            seen.append(pyrtl.working_block())
+            pyrtl.set_working_block(self.block_b)
+            seen.append(pyrtl.working_block())
+
+        t = threading.Thread(target=worker)
+        t.start()
+        t.join()
+        self.assertIsNot(seen[0], self.block_a)
+        self.assertIs(seen[1], self.block_b)
+        self.assertIs(pyrtl.working_block(), self.block_a)
+
+    def test_parallel_elaboration(self):
+        import threading
+        results = {}
+
+        def build(width):
+            a = pyrtl.Input(width, 'a')
+            o = pyrtl.Output(width + 1, 'o')
+            with pyrtl.conditional_assignment:
+                with a == 0:
+                    o |= 1
+                with pyrtl.otherwise:
+                    o |= a + 1
+            block = pyrtl.working_block()
+            block.sanity_check()
+            sim = pyrtl.Simulation()
+            sim.step({'a': 2 ** width - 1})
+            results[width] = (block, sim.inspect('o'))
+
+        threads = [threading.Thread(target=build, args=(w,)) for w in range(1, 9)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(set(block for block, _ in results.values())), 8)
+        for width, (block, out) in results.items():
+            self.assertEqual(out, 2 ** width)
+            self.assertEqual(block.get_wirevector_by_name('a').bitwidth, width)
+
+
 class TestAsGraph(unittest.TestCase):
     def setUp(self):
         pyrtl.reset_working_block()
@@ -424,6 +661,45 @@ class TestAsGraph(unittest.TestCase):
         src_g, dst_g = b.net_connections(True)
         self.check_graph_correctness(src_g, dst_g, True)
 
+    def test_as_graph_tracks_changes(self):
+        a = pyrtl.Input(2)
+        b = pyrtl.Input(2)
+        o = pyrtl.Output()
+        c = a & b
+        o <<= ~c
+
+        block = pyrtl.working_block()
+        src_g, dst_g = block.net_connections()
+        and_net = src_g[c]
+        block.remove_net(and_net)
+        self.assertNotIn(c, src_g)
+        self.assertNotIn(a, dst_g)
+
+        or_net = pyrtl.LogicNet('|', None, (a, b), (c,))
+        block.add_net(or_net)
+        self.assertIs(src_g[c], or_net)
+        self.assertEqual(dst_g[b], [or_net])
+        self.check_graph_correctness(src_g, dst_g)
+
+        block.logic.discard(or_net)
+        self.assertNotIn(c, src_g)
+        block.logic = set(block.logic) | {and_net}
+        self.assertIs(block.net_connections()[0][c], and_net)
+        self.check_graph_correctness(*block.net_connections())
+
+    def test_as_graph_multiple_drivers(self):
+        a = pyrtl.Input(1)
+        b = pyrtl.Input(1)
+        w = pyrtl.WireVector(1)
+        w <<= a
+        w <<= b
+        block = pyrtl.working_block()
+        with self.assertRaisesRegexp(pyrtl.PyrtlError, "multiple drivers"):
+            block.net_connections()
+        block.remove_net(pyrtl.LogicNet('w', None, (a,), (w,)))
+        src_g, dst_g = block.net_connections()
+        self.assertIs(src_g[w].args[0], b)
+
 
 class TestSanityCheck(unittest.TestCase):
     def setUp(self):
@@ -463,6 +739,54 @@ class TestSanityCheck(unittest.TestCase):
         out <<= w
         self.sanity_error("used but never driven")
 
+    def build_checked_chain(self):
+        inp = pyrtl.Input(8, 'inp')
+        w = inp
+        for i in range(20):
+            w = ~w
+        out = pyrtl.Output(8, 'out')
+        out <<= w
+        pyrtl.working_block().sanity_check()
+        return inp, out
+
+    def test_incremental_skips_unchanged(self):
+        self.build_checked_chain()
+        block = pyrtl.working_block()
+        full_checks = []
+        block._sanity_check_all = lambda: full_checks.append(1)
+        block.sanity_check()
+        x = pyrtl.Input(8, 'x')
+        y = pyrtl.Output(8, 'y')
+        y <<= x
+        block.sanity_check()
+        self.assertEqual(full_checks, [])
+        self.assertEqual(block._dirty_nets, set())
+
+    def test_incremental_duplicate_names(self):
+        self.build_checked_chain()
+        w = pyrtl.WireVector(8)
+        w <<= pyrtl.working_block().get_wirevector_by_name('inp')
+        w.name = 'out'
+        self.sanity_error("Duplicate wire names")
+
+    def test_incremental_not_driven(self):
+        inp, out = self.build_checked_chain()
+        block = pyrtl.working_block()
+        block.remove_net(block.net_connections()[1][inp][0])
+        self.sanity_error("used but never driven")
+
+    def test_incremental_unknown_wires(self):
+        inp, out = self.build_checked_chain()
+        pyrtl.working_block().wirevector_set.discard(inp)
+        with self.assertRaises(pyrtl.PyrtlInternalError):  # sanity_check_net()
+            self.sanity_error("Unknown wires")
+
+    def test_incremental_legal_ops_changed(self):
+        self.build_checked_chain()
+        pyrtl.working_block().legal_ops = set('w')
+        with self.assertRaises(pyrtl.PyrtlInternalError):
+            pyrtl.working_block().sanity_check()
+
 
 class TestLogicNets(unittest.TestCase):
     def setUp(self):
@@ -0,0 +1,94 @@
+import unittest
+import io
+import sys
+import threading
+import six
+import pyrtl
+from pyrtl.analysis import ElaborationProfiler
+from pyrtl.rtllib import adders
+
+
+class TestElaborationProfiler(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+
+    def build_adders(self):
+        a, b = pyrtl.Input(8, 'a'), pyrtl.Input(8, 'b')
+        with ElaborationProfiler() as prof:
+            s = pyrtl.Output(9, 's')
+            s <<= adders.kogge_stone(a, b)
+            t = a & b
+        return prof
+
+    def test_counts_match_block(self):
+        prof = self.build_adders()
+        block = pyrtl.working_block()
+        rows = prof.report()
+        self.assertEqual(sum(row[1] for row in rows), len(block.logic))
+        self.assertEqual(sum(row[3] for row in rows), len(block.wirevector_set) - 2)
+        # every net is attributed to a line of this file
+        self.assertTrue(all(row[0].startswith(__name__) for row in rows))
+        self.assertEqual(rows, sorted(rows, key=lambda row: -row[1]))
+
+    def test_generator_report(self):
+        prof = self.build_adders()
+        names = [row[0] for row in prof.report(by='generator', sort_by='bits')]
+        self.assertIn('pyrtl.rtllib.adders.kogge_stone', names)
+        self.assertIn('(none)', names)
+        with self.assertRaises(pyrtl.PyrtlError):
+            prof.report(by='file')
+        with self.assertRaises(pyrtl.PyrtlError):
+            prof.report(sort_by='area')
+
+    def test_collapsed_stacks(self):
+        prof = self.build_adders()
+        with io.StringIO() as f:
+            prof.output_collapsed_stacks(f)
+            lines = f.getvalue().splitlines()
+        total = 0
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            self.assertTrue(stack.startswith(__name__ + ':build_adders:'))
+            total += int(count)
+        self.assertEqual(total, len(pyrtl.working_block().logic))
+        self.assertTrue(any(';pyrtl.rtllib.adders:kogge_stone:' in line for line in lines))
+
+    def test_only_one_profiler(self):
+        with ElaborationProfiler():
+            with self.assertRaises(pyrtl.PyrtlError):
+                with ElaborationProfiler():
+                    pass
+        with ElaborationProfiler() as prof:
+            pass
+        self.assertEqual(prof.report(), [])
+
+    def test_profiler_per_thread(self):
+        def build_other():
+            with ElaborationProfiler() as other_prof:  # each thread can have its own
+                a = pyrtl.Input(8, 'a')
+                o = pyrtl.Output(8, 'o')
+                o <<= ~a
+            results.append(other_prof)
+
+        results = []
+        with ElaborationProfiler() as prof:
+            thread = threading.Thread(target=build_other)
+            thread.start()
+            thread.join()
+            pyrtl.Input(1, 'x')
+        self.assertEqual([row[1:4] for row in prof.report()], [(0, 0, 1)])
+        self.assertEqual(sum(row[1] for row in results[0].report()), 2)
+
+    def test_print_report_to_current_stdout(self):
+        prof = self.build_adders()
+        stdout = sys.stdout
+        sys.stdout = out = six.StringIO()
+        try:
+            prof.print_report(limit=1)
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -110,6 +110,24 @@ class TestTimingEstimate(unittest.TestCase):
         self.assertEqual(timing.max_freq(), 610.2770657878676)
         self.assertEquals(timing.max_length(), 1255.6000000000001)
 
+    def test_time_est_instance(self):
+        inv_and = pyrtl.Module('inv_and')
+        with inv_and.definition():
+            a, b = pyrtl.Input(4, 'a'), pyrtl.Input(4, 'b')
+            o = pyrtl.Output(4, 'o')
+            o <<= ~a & b
+        x, y = pyrtl.Input(4, 'x'), pyrtl.Input(4, 'y')
+        out = pyrtl.Output(4, 'out')
+        out <<= inv_and.instantiate({'a': x, 'b': y})['o'] ^ x
+        timing = estimate.TimingAnalysis()
+        self.assertEqual(timing.timing_map[out], 48.5 + 98.5 + 135.07)
+        paths = timing.critical_path(print_cp=False)
+        self.assertEqual({first for first, path in paths}, {x, y})
+        self.assertTrue(all(path[0].op == 'h' for first, path in paths))
+        pyrtl.flatten()
+        self.assertEqual(estimate.TimingAnalysis().max_length(), timing.max_length())
+
+
 class TestYosysInterface(unittest.TestCase):
 
     def setUp(self):
@@ -0,0 +1,161 @@
+import unittest
+import random
+import io
+import os
+import tempfile
+import pyrtl
+
+
+class TestFrozenBlock(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+
+    def build_counter_with_mem(self):
+        a = pyrtl.Input(4, 'a')
+        o = pyrtl.Output(4, 'o')
+        r = pyrtl.Register(4, 'r')
+        mem = pyrtl.MemBlock(bitwidth=4, addrwidth=4, name='mem')
+        r.next <<= r + 1
+        mem[r] <<= a
+        o <<= mem[r] ^ a[::-1]
+        return a, o, r, mem
+
+    def test_frozen_layout(self):
+        a = pyrtl.Input(3, 'a')
+        b = pyrtl.Input(3, 'b')
+        o = pyrtl.Output(3, 'o')
+        o <<= a & b
+        block = pyrtl.working_block()
+        frozen = pyrtl.FrozenBlock()
+
+        self.assertEqual(len(frozen), len(block.logic))
+        self.assertEqual(frozen.num_wires, len(block.wirevector_set))
+        and_net = [i for i in range(len(frozen)) if frozen.op(i) == '&'][0]
+        self.assertEqual([frozen.wire_names[w] for w in frozen.args(and_net)], ['a', 'b'])
+        out_id = frozen.wire_id('o')
+        self.assertIs(frozen.wire_class(out_id), pyrtl.Output)
+        self.assertEqual(frozen.wire_bitwidths[out_id], 3)
+        self.assertIsNone(frozen.wire_id('not_a_wire'))
+
+    def test_net_order_is_insertion_order(self):
+        a = pyrtl.Input(3, 'a')
+        w = a
+        for i in range(20):
+            w = ~w
+        ops = [op for op, param, args, dests in pyrtl.FrozenBlock().nets()]
+        self.assertEqual(ops, ['~'] * 20)
+        frozen = pyrtl.FrozenBlock()
+        self.assertEqual([frozen.args(i)[0] for i in range(1, 20)],
+                         [frozen.dests(i)[0] for i in range(19)])
+
+    def test_round_trip_simulates_the_same(self):
+        self.build_counter_with_mem()
+        block = pyrtl.working_block()
+        new_block = pyrtl.FrozenBlock(block).to_block()
+        self.assertIsNot(new_block, block)
+        self.assertEqual(len(new_block.logic), len(block.logic))
+        self.assertEqual(set(w.name for w in new_block.wirevector_set),
+                         set(w.name for w in block.wirevector_set))
+        new_block.sanity_check()
+
+        vals = {'a': [random.randrange(16) for _ in range(20)]}
+        traces = []
+        for b in (block, new_block):
+            sim_trace = pyrtl.SimulationTrace(block=b)
+            sim = pyrtl.Simulation(tracer=sim_trace, block=b)
+            for cycle in range(20):
+                sim.step({'a': vals['a'][cycle]})
+            traces.append(sim_trace.trace['o'])
+        self.assertEqual(traces[0], traces[1])
+
+    def test_round_trip_post_synth(self):
+        a, o, r, mem = self.build_counter_with_mem()
+        synth_block = pyrtl.synthesize()
+        frozen = pyrtl.FrozenBlock(synth_block)
+        new_block = frozen.to_block()
+        self.assertIsInstance(new_block, pyrtl.PostSynthBlock)
+        (orig_mem, synth_mem), = synth_block.mem_map.items()
+        self.assertEqual(new_block.mem_map[orig_mem].id, synth_mem.id)
+        self.assertIsNot(new_block.mem_map[orig_mem], synth_mem)
+        new_block.sanity_check()
+
+
+class TestSaveLoadBlock(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        fd, self.filename = tempfile.mkstemp(suffix='.pyrtlblock')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def sim_outputs(self, block, inputs):
+        sim_trace = pyrtl.SimulationTrace(block=block)
+        sim = pyrtl.Simulation(tracer=sim_trace, block=block)
+        for cycle in range(len(inputs)):
+            sim.step({'a': inputs[cycle]})
+        return sim_trace.trace['o']
+
+    def test_save_load_round_trip(self):
+        a = pyrtl.Input(4, 'a')
+        o = pyrtl.Output(8, 'o')
+        r = pyrtl.Register(4, 'r')
+        mem = pyrtl.MemBlock(bitwidth=4, addrwidth=4, name='mem')
+        rom = pyrtl.RomBlock(bitwidth=4, addrwidth=4, romdata=lambda x: 15 - x, name='rom')
+        r.next <<= r + 1
+        mem[r] <<= a
+        o <<= pyrtl.concat(mem[r], rom[r]) + 1000
+        block = pyrtl.working_block()
+
+        pyrtl.save_block(self.filename)
+        new_block = pyrtl.load_block(self.filename)
+        self.assertIs(pyrtl.working_block(), block)
+        self.assertEqual(len(new_block.logic), len(block.logic))
+        self.assertEqual(set(w.name for w in new_block.wirevector_set),
+                         set(w.name for w in block.wirevector_set))
+        new_block.sanity_check()
+        inputs = [random.randrange(16) for _ in range(20)]
+        self.assertEqual(self.sim_outputs(new_block, inputs), self.sim_outputs(block, inputs))
+
+    def test_load_frozen_is_mapped(self):
+        a = pyrtl.Input(4, 'a')
+        o = pyrtl.Output(4, 'o')
+        o <<= ~a
+        pyrtl.save_block(self.filename)
+        frozen = pyrtl.load_block(self.filename, frozen=True)
+        self.assertIsInstance(frozen, pyrtl.FrozenBlock)
+        self.assertIsInstance(frozen.arg_ids, memoryview)
+        self.assertEqual(list(frozen.nets()), list(pyrtl.FrozenBlock().nets()))
+        self.assertEqual(frozen.wire_names, pyrtl.FrozenBlock().wire_names)
+
+    def test_save_load_post_synth(self):
+        a = pyrtl.Input(4, 'a')
+        o = pyrtl.Output(4, 'o')
+        r = pyrtl.Register(4, 'r')
+        mem = pyrtl.MemBlock(bitwidth=4, addrwidth=4, name='mem')
+        r.next <<= r + 1
+        mem[r] <<= a
+        o <<= mem[r]
+        synth_block = pyrtl.synthesize()
+
+        f = io.BytesIO()
+        pyrtl.save_block(f, synth_block)
+        f.seek(0)
+        new_block = pyrtl.load_block(f)
+        self.assertIsInstance(new_block, pyrtl.PostSynthBlock)
+        self.assertEqual(sorted(w.name for w in new_block.io_map),
+                         sorted(w.name for w in synth_block.io_map))
+        (orig_mem, new_mem), = new_block.mem_map.items()
+        self.assertEqual(orig_mem.name, 'mem')
+        self.assertEqual(new_mem.id, list(synth_block.mem_map.values())[0].id)
+        new_block.sanity_check()
+
+    def test_load_not_a_block(self):
+        with open(self.filename, 'wb') as f:
+            f.write(b'module foo; endmodule')
+        with self.assertRaisesRegexp(pyrtl.PyrtlError, "not a saved PyRTL block"):
+            pyrtl.load_block(self.filename)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -455,6 +455,32 @@ class TestRtlAssert(unittest.TestCase):
         with self.assertRaises(self.RTLSampleException):
             sim.step({i: 0})
 
+    def test_many_asserts_fastsimulation(self):
+        i = pyrtl.Input(4, 'i')
+        for n in range(12):
+            pyrtl.rtl_assert(i != n, self.RTLSampleException('i is %d' % n))
+
+        sim = pyrtl.FastSimulation()
+        sim.step({i: 15})
+        with self.assertRaises(self.RTLSampleException) as context:
+            sim.run({i: [13, 14, 7, 12]})
+        self.assertEqual(str(context.exception), 'i is 7')
+        self.assertEqual(sim.tracer.trace['i'], [15, 13, 14, 7])
+
+    def test_assert_compiledsimulation(self):
+        i = pyrtl.Input(2, 'i')
+        pyrtl.rtl_assert(i != 3, self.RTLSampleException('test assertion failed'))
+        pyrtl.rtl_assert(i != 2, pyrtl.PyrtlError('i is 2'))
+
+        sim = pyrtl.CompiledSimulation()
+        sim.run([{i: 0}, {i: 1}])
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run([{i: 1}, {i: 2}, {i: 0}, {i: 3}])
+        self.assertEqual(sim.tracer.trace['i'], [0, 1, 1, 2])
+        with self.assertRaises(self.RTLSampleException):
+            sim.step({i: 3})
+        sim.step({i: 1})
+
 
 class TestLoopDetection(unittest.TestCase):
     def setUp(self):
@@ -531,6 +557,30 @@ class TestLoopDetection(unittest.TestCase):
 
         self.assert_no_loop()
 
+    def test_finds_every_loop(self):
+        a = pyrtl.Input(1)
+        w1, w2, w3 = pyrtl.WireVector(1), pyrtl.WireVector(1), pyrtl.WireVector(1)
+        w1 <<= ~w1
+        w2 <<= a & w3
+        w3 <<= ~w2
+        r = pyrtl.Register(1)
+        r.next <<= ~r  # not a combinational loop
+        loops = pyrtl.find_loops()
+        self.assertEqual(sorted(len(loop) for loop in loops), [2, 4])
+        self.assertEqual(set(net.op for loop in loops for net in loop), {'~', '&', 'w'})
+
+    def test_long_chain_loop(self):
+        start = pyrtl.WireVector(1)
+        w = start
+        for _ in range(5000):
+            w = ~w
+        start <<= w
+        loops = pyrtl.find_loops()
+        self.assertEqual(len(loops), 1)
+        self.assertEqual(len(loops[0]), 5001)
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.working_block().levels()
+
     def test_edge_case_1(self):
         in_1 = pyrtl.Input(10)
         in_2 = pyrtl.Input(9)
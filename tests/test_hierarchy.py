@@ -0,0 +1,185 @@
+import unittest
+import random
+import io
+import pyrtl
+
+
+class TestModule(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+
+        # an accumulator: o is the sum of all of the values of a so far (including a)
+        self.acc = pyrtl.Module('acc')
+        with self.acc.definition():
+            a = pyrtl.Input(4, 'a')
+            o = pyrtl.Output(8, 'o')
+            total = pyrtl.Register(8, 'total')
+            mem = pyrtl.MemBlock(bitwidth=8, addrwidth=2, name='mem')
+            s = (total + a)[:8]
+            total.next <<= s
+            mem[0] <<= s
+            o <<= mem[0] + a
+
+    def build_top(self):
+        x = pyrtl.Input(4, 'x')
+        y = pyrtl.Input(4, 'y')
+        ox = pyrtl.Output(8, 'ox')
+        oy = pyrtl.Output(8, 'oy')
+        ox <<= self.acc.instantiate({'a': x}, name='u0')['o']
+        oy <<= self.acc.instantiate({'a': y})['o']
+
+    def sim_trace(self, sim_class, inputs):
+        sim_trace = pyrtl.SimulationTrace()
+        sim = sim_class(tracer=sim_trace)
+        for x, y in inputs:
+            sim.step({'x': x, 'y': y})
+        return sim_trace.trace
+
+    def test_instance_is_one_net(self):
+        self.build_top()
+        block = pyrtl.working_block()
+        self.assertEqual(len(block.logic_subset('h')), 2)
+        self.assertEqual(len(block.logic), 4)
+        block.sanity_check()
+        net = block.logic_subset('h').pop()
+        self.assertIs(net.op_param[1], self.acc)
+        self.assertIn('h', str(net))
+
+    def test_simulations_match_flattened(self):
+        self.build_top()
+        inputs = [(random.randrange(16), random.randrange(16)) for _ in range(20)]
+        sim_trace = self.sim_trace(pyrtl.Simulation, inputs)
+        fastsim_trace = self.sim_trace(pyrtl.FastSimulation, inputs)
+
+        pyrtl.flatten()
+        block = pyrtl.working_block()
+        self.assertEqual(len(block.logic_subset('h')), 0)
+        self.assertIsNotNone(block.get_wirevector_by_name('u0_total'))
+        block.sanity_check()
+        flat_trace = self.sim_trace(pyrtl.Simulation, inputs)
+
+        for name in ('ox', 'oy'):
+            self.assertEqual(sim_trace[name], flat_trace[name])
+            self.assertEqual(fastsim_trace[name], flat_trace[name])
+        # the instances do not share registers or memories
+        self.assertNotEqual(sim_trace['ox'], sim_trace['oy'])
+
+    def test_checkpoint_restores_instances(self):
+        self.build_top()
+        for sim_class in (pyrtl.Simulation, pyrtl.FastSimulation):
+            sim = sim_class()
+            for x in range(5):
+                sim.step({'x': x, 'y': 1})
+            checkpoint = sim.checkpoint()
+            fork = sim.fork()
+            runs = []
+            for run_sim in (sim, fork, sim):
+                run_sim.step({'x': 3, 'y': 2})
+                runs.append((run_sim.inspect('ox'), run_sim.inspect('oy')))
+                sim.restore(checkpoint)
+            self.assertEqual(runs[0], runs[1])
+            self.assertEqual(runs[0], runs[2])
+
+    def test_nested_modules(self):
+        pair = pyrtl.Module('pair')
+        with pair.definition():
+            a = pyrtl.Input(4, 'a')
+            b = pyrtl.Input(4, 'b')
+            o = pyrtl.Output(9, 'o')
+            o <<= (self.acc.instantiate({'a': a})['o'] +
+                   self.acc.instantiate({'a': b})['o'])
+        x = pyrtl.Input(4, 'x')
+        y = pyrtl.Input(4, 'y')
+        out = pyrtl.Output(9, 'out')
+        out <<= pair.instantiate({'a': x, 'b': y})['o']
+
+        inputs = [(random.randrange(16), random.randrange(16)) for _ in range(20)]
+        sim_trace = self.sim_trace(pyrtl.Simulation, inputs)
+        fastsim_trace = self.sim_trace(pyrtl.FastSimulation, inputs)
+        pyrtl.flatten()
+        flat_trace = self.sim_trace(pyrtl.Simulation, inputs)
+        self.assertEqual(sim_trace['out'], flat_trace['out'])
+        self.assertEqual(fastsim_trace['out'], flat_trace['out'])
+
+    def test_assert_in_instances(self):
+        checked = pyrtl.Module('checked')
+        with checked.definition():
+            a = pyrtl.Input(4, 'a')
+            o = pyrtl.Output(4, 'o')
+            r = pyrtl.Register(4, 'r')
+            r.next <<= a
+            o <<= r
+            pyrtl.rtl_assert(a != 5, pyrtl.PyrtlError('a is 5'))
+        x = pyrtl.Input(4, 'x')
+        ox = pyrtl.Output(4, 'ox')
+        oy = pyrtl.Output(4, 'oy')
+        ox <<= checked.instantiate({'a': x})['o']
+        oy <<= checked.instantiate({'a': x})['o']
+        for sim_class in (pyrtl.Simulation, pyrtl.FastSimulation):
+            sim = sim_class()
+            sim.step({'x': 1})
+            with self.assertRaises(pyrtl.PyrtlError):
+                sim.step({'x': 5})
+            self.assertEqual(sim.tracer.trace['x'], [1, 5])  # the failing cycle is traced
+            sim.step({'x': 0})
+            self.assertEqual((sim.inspect('ox'), sim.inspect('oy')), (5, 5))
+
+    def test_verilog_one_module_per_definition(self):
+        self.build_top()
+        with io.StringIO() as vfile:
+            pyrtl.OutputToVerilog(vfile)
+            verilog = vfile.getvalue()
+        self.assertEqual(verilog.count('module acc('), 1)
+        self.assertEqual(verilog.count('module toplevel('), 1)
+        self.assertEqual(verilog.count('    acc '), 2)
+        self.assertLess(verilog.index('module acc('), verilog.index('module toplevel('))
+
+    def test_synthesize_flattens(self):
+        self.build_top()
+        inputs = [(random.randrange(16), random.randrange(16)) for _ in range(10)]
+        sim_trace = self.sim_trace(pyrtl.Simulation, inputs)
+        pyrtl.synthesize()
+        synth_trace = self.sim_trace(pyrtl.Simulation, inputs)
+        self.assertEqual(sim_trace['ox'], synth_trace['ox'])
+
+    def test_flatten_name_clash(self):
+        self.build_top()
+        clash = pyrtl.Output(4, 'u0_total')  # the name of the copy of total in u0
+        clash <<= pyrtl.working_block().get_wirevector_by_name('x')
+        inputs = [(random.randrange(16), random.randrange(16)) for _ in range(10)]
+        sim_trace = self.sim_trace(pyrtl.Simulation, inputs)
+        pyrtl.flatten()
+        block = pyrtl.working_block()
+        block.sanity_check()
+        self.assertIs(block.get_wirevector_by_name('u0_total'), clash)
+        self.assertIsInstance(block.get_wirevector_by_name('u0_total_1'), pyrtl.Register)
+        flat_trace = self.sim_trace(pyrtl.Simulation, inputs)
+        for name in ('ox', 'oy', 'u0_total'):
+            self.assertEqual(sim_trace[name], flat_trace[name])
+
+    def test_bad_instantiations(self):
+        x = pyrtl.Input(4, 'x')
+        with self.assertRaises(pyrtl.PyrtlError):
+            self.acc.instantiate({'b': x})
+        with self.assertRaises(pyrtl.PyrtlError):
+            self.acc.instantiate({})
+        with self.assertRaises(pyrtl.PyrtlError):
+            self.acc.instantiate({'a': pyrtl.Input(5, 'wide')})
+        with self.assertRaises(pyrtl.PyrtlError):
+            self.acc.instantiate({'a': x}, block=self.acc.block)
+        with self.assertRaises(pyrtl.PyrtlError):
+            self.acc.definition()
+
+    def test_narrow_input_zero_extended(self):
+        x = pyrtl.Input(2, 'x')
+        o = pyrtl.Output(8, 'o')
+        o <<= self.acc.instantiate({'a': x})['o']
+        sim = pyrtl.Simulation()
+        sim.step({'x': 3})
+        self.assertEqual(sim.inspect('o'), 3)
+        sim.step({'x': 3})
+        self.assertEqual(sim.inspect('o'), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import pickle
+import random
+import pyrtl
+
+
+class TestSimulationPool(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        a = pyrtl.Input(4, 'a')
+        o = pyrtl.Output(8, 'o')
+        total = pyrtl.Register(8, 'total')
+        mem = pyrtl.MemBlock(4, 2, name='mem')
+        total.next <<= total + a
+        mem[total[:2]] <<= a
+        o <<= total ^ mem[a[:2]]
+        pyrtl.rtl_assert(a != 15, pyrtl.PyrtlError('a is 15'))
+        rand = random.Random(7)
+        self.testbenches = [{'a': [rand.randrange(15) for _ in range(20)]} for _ in range(12)]
+
+    def expected(self, sim_class, testbench):
+        sim = sim_class()
+        for value in testbench['a']:
+            sim.step({'a': value})
+        return sim.tracer.trace['o']
+
+    def test_matches_serial_simulation(self):
+        for sim_class in (pyrtl.Simulation, pyrtl.FastSimulation, pyrtl.CompiledSimulation):
+            with pyrtl.SimulationPool(sim_class(), processes=2) as pool:
+                results = pool.run(self.testbenches, outputs=['o'])
+            self.assertEqual(len(results), len(self.testbenches))
+            for testbench, result in zip(self.testbenches, results):
+                self.assertIsNone(result.error)
+                self.assertEqual(result.outputs['o'], self.expected(sim_class, testbench))
+                self.assertEqual(result.trace['o'], result.outputs['o'])
+
+    def test_starts_from_current_state(self):
+        sim = pyrtl.FastSimulation(tracer=None)
+        sim.step({'a': 5})
+        with pyrtl.SimulationPool(sim, processes=2) as pool:
+            results = pool.run([{'a': [0]}] * 3, outputs=['total'], batch_size=1)
+        self.assertEqual([result.outputs['total'] for result in results], [[5]] * 3)
+        self.assertIsNone(results[0].trace)
+
+    def test_assertion_failure(self):
+        with pyrtl.SimulationPool(pyrtl.Simulation(), processes=2) as pool:
+            results = pool.run([{'a': [1, 2, 15, 3]}, {'a': [1, 2]}], outputs=['o'])
+            with self.assertRaises(pyrtl.PyrtlError):
+                pool.run([{'a': [1, 2, 3], 'b': [1]}])
+        self.assertIsInstance(results[0].error, pyrtl.PyrtlError)
+        self.assertEqual(len(results[0].outputs['o']), 2)
+        self.assertIsNone(results[1].error)
+        with self.assertRaises(pyrtl.PyrtlError):
+            pool.run([{'a': [1]}])
+
+    def test_pickled_simulators(self):
+        for sim_class in (pyrtl.Simulation, pyrtl.FastSimulation, pyrtl.CompiledSimulation):
+            sim = sim_class()
+            for value in (3, 1, 4):
+                sim.step({'a': value})
+            copy = pickle.loads(pickle.dumps(sim, pickle.HIGHEST_PROTOCOL))
+            for s in (sim, copy):
+                s.step({'a': 1})
+            self.assertEqual(copy.tracer.trace['o'], sim.tracer.trace['o'])
+
+
+if __name__ == "__main__":
+    unittest.main()
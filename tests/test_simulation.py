@@ -1,9 +1,17 @@
 import unittest
+import os
+import shutil
+import tempfile
 import six
 
 import pyrtl
 from pyrtl.corecircuits import _basic_add
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 def fastsim_only(sim):
     # Mostly useful for allowing people to search for
@@ -525,6 +533,29 @@ class MemBlockBase(unittest.TestCase):
         # check consistency of memory_value_map assignment, insertion, and modification
         self.assertEquals(sim.inspect_mem(self.mem1), {0: 0, 1: 2, 2: 3, 3: 3, 4: 4, 5: 5})
 
+    def test_dense_and_sparse_memories(self):
+        results = []
+        for dense_memories in (None, [], [self.mem1]):
+            sim_trace = pyrtl.SimulationTrace()
+            sim = self.sim(tracer=sim_trace, memory_value_map={self.mem1: {0: 1, 6: 2}},
+                           dense_memories=dense_memories)
+            for i in range(8):
+                sim.step({self.read_addr1: i, self.read_addr2: 7 - i,
+                          self.write_addr: (3 * i) % 8, self.write_data: i})
+            results.append((dict(sim_trace.trace), sim.inspect_mem(self.mem1)))
+            self.assertEqual(isinstance(sim.inspect_mem(self.mem1), dict), dense_memories == [])
+        for trace, contents in results:
+            self.assertEqual(trace, results[1][0])
+            self.assertEqual(contents, {0: 0, 3: 1, 6: 2, 1: 3, 4: 4, 7: 5, 2: 6, 5: 7})
+
+        contents = results[0][1]
+        del contents[3]
+        self.assertEqual((len(contents), 3 in contents, contents.get(3, 9)), (7, False, 9))
+        copy = contents.copy()
+        copy[3] = 1
+        self.assertEqual(sorted(copy), list(range(8)))
+        self.assertEqual(sorted(contents), [0, 1, 2, 4, 5, 6, 7])
+
     def test_mem_val_map_defaults(self):
         read_addr3 = pyrtl.Input(self.addrwidth)
         self.output3 = pyrtl.Output(self.bitwidth, "o3")
@@ -720,7 +751,7 @@ class InspectBase(unittest.TestCase):
         b <<= a
         sim_trace = pyrtl.SimulationTrace()
         sim = self.sim(tracer=sim_trace)
-        if self.sim is pyrtl.Simulation:
+        if issubclass(self.sim, pyrtl.Simulation):
             self.assertEqual(sim.inspect(a), 0)
             self.assertEqual(sim.inspect(b), 0)
         else:
@@ -764,6 +795,113 @@ class TraceErrorBase(unittest.TestCase):
             self.sim_trace.print_trace(base=4)
 
 
+class RunBase(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        a, b = pyrtl.Input(4, 'a'), pyrtl.Input(4, 'b')
+        acc = pyrtl.Register(8, 'acc')
+        acc.next <<= acc + a
+        o = pyrtl.Output(8, 'o')
+        o <<= acc ^ b
+        self.a_vals = [1, 2, 3, 15, 0, 7]
+        self.b_vals = [0, 5, 5, 5, 9, 1]
+
+    def step_outputs(self):
+        sim = self.sim(tracer=None)
+        result = []
+        for a, b in zip(self.a_vals, self.b_vals):
+            sim.step({'a': a, 'b': b})
+            result.append(sim.inspect('o'))
+        return result
+
+    def test_run(self):
+        sim = self.sim(tracer=None)
+        result = sim.run({'a': self.a_vals, 'b': self.b_vals}, outputs=['o', 'acc'])
+        self.assertEqual(result['o'], self.step_outputs())
+        self.assertEqual(result['acc'][:3], [0, 1, 3])
+        self.assertEqual(sim.run({'a': [1], 'b': [1]}), {})
+
+    @unittest.skipIf(numpy is None, 'requires numpy')
+    def test_run_numpy_columns(self):
+        sim = self.sim(tracer=None)
+        result = sim.run({'a': numpy.array(self.a_vals), 'b': numpy.array(self.b_vals)},
+                         outputs=['o'])
+        self.assertEqual(result['o'], self.step_outputs())
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run({'a': numpy.array([1, 16]), 'b': numpy.array([1, 1])})
+
+    def test_run_stream(self):
+        sim = self.sim(tracer=None)
+        rows = ((b, a) for a, b in zip(self.a_vals, self.b_vals))
+        stream = sim.run_stream(rows, inputs=['b', 'a'], outputs=['o'])
+        self.assertEqual([o for (o,) in stream], self.step_outputs())
+
+    def test_run_traced(self):
+        sim_trace = pyrtl.SimulationTrace()
+        sim = self.sim(tracer=sim_trace)
+        sim.run({'a': self.a_vals, 'b': self.b_vals})
+        self.assertEqual(sim_trace.trace['o'], self.step_outputs())
+
+    def test_run_bad_inputs(self):
+        sim = self.sim(tracer=None)
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run({'a': [1, 2], 'b': [1]})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run({'a': [1, 16], 'b': [1, 1]})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run({'a': [1, -1], 'b': [1, 1]})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run({'a': [1]})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run({'a': [1], 'b': [1], 'o': [1]})
+        with self.assertRaises(pyrtl.PyrtlError):
+            list(sim.run_stream([(1, 2, 3)]))
+        with self.assertRaises(pyrtl.PyrtlError):
+            list(sim.run_stream([(1, 2), (1, 20)]))
+
+
+class CheckpointBase(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        a = pyrtl.Input(4, 'a')
+        o = pyrtl.Output(8, 'o')
+        count = pyrtl.Register(4, 'count')
+        count.next <<= count + 1
+        mem = pyrtl.MemBlock(4, 4, name='mem')
+        mem[count] <<= a
+        o <<= pyrtl.concat(mem[a], count)
+
+    def run_sim(self, sim, values):
+        for value in values:
+            sim.step({'a': value})
+        return sim.tracer.trace['o'][-len(values):]
+
+    def test_restore(self):
+        sim = self.sim()
+        self.run_sim(sim, [3, 1, 4, 1, 5, 9])
+        checkpoint = sim.checkpoint()
+        first = self.run_sim(sim, [2, 6, 5, 3, 5])
+        sim.restore(checkpoint)
+        self.assertNotEqual(self.run_sim(sim, [1, 1, 1, 1, 1]), first)
+        sim.restore(checkpoint)
+        self.assertEqual(self.run_sim(sim, [2, 6, 5, 3, 5]), first)
+
+    def test_fork(self):
+        sim = self.sim()
+        self.run_sim(sim, [3, 1, 4, 1, 5, 9])
+        fork = sim.fork()
+        forked = self.run_sim(fork, [2, 6, 5, 3, 5])
+        self.assertEqual(len(fork.tracer), 5)
+        self.run_sim(fork, [7, 7, 7])
+        self.assertEqual(self.run_sim(sim, [2, 6, 5, 3, 5]), forked)
+
+    def test_restore_other_block(self):
+        checkpoint = self.sim().checkpoint()
+        self.setUp()
+        with self.assertRaises(pyrtl.PyrtlError):
+            self.sim().restore(checkpoint)
+
+
 def make_unittests():
     """
     Generates separate unittests for each of the simulators
@@ -786,10 +924,120 @@ def make_unittests():
             unittests[unit_name] = type(unit_name, (v,), {'sim': sim})
     g.update(unittests)
 
+
+class EventDrivenSimulation(pyrtl.Simulation):
+    def __init__(self, *args, **kwargs):
+        kwargs['event_driven'] = True
+        super(EventDrivenSimulation, self).__init__(*args, **kwargs)
+
+
 # add compiledsim here if you want to unittest that as well
-sims = (pyrtl.Simulation, pyrtl.FastSimulation)
+sims = (pyrtl.Simulation, pyrtl.FastSimulation, EventDrivenSimulation)
 make_unittests()
 
 
+class TestEventDrivenSimulation(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        import random
+        self.random = random.Random(42)
+
+    def build(self):
+        a, b = pyrtl.Input(4, 'a'), pyrtl.Input(1, 'b')
+        o, m = pyrtl.Output(8, 'o'), pyrtl.Output(4, 'm')
+        count = pyrtl.Register(4, 'count')
+        acc = pyrtl.Register(8, 'acc')
+        mem = pyrtl.MemBlock(4, 2)
+        with pyrtl.conditional_assignment:
+            with b:
+                count.next |= count + 1
+                acc.next |= acc + a
+        mem[count[:2]] <<= pyrtl.MemBlock.EnabledWrite(a, b)
+        m <<= mem[a[:2]]
+        o <<= acc ^ pyrtl.concat(count, a)
+
+    def test_matches_full_evaluation(self):
+        self.build()
+        inputs = [{'a': self.random.choice([3, 3, 3, 9]), 'b': self.random.choice([0, 0, 1])}
+                  for _ in range(50)]
+        traces = []
+        for event_driven in (False, True):
+            sim_trace = pyrtl.SimulationTrace()
+            sim = pyrtl.Simulation(tracer=sim_trace, event_driven=event_driven)
+            for step_inputs in inputs:
+                sim.step(step_inputs)
+            traces.append(sim_trace.trace)
+        for name in ('o', 'm', 'count', 'acc'):
+            self.assertEqual(traces[0][name], traces[1][name])
+
+    def test_evaluates_only_changed_nets(self):
+        self.build()
+        evaluated = []
+        sim = EventDrivenSimulation(tracer=None)
+        execute = sim._execute_program
+        sim._execute_program = lambda program: evaluated.extend(program) or execute(program)
+        sim.step({'a': 1, 'b': 0})
+        self.assertEqual(len(evaluated), len(sim.ordered_nets) - len(sim.reg_update_nets)
+                         - len(sim.mem_update_nets))
+        del evaluated[:]
+        sim.step({'a': 1, 'b': 0})
+        self.assertEqual(evaluated, [])
+        sim.step({'a': 2, 'b': 0})
+        self.assertLess(len(evaluated), len(sim.ordered_nets))
+        self.assertGreater(len(evaluated), 0)
+
+
+class TestFastSimulationCache(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def build(self, temps=0, incr=1):
+        pyrtl.reset_working_block()
+        for _ in range(temps):  # use up some temporary names
+            pyrtl.WireVector(1, block=pyrtl.Block())
+        a = pyrtl.Input(4, 'a')
+        o, m = pyrtl.Output(8, 'o'), pyrtl.Output(4, 'm')
+        count = pyrtl.Register(4, 'count')
+        mem, other = pyrtl.MemBlock(4, 2), pyrtl.MemBlock(4, 2)
+        count.next <<= count + incr
+        mem[count[:2]] <<= a
+        other[count[:2]] <<= ~a
+        m <<= mem[a[:2]] ^ other[a[:2]]
+        o <<= pyrtl.concat(count, a) + (a + 1) + (a + 1)
+
+    def code(self):
+        code_file = os.path.join(self.cache_dir, 'code.py')
+        sim = pyrtl.FastSimulation(code_file=code_file)
+        with open(code_file) as file:
+            return sim._code_hash, file.read()
+
+    def test_code_independent_of_temp_names(self):
+        self.build()
+        code = self.code()
+        self.build(temps=5)
+        self.assertEqual(self.code(), code)
+        self.build(incr=2)
+        self.assertNotEqual(self.code()[0], code[0])
+
+    def test_cached_code_skips_compile(self):
+        self.build()
+        inputs = {'a': [3, 1, 4, 1, 5, 9, 2, 6]}
+        outputs = ['o', 'm', 'count']
+        expected = pyrtl.FastSimulation(cache_dir=self.cache_dir).run(inputs, outputs)
+        self.assertEqual(expected['count'], [0, 1, 2, 3, 4, 5, 6, 7])
+        self.build(temps=3)
+        compiled = pyrtl.FastSimulation._compiled
+        try:
+            pyrtl.FastSimulation._compiled = None  # not called for cached code
+            sim = pyrtl.FastSimulation(cache_dir=self.cache_dir)
+        finally:
+            pyrtl.FastSimulation._compiled = compiled
+        self.assertEqual(sim.run(inputs, outputs), expected)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -50,6 +50,34 @@ class TestWireVector(unittest.TestCase):
         self.assertIn("testJohn", block.wirevector_by_name)
         self.assertIn(w, block.wirevector_set)
 
+    def test_temporary_names_are_lazy(self):
+        block = pyrtl.working_block()
+        w = pyrtl.WireVector(1)
+        self.assertTrue(w.name.startswith('tmp'))
+        self.assertNotIn(w.name, block.wirevector_by_name)
+        self.assertIs(block.get_wirevector_by_name(w.name), w)
+        self.assertIsNone(block.get_wirevector_by_name('tmp0' + w.name[3:]))
+        old_name = w.name
+        w.name = 'named'
+        self.assertIs(block.wirevector_by_name['named'], w)
+        self.assertIsNone(block.get_wirevector_by_name(old_name))
+
+    def test_name_clash_with_temporary(self):
+        w = pyrtl.WireVector(1)
+        w <<= pyrtl.Input(1, 'i')
+        o = pyrtl.Output(1, w.name)
+        o <<= w
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.working_block().sanity_check()
+
+    def test_no_instance_dict(self):
+        wires = [pyrtl.WireVector(1), pyrtl.Input(1), pyrtl.Output(1),
+                 pyrtl.Const(1), pyrtl.Register(1)]
+        for w in wires:
+            self.assertFalse(hasattr(w, '__dict__'))
+        self.assertEqual(wires[3].val, 1)
+        self.assertEqual(wires[0].bitmask, 1)
+
 
 class TestWireVectorNames(unittest.TestCase):
     def is_valid_str(self, s):
@@ -293,6 +321,27 @@ class TestConst(unittest.TestCase):
             c = pyrtl.Const(4)
             c <<= 3
 
+    def test_literals_are_interned(self):
+        a = pyrtl.Input(4, 'a')
+        x, y, z = a + 1, a + 1, a - 1
+        # one Const for the 1, and one for the 0 used to zero extend it
+        consts = pyrtl.working_block().wirevector_subset(pyrtl.Const)
+        self.assertEqual(sorted(c.val for c in consts), [0, 1])
+        b = a & pyrtl.as_wires(1, bitwidth=4)
+        self.assertEqual(len(pyrtl.working_block().wirevector_subset(pyrtl.Const)), 3)
+        # Consts made directly are not shared
+        self.assertIsNot(pyrtl.Const(1), pyrtl.Const(1))
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.as_wires(True, bitwidth=4)
+
+    def test_interned_const_removed_from_block(self):
+        block = pyrtl.working_block()
+        c = pyrtl.as_wires(3)
+        block.remove_wirevector(c)
+        d = pyrtl.as_wires(3)
+        self.assertIsNot(c, d)
+        self.assertIn(d, block.wirevector_set)
+
     def check_const(self, val_in, expected_val, expected_bitwidth, **kargs):
         c = pyrtl.Const(val_in, **kargs)
         self.assertEqual(c.val, expected_val)